@@ -0,0 +1,415 @@
+"""
+Module responsible for planning DHCP address pools: allocating networks of any prefix length from larger blocks,
+excluding gateway and infrastructure addresses, detecting overlaps between the pools of all routers and building
+the DHCP command blocks in bulk.
+Addresses are handled as integers and networks as inclusive integer intervals, kept sorted so that overlap checks
+are binary searches instead of scans over every pool.
+"""
+import ipaddress
+import logging
+from bisect import bisect_left, bisect_right
+from dataclasses import dataclass, field
+
+from Inventory import Inventory
+
+DEFAULT_DNS_SERVERS = ("8.8.8.8",)
+# Longest prefix a DHCP pool can have: /31 and /32 networks have no host addresses to lease
+MAX_POOL_PREFIX = 30
+
+
+def parse_network(network: str, mask: str = None) -> tuple:
+    """
+    Parses an IPv4 network given in CIDR notation (e.g. '10.1.0.0/22') or as an address and a subnet mask.
+
+    :param network: The network address, optionally with its prefix length.
+    :param mask: Optional subnet mask (e.g. '255.255.252.0') or prefix length.
+    :return: A tuple of (first address, prefix length), the address as an integer.
+    :raises: ValueError if the network is invalid or has host bits set.
+    """
+    parsed = ipaddress.IPv4Network(f"{network}/{mask}" if mask is not None else network)
+    return int(parsed.network_address), parsed.prefixlen
+
+
+def to_address(value: int) -> str:
+    return f"{value >> 24}.{value >> 16 & 255}.{value >> 8 & 255}.{value & 255}"
+
+
+def to_cidr(start: int, prefix: int) -> str:
+    return f"{to_address(start)}/{prefix}"
+
+
+def prefix_mask(prefix: int) -> str:
+    """
+    :return: The subnet mask of a prefix length, e.g. 22 -> '255.255.252.0'.
+    """
+    return to_address((0xFFFFFFFF << (32 - prefix)) & 0xFFFFFFFF)
+
+
+def block_size(prefix: int) -> int:
+    return 1 << (32 - prefix)
+
+
+class IntervalSet:
+    """
+    A class holding disjoint inclusive integer intervals, each with an owner, in sorted order.
+    Lookups and insertions are binary searches.
+    """
+
+    def __init__(self):
+        self._starts = []
+        self._ends = []
+        self._owners = []
+
+    def __len__(self) -> int:
+        return len(self._starts)
+
+    def __iter__(self):
+        return iter(zip(self._starts, self._ends, self._owners))
+
+    def find(self, start: int, end: int) -> list:
+        """
+        :param start: First value of the interval.
+        :param end: Last value of the interval.
+        :return: The (start, end, owner) intervals overlapping it, in order.
+        """
+        found = []
+        # Intervals are disjoint, so their ends are sorted too: walk back from the last one starting in range
+        index = bisect_right(self._starts, end) - 1
+        while index >= 0 and self._ends[index] >= start:
+            found.append((self._starts[index], self._ends[index], self._owners[index]))
+            index -= 1
+        return found[::-1]
+
+    def add(self, start: int, end: int, owner) -> None:
+        """
+        Adds an interval.
+
+        :raises: ValueError if it overlaps an interval already in the set.
+        """
+        overlapping = self.find(start, end)
+        if overlapping:
+            owners = ", ".join(str(owner) for _, _, owner in overlapping)
+            raise ValueError(f"{to_address(start)}-{to_address(end)} overlaps {owners}.")
+        index = bisect_left(self._starts, start)
+        self._starts.insert(index, start)
+        self._ends.insert(index, end)
+        self._owners.insert(index, owner)
+
+    def free_block(self, size: int, low: int, high: int, start: int = None):
+        """
+        Finds the first free block of 'size' values aligned on a multiple of 'size', between 'low' and 'high'.
+
+        :param size: Size of the block, a power of two.
+        :param low: First value the block may start at.
+        :param high: Last value the block may end at.
+        :param start: Optional value the search starts from; it wraps around to 'low' if nothing is free after it.
+        :return: The first value of the block, or None if there is no room left.
+        """
+        passes = [(start, high), (low, min(high, start + size - 1))] if start is not None and start > low \
+            else [(low, high)]
+        for first, last in passes:
+            candidate = (first + size - 1) // size * size
+            index = bisect_left(self._ends, candidate)
+            while candidate + size - 1 <= last:
+                while index < len(self._ends) and self._ends[index] < candidate:
+                    index += 1
+                if index == len(self._starts) or self._starts[index] > candidate + size - 1:
+                    return candidate
+                candidate = (self._ends[index] + size) // size * size
+        return None
+
+
+@dataclass
+class Pool:
+    """
+    A DHCP pool: its network, the addresses excluded from leasing and the options given to clients.
+    """
+    name: str
+    network: int
+    prefix: int
+    gateway: int
+    excluded: list = field(default_factory=list)
+    dns_servers: tuple = DEFAULT_DNS_SERVERS
+    router: str = None
+
+    @property
+    def last(self) -> int:
+        return self.network + block_size(self.prefix) - 1
+
+    @property
+    def cidr(self) -> str:
+        return to_cidr(self.network, self.prefix)
+
+    def leases(self, address: int) -> bool:
+        """
+        :return: True if the address is in the pool and not excluded, so it may be leased to a client.
+        """
+        if not self.network < address < self.last:
+            return False
+        return not any(start <= address <= end for start, end in self.excluded)
+
+    def commands(self) -> str:
+        """
+        Builds the DHCP commands of the pool. Exclusions come first, so no excluded address is leased
+        in between.
+
+        :return: The command block.
+        """
+        commands = "".join(f"ip dhcp excluded-address {to_address(start)} {to_address(end)}\n"
+                           for start, end in self.excluded)
+        commands += (
+            f"ip dhcp pool {self.name}\n"
+            f"network {to_address(self.network)} {prefix_mask(self.prefix)}\n"
+            f"default-router {to_address(self.gateway)}\n"
+        )
+        if self.dns_servers:
+            commands += f"dns-server {' '.join(self.dns_servers)}\n"
+        return commands + "exit\n"
+
+
+def pool_layout(network: int, prefix: int, routers: int = 1, switches: int = 0) -> tuple:
+    """
+    Lays out the infrastructure addresses of a LAN: the gateway and router addresses at the bottom of the network,
+    the switch addresses at the top.
+
+    :param network: First address of the network.
+    :param prefix: Prefix length of the network.
+    :param routers: Number of router addresses excluded after the gateway.
+    :param switches: Number of switch addresses excluded at the top of the network.
+    :return: A tuple of (gateway, excluded ranges as (first, last) address pairs).
+    :raises: ValueError if the network is too small for the pool.
+    """
+    if prefix > MAX_POOL_PREFIX:
+        raise ValueError(f"A DHCP pool needs a prefix of /{MAX_POOL_PREFIX} or shorter. "
+                         f"Received: {to_cidr(network, prefix)}")
+    first_host = network + 1
+    last_host = network + block_size(prefix) - 2
+    routers, switches = int(routers), int(switches)
+    if routers < 0 or switches < 0:
+        raise ValueError("The number of routers and switches can not be negative.")
+    if routers + 1 + switches >= last_host - first_host + 1:
+        raise ValueError(f"{to_cidr(network, prefix)} has no addresses left to lease after excluding "
+                         f"{routers + 1} router and {switches} switch addresses.")
+
+    excluded = [(first_host, first_host + routers)]
+    if switches:
+        excluded.append((last_host - switches + 1, last_host))
+    return first_host, excluded
+
+
+class AddressPlan:
+    """
+    A class allocating DHCP pools without overlaps, across all routers of a plan.
+    """
+
+    def __init__(self, dns_servers=DEFAULT_DNS_SERVERS):
+        """
+        Constructor for AddressPlan.
+
+        :param dns_servers: DNS servers given to clients by pools that do not name their own.
+        """
+        self.dns_servers = tuple(dns_servers or ())
+        self.pools = []
+        self.networks = IntervalSet()
+        # Where the next allocation of a block size starts looking, per parent block
+        self._cursors = {}
+
+    def reserve(self, network: str, owner: str, mask: str = None) -> None:
+        """
+        Marks a network as used without creating a pool, e.g. a transit or management network.
+
+        :param network: The network, see parse_network.
+        :param owner: Description of what uses the network, reported in overlap errors.
+        :param mask: Optional subnet mask.
+        :raises: ValueError if the network is invalid or overlaps a network already in the plan.
+        """
+        start, prefix = parse_network(network, mask)
+        self.networks.add(start, start + block_size(prefix) - 1, owner)
+
+    def conflicts(self, network: str, mask: str = None) -> list:
+        """
+        :param network: The network, see parse_network.
+        :param mask: Optional subnet mask.
+        :return: Descriptions of the networks in the plan overlapping it.
+        """
+        start, prefix = parse_network(network, mask)
+        return [owner for _, _, owner in self.networks.find(start, start + block_size(prefix) - 1)]
+
+    def add_pool(self, network: str, name: str, router: str = None, routers: int = 1, switches: int = 0,
+                 dns_servers=None, mask: str = None) -> Pool:
+        """
+        Adds a pool on a given network.
+
+        :param network: The network, see parse_network.
+        :param name: Name of the pool on the router.
+        :param router: Name of the router serving the pool.
+        :param routers: Number of router addresses excluded after the gateway.
+        :param switches: Number of switch addresses excluded at the top of the network.
+        :param dns_servers: Optional DNS servers of the pool; defaults to the plan's.
+        :param mask: Optional subnet mask.
+        :return: The new Pool.
+        :raises: ValueError if the network is invalid, too small or overlaps a network already in the plan.
+        """
+        start, prefix = parse_network(network, mask)
+        return self._add(start, prefix, name, router, routers, switches, dns_servers)
+
+    def allocate(self, within: str, prefix: int, name: str, router: str = None, routers: int = 1,
+                 switches: int = 0, dns_servers=None) -> Pool:
+        """
+        Adds a pool on the first free network of the given prefix length inside a larger block.
+
+        :param within: The block to allocate from, see parse_network.
+        :param prefix: Prefix length of the new network.
+        :param name: Name of the pool on the router.
+        :param router: Name of the router serving the pool.
+        :param routers: Number of router addresses excluded after the gateway.
+        :param switches: Number of switch addresses excluded at the top of the network.
+        :param dns_servers: Optional DNS servers of the pool; defaults to the plan's.
+        :return: The new Pool.
+        :raises: ValueError if the block is invalid or has no free network of that size left.
+        """
+        low, parent_prefix = parse_network(within)
+        prefix = int(prefix)
+        if not parent_prefix <= prefix <= 32:
+            raise ValueError(f"Can not allocate a /{prefix} from {within}.")
+        high = low + block_size(parent_prefix) - 1
+        size = block_size(prefix)
+        key = (low, high, size)
+
+        start = self.networks.free_block(size, low, high, self._cursors.get(key))
+        if start is None:
+            raise ValueError(f"No free /{prefix} left in {within}.")
+        pool = self._add(start, prefix, name, router, routers, switches, dns_servers)
+        self._cursors[key] = start + size
+        return pool
+
+    def allocate_many(self, within: str, prefix: int, count: int, name: str = "LAN{index}", first_index: int = 1,
+                      **options) -> list:
+        """
+        Allocates several pools of the same size from a block, see allocate.
+
+        :param within: The block to allocate from.
+        :param prefix: Prefix length of the new networks.
+        :param count: Number of pools.
+        :param name: Pool name, formatted with the pool's index (e.g. 'LAN{index}').
+        :param first_index: Index of the first pool.
+        :param options: Further arguments of allocate (router, routers, switches, dns_servers).
+        :return: The new Pools.
+        """
+        return [self.allocate(within, prefix, name.format(index=index), **options)
+                for index in range(first_index, first_index + int(count))]
+
+    def _add(self, start: int, prefix: int, name: str, router, routers, switches, dns_servers) -> Pool:
+        gateway, excluded = pool_layout(start, prefix, routers, switches)
+        pool = Pool(name, start, prefix, gateway, excluded,
+                    tuple(dns_servers) if dns_servers is not None else self.dns_servers, router)
+        self.networks.add(start, pool.last, f"{router}:{name}" if router else name)
+        self.pools.append(pool)
+        return pool
+
+    def leased_addresses(self, addresses: dict) -> list:
+        """
+        Finds addresses that pools of the plan would lease, e.g. the management addresses of devices.
+
+        :param addresses: Mapping of device name to IP address.
+        :return: Messages naming each device and the pool that would lease its address.
+        """
+        pools = {pool.network: pool for pool in self.pools}
+        found = []
+        for device, ip in addresses.items():
+            try:
+                address = int(ipaddress.IPv4Address(ip))
+            except ValueError:
+                continue
+            for start, _, owner in self.networks.find(address, address):
+                pool = pools.get(start)
+                if pool and pool.leases(address):
+                    found.append(f"{owner} ({pool.cidr}) would lease the address {ip} of {device}.")
+        return found
+
+    def by_router(self) -> dict:
+        """
+        :return: Mapping of each router to its pools, in allocation order.
+        """
+        routers = {}
+        for pool in self.pools:
+            routers.setdefault(pool.router, []).append(pool)
+        return routers
+
+    def commands(self, router: str = None) -> str:
+        """
+        :param router: Optional router name; the pools of every router are included if omitted.
+        :return: The DHCP command block of the pools.
+        """
+        return "".join(pool.commands() for pool in self.pools if router is None or pool.router == router)
+
+
+def build_dhcp_plan(plan: dict, devices) -> AddressPlan:
+    """
+    Builds the address plan of many routers and checks it as a whole.
+
+    Plan layout, keyed by router name or IP:
+        {"dns_servers": ["10.0.0.53"],
+         "reserved": {"10.0.0.0/24": "Data center"},
+         "routers": {"Router1": [{"network": "10.1.0.0/22", "name": "LAN1", "routers": 2, "switches": 4},
+                                 {"within": "10.2.0.0/16", "prefix": 26, "count": 100, "name": "R1-LAN{index}"}]}}
+
+    :param plan: The plan.
+    :param devices: Inventory or list of device data dictionaries.
+    :return: The AddressPlan.
+    :raises: ValueError if a router is not in the inventory, a pool is invalid or networks overlap. Every error of
+             the plan is reported at once.
+    """
+    inventory = devices if isinstance(devices, Inventory) else Inventory(devices)
+    records = {key: inventory.get_by_name(key) or inventory.get(key) for key in plan.get('routers', {})}
+    unknown = [key for key, record in records.items() if record is None]
+    if unknown:
+        raise ValueError(f"Routers not found in the inventory: {', '.join(unknown)}")
+
+    address_plan = AddressPlan(plan.get('dns_servers', DEFAULT_DNS_SERVERS))
+    errors = []
+    for network, owner in plan.get('reserved', {}).items():
+        try:
+            address_plan.reserve(network, owner)
+        except ValueError as e:
+            errors.append(str(e))
+
+    for key, entries in plan.get('routers', {}).items():
+        router = records[key]['name']
+        for entry in entries:
+            options = {option: entry[option] for option in ('routers', 'switches', 'dns_servers') if option in entry}
+            try:
+                if 'network' in entry:
+                    address_plan.add_pool(entry['network'], entry['name'], router, mask=entry.get('mask'), **options)
+                else:
+                    address_plan.allocate_many(entry['within'], entry['prefix'], entry.get('count', 1),
+                                               entry.get('name', "LAN{index}"), entry.get('first_index', 1),
+                                               router=router, **options)
+            except (KeyError, ValueError) as e:
+                errors.append(f"{router}: {e}")
+
+    errors += address_plan.leased_addresses({name: record['ip'] for name, record in inventory.by_name.items()})
+    if errors:
+        raise ValueError("Invalid DHCP plan:\n" + "\n".join(errors))
+    logging.info("Planned %d DHCP pools on %d routers.", len(address_plan.pools), len(address_plan.by_router()))
+    return address_plan
+
+
+def run_dhcp_plan(plan: dict, devices, runner=None):
+    """
+    Configures the DHCP pools of a plan on many routers concurrently, each in a single session.
+
+    :param plan: The plan, see build_dhcp_plan.
+    :param devices: Inventory or list of device data dictionaries.
+    :param runner: Optional FleetRunner; a default one is created if omitted.
+    :return: The FleetReport.
+    :raises: ValueError if the plan is invalid.
+    """
+    from Fleet import FleetRunner
+
+    inventory = devices if isinstance(devices, Inventory) else Inventory(devices)
+    address_plan = build_dhcp_plan(plan, inventory)
+    commands = {router: address_plan.commands(router) for router in address_plan.by_router()}
+    targets = [inventory.get_by_name(router) for router in commands]
+    return (runner or FleetRunner()).run(
+        targets, lambda device: device.push_config(commands[device.name], operation="dhcp_bulk"))
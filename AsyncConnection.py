@@ -0,0 +1,280 @@
+"""
+Module responsible for managing SSH connectivity to network devices from an asyncio event loop.
+Mirrors DeviceConnection, so both backends can be used against the same inventory: failures are kept in last_error,
+and commands are recorded in the history.
+"""
+import asyncio
+import logging
+import re
+from time import monotonic, time
+
+from History import history
+from Metrics import metrics
+from Output import OutputBuffer
+from Prompt import PROMPT_PATTERN, PASSWORD_PROMPT, ENABLE_REPLY, command_complete, config_mode_commands
+
+try:
+    import asyncssh
+except ImportError:  # Optional dependency, only needed by the asyncio backend
+    asyncssh = None
+
+
+class AsyncDeviceConnection:
+    """
+    A class that handles non-blocking SSH connection logic to network devices.
+    Provides coroutines for establishing the connection, sending commands, and closing the session.
+    """
+    __slots__ = ("ip", "port", "username", "password", "prompt_pattern", "command_timeout", "max_output", "client",
+                 "stdin", "stdout", "last_used", "last_error", "metric_labels")
+
+    def __init__(self, ip, username, password, prompt_pattern=None, command_timeout=30, port=22, max_output=None):
+        """
+        Constructor for AsyncDeviceConnection.
+
+        :param ip: The IP address of the target device.
+        :param username: The username for the SSH connection.
+        :param password: The password for the SSH connection.
+        :param prompt_pattern: Optional regex (string or compiled) that marks the end of a command's output.
+        :param command_timeout: Default deadline in seconds for a single read from the device.
+        :param port: The SSH port of the device.
+        :param max_output: Optional default maximum number of characters kept from a command's output.
+        """
+        self.ip = ip
+        self.port = port
+        self.username = username
+        self.password = password
+        self.prompt_pattern = re.compile(prompt_pattern) if isinstance(prompt_pattern, str) else prompt_pattern
+        self.command_timeout = command_timeout
+        self.max_output = max_output
+        self.client = None
+        self.stdin = None
+        self.stdout = None
+        self.last_used = 0.0
+        self.last_error = None
+        # Labels attached to the timings of this connection's phases; devices add their name and type
+        self.metric_labels = {"device": ip}
+
+    @property
+    def shell(self):
+        """
+        The open interactive session, or None. Named like DeviceConnection.shell so callers can check either backend.
+        """
+        return self.stdin
+
+    async def connect(self, priv_exec_pass, timeout=30) -> None:
+        """
+        Establishes an SSH connection to the device and enters privileged exec mode.
+        Failures are logged and leave the connection closed, as with DeviceConnection.connect.
+
+        :param priv_exec_pass: The password for privileged exec mode.
+        :param timeout: Optional timeout for establishing the SSH connection.
+        """
+        self.last_error = None
+        if asyncssh is None:
+            self.last_error = f"Cannot connect to {self.ip}: the asyncio backend requires the 'asyncssh' package."
+            logging.error(self.last_error)
+            return
+
+        try:
+            logging.info("Attempting to connect to %s...", self.ip)
+            # asyncssh opens the socket itself, so TCP connect and authentication are timed as one phase
+            with metrics.span("ssh_connect", **self.metric_labels):
+                self.client = await asyncssh.connect(
+                    self.ip, port=self.port, username=self.username, password=self.password,
+                    known_hosts=None, connect_timeout=timeout
+                )
+            logging.info("SSH connection to %s established.", self.ip)
+
+            with metrics.span("shell_start", **self.metric_labels):
+                self.stdin, self.stdout, _ = await self.client.open_session(term_type='vt100')
+                banner = await self._expect(PROMPT_PATTERN, timeout, "the login prompt")
+
+            with metrics.span("enable", **self.metric_labels):
+                if banner.rstrip().endswith('>'):
+                    self.stdin.write('ena\n')
+                    reply = await self._expect(ENABLE_REPLY, timeout, "the enable password prompt")
+                    if PASSWORD_PROMPT.search(reply):
+                        self.stdin.write(f'{priv_exec_pass}\n')
+                        reply = await self._expect(PROMPT_PATTERN, timeout, "the privileged exec prompt")
+                    if not reply.rstrip().endswith('#'):
+                        raise asyncssh.Error(0, "Privileged exec mode was refused by the device.")
+
+                # Disable paging so long outputs are not held back by '--More--'
+                self.stdin.write('terminal length 0\n')
+                await self._expect(PROMPT_PATTERN, timeout, "the privileged exec prompt")
+                self.stdin.write('conf t\n')
+                await self._expect(PROMPT_PATTERN, timeout, "the configuration mode prompt")
+            self.last_used = monotonic()
+
+            logging.info("Entered privileged exec mode on %s.", self.ip)
+        except asyncssh.PermissionDenied:
+            self.last_error = f"Authentication failed while connecting to {self.ip}."
+            logging.error(self.last_error)
+            self.close()
+        except asyncssh.Error as e:
+            self.last_error = f"SSH error occurred while connecting to {self.ip}: {e.reason}"
+            logging.error(self.last_error)
+            self.close()
+        except Exception as e:
+            self.last_error = f"An unexpected error occurred during connection to {self.ip}: {e}"
+            logging.error(self.last_error)
+            self.close()
+
+    async def is_alive(self, timeout=5) -> bool:
+        """
+        Checks that the session can still be used and brings it back to global configuration mode.
+
+        :param timeout: Deadline in seconds for the device to answer.
+        :return: True if the session is healthy and in configuration mode, False otherwise.
+        """
+        if not self.stdin or self.stdout.at_eof():
+            return False
+        try:
+            self.stdin.write('\n')
+            output, error = await self.read_until_prompt(timeout=timeout)
+            if error:
+                return False
+            return_to_config = config_mode_commands(output)
+            if return_to_config is None:
+                return False
+            if return_to_config:
+                output, error = await self.send_command(return_to_config, timeout=timeout)
+                if error or not output.rstrip().endswith('(config)#'):
+                    return False
+        except (OSError, asyncssh.Error) as e:
+            logging.warning("Health check failed for %s: %s", self.ip, e)
+            return False
+        return True
+
+    async def read_until(self, done, timeout=None, buffer: OutputBuffer = None):
+        """
+        Reads from the session until the received data satisfies a condition or the deadline passes.
+
+        :param done: Callable receiving the OutputBuffer and returning True once the output is complete.
+        :param timeout: Deadline in seconds for this read; defaults to the connection's command timeout.
+        :param buffer: Optional OutputBuffer to read into; a new one honouring the connection's size cap is used
+                       by default.
+        :return: A tuple of (buffer, completed). Completed is False if the deadline passed or the channel closed.
+        """
+        buffer = buffer or OutputBuffer(self.max_output)
+        deadline = monotonic() + (self.command_timeout if timeout is None else timeout)
+        while not done(buffer):
+            remaining = deadline - monotonic()
+            if remaining <= 0 or self.stdout.at_eof():
+                buffer.finish()
+                return buffer, False
+            try:
+                buffer.feed_text(await asyncio.wait_for(self.stdout.read(65535), remaining))
+            except asyncio.TimeoutError:
+                buffer.finish()
+                return buffer, False
+        buffer.finish()
+        return buffer, True
+
+    async def read_until_prompt(self, pattern=None, timeout=None):
+        """
+        Reads until a prompt (or the given pattern) shows up at the end of the output.
+
+        :param pattern: Optional regex overriding the connection's prompt pattern for this call.
+        :param timeout: Deadline in seconds for this read; defaults to the connection's command timeout.
+        :return: A tuple of (output, error). Error will be None if the prompt was seen in time.
+        """
+        pattern = re.compile(pattern) if isinstance(pattern, str) else pattern
+        pattern = pattern or self.prompt_pattern or PROMPT_PATTERN
+        buffer, completed = await self.read_until(lambda received: pattern.search(received.tail) is not None, timeout)
+        if not completed:
+            return buffer.getvalue(), f"Timed out waiting for the prompt on {self.ip}."
+        return buffer.getvalue(), None
+
+    async def _expect(self, pattern, timeout, description) -> str:
+        """
+        Reads until the pattern is seen during the login sequence.
+
+        :raises: asyncssh.Error if the pattern is not seen before the deadline.
+        """
+        output, error = await self.read_until_prompt(pattern, timeout)
+        if error:
+            raise asyncssh.Error(0, f"Timed out waiting for {description}.")
+        return output
+
+    def _no_session_error(self) -> str:
+        """
+        Describes why there is no session, including the reason the last connection attempt failed.
+        """
+        if self.last_error:
+            return f"No active SSH session: {self.last_error}"
+        return "No active SSH session. Please establish a connection first."
+
+    async def send_command(self, command, timeout=None, expect=None, max_output=None, sink=None):
+        """
+        Sends a command to the connected device and returns the output.
+
+        :param command: The command to send.
+        :param timeout: Deadline in seconds for the whole command; defaults to the connection's command timeout.
+        :param expect: Optional regex marking the end of the output instead of the prompt.
+        :param max_output: Optional maximum number of characters kept; defaults to the connection's cap.
+        :param sink: Optional callable or file-like object receiving the output as it arrives. The output is then
+                     not kept, and an empty string is returned in its place.
+        :return: A tuple of (output, error). Error will be None if successful, otherwise contains error message.
+        """
+        if not self.stdin:
+            error_msg = self._no_session_error()
+            logging.error(error_msg)
+            return None, error_msg
+
+        try:
+            logging.info("Sending command to %s", self.ip, extra={"payload": command})
+            command = command if command.endswith('\n') else command + '\n'
+            started_at = time()
+            started = monotonic()
+            self.stdin.write(command)
+
+            if expect is not None:
+                pattern = re.compile(expect) if isinstance(expect, str) else expect
+                done = lambda received: pattern.search(received.tail) is not None
+            else:
+                prompt = self.prompt_pattern or PROMPT_PATTERN
+                expected_prompts = command.count('\n')
+                done = lambda received: command_complete(received, expected_prompts, prompt)
+
+            buffer = OutputBuffer(self.max_output if max_output is None else max_output, sink)
+            buffer, completed = await self.read_until(done, timeout, buffer)
+            output = buffer.getvalue()
+            metrics.observe("command", monotonic() - started, error=None if completed else "timeout",
+                            **self.metric_labels)
+            if buffer.truncated:
+                logging.warning("Output from %s was truncated to %d of %d characters.", self.ip, len(output),
+                                buffer.size)
+
+            self.last_used = monotonic()
+            error = None if completed else f"Timed out waiting for the prompt on {self.ip}."
+            error = error or buffer.error
+            history.record(kind="command", commands=command.rstrip('\n'), output=output, error=error,
+                           started=started_at, duration=self.last_used - started, **self.metric_labels)
+            if error:
+                logging.error("Command failed on %s: %s", self.ip, error, extra={"payload": output})
+                return output, error
+
+            logging.info("Command executed successfully on %s.", self.ip)
+            return output, None
+        except asyncssh.Error as e:
+            logging.error("Failed to send command to %s: %s", self.ip, e.reason)
+            return None, e.reason
+        except Exception as e:
+            logging.error("An unexpected error occurred while sending command to %s: %s", self.ip, e)
+            return None, str(e)
+
+    def close(self) -> None:
+        """
+        Closes the SSH connection and cleans up resources.
+        Closing does not need to be awaited; the transport shuts down in the background.
+        """
+        if self.client:
+            logging.info("Closing SSH connection to %s.", self.ip)
+            self.client.close()
+            self.client = None
+            self.stdin = None
+            self.stdout = None
+            logging.info("SSH connection to %s closed.", self.ip)
+        else:
+            logging.info("No active connection to close for %s.", self.ip)
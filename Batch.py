@@ -0,0 +1,190 @@
+"""
+Module responsible for merging several configuration operations into a single push per device,
+and for running configuration jobs described in a JSON job file.
+"""
+import json
+import logging
+from dataclasses import dataclass, field
+from time import monotonic
+
+from Commands import BUILDERS
+from Inventory import select_targets
+
+
+@dataclass
+class BatchResult:
+    """
+    Outcome of pushing a batch to one device. The batch passes or fails as a whole.
+    """
+    name: str
+    ip: str
+    operations: list
+    success: bool
+    duration: float
+    output: str = None
+    error: str = None
+
+
+@dataclass
+class ConfigBatch:
+    """
+    An ordered list of configuration blocks pushed to a device in one go, over one session.
+    """
+    operations: list = field(default_factory=list)
+    blocks: list = field(default_factory=list)
+
+    def add(self, operation: str, **params) -> "ConfigBatch":
+        """
+        Appends the command block of a named operation.
+
+        :param operation: One of the operation names in Commands.BUILDERS (e.g. 'vlan', 'hsrp').
+        :param params: The parameters of the operation's builder.
+        :return: The batch itself, so calls can be chained.
+        :raises: ValueError if the operation is unknown or its parameters are invalid.
+        """
+        builder = BUILDERS.get(operation)
+        if builder is None:
+            raise ValueError(f"Unknown operation '{operation}'. Available: {', '.join(sorted(BUILDERS))}")
+        try:
+            block = builder(**params)
+        except TypeError as e:
+            raise ValueError(f"Invalid parameters for operation '{operation}': {e}") from e
+        return self.add_block(operation, block)
+
+    def add_block(self, operation: str, commands: str) -> "ConfigBatch":
+        """
+        Appends an already built command block.
+
+        :param operation: Name recorded for the block in the result.
+        :param commands: The command block.
+        :return: The batch itself, so calls can be chained.
+        """
+        self.operations.append(operation)
+        self.blocks.append(commands if commands.endswith('\n') else commands + '\n')
+        return self
+
+    @property
+    def commands(self) -> str:
+        """
+        The merged configuration, in the order the blocks were added.
+        """
+        return "".join(self.blocks)
+
+    def push(self, device, minimal: bool = False) -> BatchResult:
+        """
+        Pushes the whole batch to the device as a single configuration block.
+
+        :param device: The Device to configure.
+        :param minimal: Only send the lines missing from the device's running configuration.
+        :return: A BatchResult with a single pass/fail outcome for the batch.
+        """
+        started = monotonic()
+        if not self.blocks:
+            return BatchResult(device.name, device.ip, [], True, 0.0, "", None)
+
+        logging.info(f"Pushing batch ({', '.join(self.operations)}) to {device.name} ({device.ip})")
+        output, error = device.push_config(self.commands, minimal=minimal, operation="batch")
+        return BatchResult(device.name, device.ip, list(self.operations), not error,
+                           monotonic() - started, output, error)
+
+
+def build_batch(operations: list) -> ConfigBatch:
+    """
+    Builds a batch from job file operation entries such as {"op": "vlan", "vlan_id": 10, "vlan_name": "Users"}.
+
+    :param operations: List of operation dictionaries, each with an 'op' key and the builder's parameters.
+    :return: The ConfigBatch.
+    :raises: ValueError if an entry is invalid.
+    """
+    batch = ConfigBatch()
+    for entry in operations:
+        params = dict(entry)
+        operation = params.pop('op', None)
+        if operation is None:
+            raise ValueError(f"Operation entry without an 'op' key: {entry}")
+        batch.add(operation, **params)
+    return batch
+
+
+def load_job_file(filename: str) -> dict:
+    """
+    Loads a job file.
+
+    :param filename: Name of the JSON job file.
+    :return: The job description.
+    :raises: ValueError if the file does not contain a 'jobs' list.
+    """
+    with open(filename, 'r') as file:
+        job_file = json.load(file)
+    if not isinstance(job_file, dict) or not isinstance(job_file.get('jobs'), list):
+        raise ValueError(f"Job file {filename} must contain an object with a 'jobs' list.")
+    return job_file
+
+
+def plan_jobs(job_file: dict, devices) -> list:
+    """
+    Resolves the targets and builds the batch of every job in a job file, without connecting to anything.
+
+    :param job_file: The job description, as returned by load_job_file.
+    :param devices: Inventory or list of device data dictionaries.
+    :return: List of (targets, ConfigBatch, minimal) tuples, one per job.
+    :raises: ValueError if a job's operations are invalid.
+    """
+    planned = []
+    for index, job in enumerate(job_file['jobs'], start=1):
+        filters = job.get('targets', {})
+        targets = select_targets(devices, types=filters.get('types'), name_pattern=filters.get('name'),
+                                 ips=filters.get('ips'))
+        try:
+            batch = build_batch(job.get('operations', []))
+        except ValueError as e:
+            raise ValueError(f"Job {index}: {e}") from e
+        if not targets:
+            logging.warning(f"Job {index} matches no devices.")
+        planned.append((targets, batch, bool(job.get('minimal', False))))
+    return planned
+
+
+def run_jobs(job_file: dict, devices, runner=None) -> list:
+    """
+    Runs every job of a job file. Each job selects its targets from the inventory and pushes one merged batch
+    to each of them concurrently. All batches are validated before anything is pushed.
+
+    With "minimal": true, a job only sends what each device's running configuration is missing.
+
+    Job file layout:
+        {"max_workers": 10,
+         "jobs": [{"targets": {"types": ["normal_sw"], "name": "Switch*", "ips": ["192.168.1.251"]},
+                   "operations": [{"op": "vlan", "vlan_id": 10, "vlan_name": "Users"},
+                                  {"op": "stp", "primary_vlan": 10}],
+                   "minimal": true}]}
+
+    :param job_file: The job description, as returned by load_job_file.
+    :param devices: Inventory or list of device data dictionaries.
+    :param runner: Optional FleetRunner; one honouring the job file's 'max_workers' is created by default.
+    :return: List of (targets, FleetReport) pairs, one per job. Each report's outputs are BatchResults.
+    """
+    from Fleet import FleetRunner
+
+    planned = plan_jobs(job_file, devices)
+    runner = runner or FleetRunner(max_workers=job_file.get('max_workers', 10),
+                                   per_type_limits=job_file.get('per_type_limits'))
+    return push_planned(planned, runner)
+
+
+def push_planned(planned: list, runner) -> list:
+    """
+    Pushes already planned jobs, one job after the other, each to all of its targets concurrently.
+
+    :param planned: List of (targets, ConfigBatch, minimal) tuples, as returned by plan_jobs.
+    :param runner: The FleetRunner pushing the batches.
+    :return: List of (targets, FleetReport) pairs, one per job. Each report's outputs are BatchResults.
+    """
+    reports = []
+    for targets, batch, minimal in planned:
+        def push_batch(device, batch=batch, minimal=minimal):
+            result = batch.push(device, minimal=minimal)
+            return result, result.error
+
+        reports.append((targets, runner.run(targets, push_batch)))
+    return reports
@@ -0,0 +1,265 @@
+"""
+Module benchmarking DeviceConnection against simulated IOS devices.
+Reports connect time, per-command latency, pipelined line rate, exec channel latency, fleet throughput across
+concurrent devices, memory per session and the memory and build time per Device object of a large synthetic inventory.
+The simulated devices run in a separate process so they do not skew the client-side timings and memory figures.
+
+Usage:
+    python Benchmark.py --devices 10 --commands 20 --latency 0.005 --json --metrics phases.prom
+    python Benchmark.py --inventory 50000 --only devices
+"""
+import argparse
+import json
+import logging
+import os
+import statistics
+import subprocess
+import sys
+import tracemalloc
+from time import perf_counter
+
+from Connection import DeviceConnection
+from Fleet import DeviceRegistry, FleetRunner
+from Inventory import Inventory
+from Metrics import metrics
+
+
+def percentile(samples: list, fraction: float) -> float:
+    """
+    :param samples: Measured values.
+    :param fraction: Percentile as a fraction between 0 and 1 (e.g. 0.95).
+    :return: The nearest-rank percentile of the samples, or 0.0 when there are none.
+    """
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, max(0, round(fraction * len(ordered)) - 1))]
+
+
+def summarize(samples: list) -> dict:
+    """
+    :param samples: Measured durations in seconds.
+    :return: Count, mean, p50, p95 and max of the samples, in milliseconds.
+    """
+    return {
+        "count": len(samples),
+        "mean_ms": round(statistics.fmean(samples) * 1000, 3) if samples else 0.0,
+        "p50_ms": round(percentile(samples, 0.50) * 1000, 3),
+        "p95_ms": round(percentile(samples, 0.95) * 1000, 3),
+        "max_ms": round(max(samples) * 1000, 3) if samples else 0.0,
+    }
+
+
+def start_simulators(count: int, latency: float, jitter: float, output_lines: int):
+    """
+    Starts simulated devices in a child process.
+
+    :return: A tuple of (process, inventory records).
+    """
+    simulator = os.path.join(os.path.dirname(os.path.abspath(__file__)), "Simulator.py")
+    process = subprocess.Popen(
+        [sys.executable, simulator, "--count", str(count), "--latency", str(latency),
+         "--jitter", str(jitter), "--output-lines", str(output_lines)],
+        stdout=subprocess.PIPE, text=True
+    )
+    records = json.loads(process.stdout.readline())
+    return process, records
+
+
+def open_connection(record: dict) -> DeviceConnection:
+    connection = DeviceConnection(record['ip'], record['username'], record['password'], port=record['port'])
+    connection.connect(record['privileged_password'])
+    if not connection.shell:
+        raise RuntimeError(f"Could not connect to simulated device {record['name']}.")
+    return connection
+
+
+def bench_connect(record: dict, rounds: int) -> dict:
+    samples = []
+    for _ in range(rounds):
+        started = perf_counter()
+        connection = open_connection(record)
+        samples.append(perf_counter() - started)
+        connection.close()
+    return summarize(samples)
+
+
+def bench_commands(record: dict, commands: int) -> dict:
+    connection = open_connection(record)
+    samples = []
+    try:
+        for index in range(commands):
+            started = perf_counter()
+            _, error = connection.send_command(f"vlan {index % 4000 + 2}\nname BENCH_{index}")
+            samples.append(perf_counter() - started)
+            if error:
+                raise RuntimeError(f"Command failed during benchmark: {error}")
+    finally:
+        connection.close()
+    return summarize(samples)
+
+
+def bench_pipeline(record: dict, commands: int, window: int) -> dict:
+    connection = open_connection(record)
+    try:
+        started = perf_counter()
+        results = connection.send_pipelined([f"vlan {index % 4000 + 2}" for index in range(commands)], window=window)
+        duration = perf_counter() - started
+    finally:
+        connection.close()
+    summary = summarize([result.latency for result in results if result.latency is not None])
+    summary["failed"] = sum(1 for result in results if result.error)
+    summary["lines_per_s"] = round(commands / duration, 1) if duration else 0.0
+    return summary
+
+
+def bench_exec(record: dict, commands: int) -> dict:
+    """
+    Runs show commands on exec channels, one at a time and then in parallel batches, next to the open shell.
+    """
+    connection = open_connection(record)
+    show = ["show vlan brief", "show ip route", "show standby brief", "show version"]
+    try:
+        samples = []
+        for index in range(commands):
+            started = perf_counter()
+            _, error = connection.run_exec(show[index % len(show)])
+            samples.append(perf_counter() - started)
+            if error:
+                raise RuntimeError(f"Exec command failed during benchmark: {error}")
+        started = perf_counter()
+        failed = 0
+        for _ in range(max(1, commands // len(show))):
+            outputs = connection.run_parallel(show)
+            failed += sum(1 for _, error in outputs.values() if error)
+        parallel = perf_counter() - started
+    finally:
+        connection.close()
+    if failed:
+        raise RuntimeError(f"{failed} parallel exec commands failed during benchmark.")
+    summary = summarize(samples)
+    summary["parallel_batch_ms"] = round(parallel / max(1, commands // len(show)) * 1000, 3)
+    return summary
+
+
+def bench_fleet(records: list, commands: int, workers: int) -> dict:
+    block = "".join(f"vlan {index + 2}\nname BENCH_{index}\n" for index in range(commands))
+    report = FleetRunner(max_workers=workers).run(records, lambda device: device.push_config(block))
+    for result in report.results:
+        result.output = None
+    lines = block.count("\n") * len(report.succeeded)
+    return {
+        "devices": len(records),
+        "succeeded": len(report.succeeded),
+        "wall_s": round(report.duration, 3),
+        "slowest_device_s": round(max((r.duration for r in report.results), default=0.0), 3),
+        "lines_per_s": round(lines / report.duration, 1) if report.duration else 0.0,
+    }
+
+
+def bench_memory(records: list) -> dict:
+    tracemalloc.start()
+    baseline, _ = tracemalloc.get_traced_memory()
+    connections = [open_connection(record) for record in records]
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    for connection in connections:
+        connection.close()
+    return {
+        "sessions": len(connections),
+        "bytes_per_session": (current - baseline) // max(1, len(connections)),
+        "peak_bytes": peak - baseline,
+    }
+
+
+def synthetic_records(count: int) -> list:
+    """
+    :param count: Number of records.
+    :return: Inventory records of routers and switches sharing a few credentials, as decoded from JSON.
+    """
+    return [json.loads(json.dumps({
+        "type": "router" if index % 10 == 0 else "normal_sw",
+        "name": f"Device{index}",
+        "ip": f"10.{index >> 16 & 255}.{index >> 8 & 255}.{index & 255}",
+        "username": f"admin{index % 4}",
+        "password": f"secret{index % 4}",
+        "privileged_password": f"enable{index % 4}",
+    })) for index in range(count)]
+
+
+def bench_devices(count: int) -> dict:
+    """
+    Measures the memory held by the Device objects of a large inventory, and the time to build them.
+    No session is opened, so no connection is created.
+    """
+    records = synthetic_records(count)
+    tracemalloc.start()
+    baseline, _ = tracemalloc.get_traced_memory()
+    inventory = Inventory(records)
+    indexed, _ = tracemalloc.get_traced_memory()
+    registry = DeviceRegistry()
+    started = perf_counter()
+    for record in inventory.devices:
+        registry(record)
+    duration = perf_counter() - started
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        "devices": len(registry),
+        "bytes_per_device": (current - indexed) // max(1, count),
+        "index_bytes_per_record": (indexed - baseline) // max(1, count),
+        "build_us_per_device": round(duration / max(1, count) * 1e6, 2),
+        "peak_bytes": peak - baseline,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark DeviceConnection against simulated IOS devices.")
+    parser.add_argument("--devices", type=int, default=5, help="number of simulated devices")
+    parser.add_argument("--commands", type=int, default=20, help="commands per latency/throughput measurement")
+    parser.add_argument("--connects", type=int, default=5, help="connections for the connect time measurement")
+    parser.add_argument("--window", type=int, default=64, help="pipelined commands in flight")
+    parser.add_argument("--workers", type=int, default=10, help="fleet runner worker threads")
+    parser.add_argument("--latency", type=float, default=0.0, help="simulated device latency per line, seconds")
+    parser.add_argument("--jitter", type=float, default=0.0, help="simulated device jitter, seconds")
+    parser.add_argument("--output-lines", type=int, default=0, help="filler lines in 'show' outputs")
+    parser.add_argument("--inventory", type=int, default=10000, help="devices in the synthetic inventory")
+    parser.add_argument("--only", choices=("devices",),
+                        help="run only this measurement, without starting simulated devices")
+    parser.add_argument("--json", action="store_true", help="print the results as JSON")
+    parser.add_argument("--metrics", help="write per-phase timings to this file (JSON if it ends in .json, "
+                                          "Prometheus text otherwise)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    if args.only == "devices":
+        results = {"devices": bench_devices(args.inventory)}
+        print(json.dumps(results, indent=2) if args.json else
+              "devices  " + "  ".join(f"{key}={value}" for key, value in results["devices"].items()))
+        return
+    process, records = start_simulators(args.devices, args.latency, args.jitter, args.output_lines)
+    try:
+        results = {
+            "connect": bench_connect(records[0], args.connects),
+            "command": bench_commands(records[0], args.commands),
+            "pipeline": bench_pipeline(records[0], args.commands, args.window),
+            "exec": bench_exec(records[0], args.commands),
+            "fleet": bench_fleet(records, args.commands, args.workers),
+            "memory": bench_memory(records),
+            "devices": bench_devices(args.inventory),
+        }
+    finally:
+        process.terminate()
+        process.wait()
+    if args.metrics:
+        metrics.export(args.metrics, "json" if args.metrics.endswith(".json") else "prometheus")
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    for name, values in results.items():
+        print(f"{name:<8} " + "  ".join(f"{key}={value}" for key, value in values.items()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,413 @@
+"""
+Module providing the non-interactive command line interface, for scripts and automation.
+Only the inventory is imported at start-up; each subcommand loads the modules it uses, and the SSH stack is only
+loaded once a command really connects to devices, so inventory queries and dry runs start quickly.
+Results are printed to stdout as a single JSON document; logs go to stderr.
+
+Usage:
+    python Main.py inventory --type normal_sw --name "Switch*"
+    python Main.py push --ip 192.168.1.251 --command "vlan 10" --command "name Users"
+    python Main.py push --type normal_sw --op '{"op": "vlan", "vlan_id": 10, "vlan_name": "Users"}' --dry-run
+    python Main.py push --job jobs.json --minimal
+    python Main.py show --name "Router*" "show ip interface brief"
+    python Main.py -v --log-format json --log-payload 256 push --type normal_sw --command "vlan 10"
+    python Main.py show --type normal_sw "show vlan brief" "show standby brief" "show ip route"
+    python Main.py vlans --plan vlans.json --dry-run
+    python Main.py dhcp --plan dhcp.json --dry-run
+    python Main.py hsrp --plan hsrp.json --verify 120
+    python Main.py verify --name "Router*" --hsrp Gi0/1:1 --rip-route 192.168.2.0/24 --timeout 90
+    python Main.py history last --device Router1 --operation hsrp
+    python Main.py history stats --days 7 --by device_type
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+
+from Inventory import Inventory, select_targets
+
+INVENTORY_FILE = 'deviceDetails.json'
+HISTORY_FILE = 'history.db'
+# Log formats and payload size of Logs, repeated so building the parser does not import it
+LOG_FORMATS = ("text", "json")
+LOG_PAYLOAD = 2048
+# Inventory fields never printed
+SECRET_FIELDS = ('username', 'password', 'privileged_password')
+
+
+def operation_entry(value: str) -> dict:
+    """
+    Parses an --op argument: a JSON object with an 'op' key, as in job files.
+    """
+    try:
+        entry = json.loads(value)
+    except json.JSONDecodeError as e:
+        raise argparse.ArgumentTypeError(f"invalid JSON: {e}")
+    if not isinstance(entry, dict) or 'op' not in entry:
+        raise argparse.ArgumentTypeError("expected a JSON object with an 'op' key")
+    return entry
+
+
+def command_entry(value: str) -> dict:
+    """
+    Turns a --command argument into a raw commands operation.
+    """
+    return {"op": "commands", "commands": value}
+
+
+def hsrp_entry(value: str) -> tuple:
+    """
+    Parses a --hsrp argument: INTERFACE:GROUP, optionally followed by :Active or :Standby.
+    """
+    parts = value.split(":")
+    if len(parts) < 2 or not parts[1].isdigit() or parts[2:] not in ([], ["Active"], ["Standby"]):
+        raise argparse.ArgumentTypeError("expected INTERFACE:GROUP[:Active|:Standby], e.g. Gi0/1:1")
+    return parts[0], int(parts[1]), parts[2] if len(parts) == 3 else None
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="Main.py", description="Network Automation Tool")
+    parser.add_argument("--inventory", default=INVENTORY_FILE, help="device inventory file")
+    parser.add_argument("-v", "--verbose", action="store_true", help="log progress to stderr")
+    parser.add_argument("--log-format", choices=LOG_FORMATS, default="text",
+                        help="format of the log records of the commands working on devices")
+    parser.add_argument("--log-payload", type=int, default=LOG_PAYLOAD,
+                        help="characters of command blocks and outputs written per log record")
+    parser.add_argument("--log-sample", type=float, default=1.0,
+                        help="fraction of log records whose command block or output is written")
+    parser.add_argument("--history", default=HISTORY_FILE, help="SQLite file recording commands and operations")
+    parser.add_argument("--no-history", action="store_true", help="do not record commands and operations")
+    subcommands = parser.add_subparsers(dest="subcommand", required=True)
+
+    targets = argparse.ArgumentParser(add_help=False)
+    targets.add_argument("--type", dest="types", action="append", help="device type, may be repeated")
+    targets.add_argument("--name", help="shell-style pattern matched against device names")
+    targets.add_argument("--ip", dest="ips", action="append", help="device IP address, may be repeated")
+    targets.add_argument("--all", action="store_true", help="target every device in the inventory")
+
+    running = argparse.ArgumentParser(add_help=False)
+    running.add_argument("--workers", type=int, default=10, help="devices handled concurrently")
+    running.add_argument("--no-preflight", action="store_true",
+                         help="connect without probing the devices and consulting the circuit breaker first")
+    running.add_argument("--probe-timeout", type=float, default=1.0, help="deadline in seconds of each probe round")
+    running.add_argument("--connect-attempts", type=int, default=2,
+                         help="connection attempts per device, retried with exponential backoff")
+    running.add_argument("--metrics", help="write per-phase timings to this file (JSON if it ends in .json, "
+                                           "Prometheus text otherwise)")
+
+    inventory = subcommands.add_parser("inventory", parents=[targets], help="list devices from the inventory")
+    inventory.set_defaults(handler=cmd_inventory)
+
+    push = subcommands.add_parser("push", parents=[targets, running], help="push configuration to devices")
+    push.add_argument("--op", dest="operations", action="append", type=operation_entry,
+                      help="operation as a JSON object, e.g. '{\"op\": \"vlan\", \"vlan_id\": 10}'")
+    push.add_argument("--command", dest="operations", action="append", type=command_entry,
+                      help="raw configuration command, may be repeated")
+    push.add_argument("--job", help="job file; replaces the target and operation arguments")
+    push.add_argument("--minimal", action="store_true", help="only send lines missing from the running config")
+    push.add_argument("--dry-run", action="store_true", help="print the targets and commands without connecting")
+    push.set_defaults(handler=cmd_push)
+
+    show = subcommands.add_parser("show", parents=[targets, running], help="run a show command on devices")
+    show.add_argument("commands", nargs="+", metavar="command",
+                      help="show command, e.g. 'show vlan brief'; several commands run concurrently on each device, "
+                           "on exec channels at the account's privilege level, except commands needing "
+                           "privilege 15 such as 'show running-config', which run over the enabled shell")
+    show.add_argument("--timeout", type=float, default=60, help="deadline in seconds for the command")
+    show.add_argument("--parse", action="store_true",
+                      help="return parsed records instead of raw output (commands listed in Parsers.PARSERS)")
+    show.set_defaults(handler=cmd_show)
+
+    vlans = subcommands.add_parser("vlans", parents=[running], help="provision VLANs on switches from a plan")
+    vlans.add_argument("--plan", required=True, help="VLAN plan file, keyed by switch name or IP")
+    vlans.add_argument("--dry-run", action="store_true",
+                       help="print the commands without connecting, so existing VLANs are not skipped")
+    vlans.set_defaults(handler=cmd_vlans)
+
+    dhcp = subcommands.add_parser("dhcp", parents=[running], help="configure DHCP pools on routers from a plan")
+    dhcp.add_argument("--plan", required=True, help="DHCP plan file, keyed by router name or IP")
+    dhcp.add_argument("--dry-run", action="store_true",
+                      help="check the plan for overlaps and print the commands without connecting")
+    dhcp.set_defaults(handler=cmd_dhcp)
+
+    hsrp = subcommands.add_parser("hsrp", parents=[running], help="roll out HSRP groups to router pairs from a plan")
+    hsrp.add_argument("--plan", required=True, help="HSRP plan file with a list of standby groups")
+    hsrp.add_argument("--dry-run", action="store_true",
+                      help="resolve the peers and print the commands without connecting")
+    hsrp.add_argument("--verify", type=float, metavar="SECONDS",
+                      help="wait up to SECONDS for every group to elect its active and standby peer")
+    hsrp.set_defaults(handler=cmd_hsrp)
+
+    verify = subcommands.add_parser("verify", parents=[targets, running],
+                                    help="wait until protocols converged on devices")
+    verify.add_argument("--hsrp", action="append", type=hsrp_entry, default=[],
+                        help="HSRP group that must be elected, as INTERFACE:GROUP[:Active|:Standby]")
+    verify.add_argument("--no-peer", action="store_true", help="do not require the HSRP peer to be up")
+    verify.add_argument("--stp-root", action="append", type=int, default=[], help="VLAN the device must be root for")
+    verify.add_argument("--rip-route", action="append", default=[], help="network that must be learnt over RIP")
+    verify.add_argument("--rip-learned", action="store_true", help="require at least one route learnt over RIP")
+    verify.add_argument("--timeout", type=float, default=60, help="deadline in seconds")
+    verify.set_defaults(handler=cmd_verify)
+
+    history = subcommands.add_parser("history", help="query the recorded commands and operations")
+    history.add_argument("action", nargs="?", choices=("list", "last", "stats", "compact"), default="list",
+                         help="list records, show the last successful operation, compute duration quantiles "
+                              "or delete records older than --days")
+    history.add_argument("--device", help="device name or IP")
+    history.add_argument("--operation", help="operation, e.g. hsrp")
+    history.add_argument("--kind", choices=("operation", "command"), help="operations or single commands")
+    history.add_argument("--failed", dest="success", action="store_false", default=None,
+                         help="only failed records")
+    history.add_argument("--successful", dest="success", action="store_true", help="only successful records")
+    history.add_argument("--days", type=float, help="only the last N days; for compact, the retention period")
+    history.add_argument("--by", choices=("device_type", "device", "operation"), default="device_type",
+                         help="grouping of the duration quantiles")
+    history.add_argument("--limit", type=int, default=100, help="maximum number of records listed")
+    history.set_defaults(handler=cmd_history)
+    return parser
+
+
+def select(args, devices) -> list:
+    """
+    Resolves the target arguments. Without any filter, --all is required so nothing is targeted by accident.
+    """
+    if not (args.types or args.name or args.ips or args.all):
+        raise ValueError("No targets given; use --type, --name, --ip or --all.")
+    return select_targets(devices, types=args.types, name_pattern=args.name, ips=args.ips)
+
+
+def public_record(record: dict) -> dict:
+    return {key: value for key, value in record.items() if key not in SECRET_FIELDS}
+
+
+def report_document(report) -> dict:
+    """
+    :return: A FleetReport as a JSON-serialisable dictionary.
+    """
+    from dataclasses import asdict
+
+    return {
+        "targets": [result.name for result in report.results],
+        "succeeded": len(report.succeeded),
+        "failed": len(report.failed),
+        "duration": report.duration,
+        "results": [asdict(result) for result in report.results],
+    }
+
+
+def fleet_runner(args, max_workers=None, per_type_limits=None):
+    """
+    Builds the FleetRunner of a command that connects to devices, with the preflight check unless disabled.
+    """
+    from Fleet import FleetRunner
+    from Preflight import CircuitBreaker, Preflight
+    from History import history
+    from Session import session_manager
+
+    if not args.no_history:
+        history.open(args.history)
+    session_manager.connect_attempts = max(1, args.connect_attempts)
+    preflight = None
+    if not args.no_preflight:
+        preflight = Preflight(CircuitBreaker(), timeout=args.probe_timeout)
+        session_manager.breaker = preflight.breaker
+    return FleetRunner(max_workers=max_workers or args.workers, per_type_limits=per_type_limits,
+                       preflight=preflight)
+
+
+def cmd_inventory(args, devices) -> tuple:
+    if args.types or args.name or args.ips:
+        records = select_targets(devices, types=args.types, name_pattern=args.name, ips=args.ips)
+    else:
+        records = list(devices)
+    return {"count": len(records), "devices": [public_record(record) for record in records]}, True
+
+
+def cmd_push(args, devices) -> tuple:
+    from Batch import build_batch, load_job_file, plan_jobs, push_planned
+
+    if args.job:
+        job_file = load_job_file(args.job)
+        planned = plan_jobs(job_file, devices)
+        max_workers = job_file.get('max_workers', args.workers)
+        per_type_limits = job_file.get('per_type_limits')
+    else:
+        if not args.operations:
+            raise ValueError("Nothing to push; use --op, --command or --job.")
+        planned = [(select(args, devices), build_batch(args.operations), args.minimal)]
+        max_workers, per_type_limits = args.workers, None
+
+    if args.dry_run:
+        jobs = [{"targets": [record['name'] for record in targets], "operations": batch.operations,
+                 "commands": batch.commands, "minimal": minimal}
+                for targets, batch, minimal in planned]
+        return {"dry_run": True, "jobs": jobs}, True
+
+    runner = fleet_runner(args, max_workers, per_type_limits)
+    reports = push_planned(planned, runner)
+    document = {"jobs": [report_document(report) for _, report in reports]}
+    return document, all(not report.failed for _, report in reports)
+
+
+def cmd_show(args, devices) -> tuple:
+    targets = select(args, devices)
+    if args.parse:
+        from Parsers import parse, parser_for
+        for command in args.commands:
+            parser_for(command)
+
+    def run_show(device):
+        if len(args.commands) > 1:
+            outputs = device.show_commands(args.commands, timeout=args.timeout)
+            errors = [f"{command}: {error}" for command, (_, error) in outputs.items() if error]
+            if args.parse:
+                return {command: [record._asdict() for record in parse(command, output or "")]
+                        for command, (output, _) in outputs.items()}, "; ".join(errors) or None
+            return {command: output for command, (output, _) in outputs.items()}, "; ".join(errors) or None
+        if args.parse:
+            records, error = device.show_records(args.commands[0], timeout=args.timeout)
+            return [record._asdict() for record in records], error
+        # Sessions are kept in configuration mode, where exec commands need the 'do' prefix
+        command = args.commands[0] if args.commands[0].startswith("do ") else f"do {args.commands[0]}"
+        with device.session() as connection:
+            return connection.send_command(command, timeout=args.timeout)
+
+    report = fleet_runner(args).run(targets, run_show)
+    return report_document(report), not report.failed
+
+
+def cmd_vlans(args, devices) -> tuple:
+    from Vlans import run_vlan_plan, trunk_vlan_commands, vlan_bulk_commands
+
+    with open(args.plan, 'r') as file:
+        plan = json.load(file)
+
+    if args.dry_run:
+        commands = {}
+        for switch, spec in plan.items():
+            block = vlan_bulk_commands(spec.get('vlans'), spec.get('names'))
+            block += "".join(trunk_vlan_commands(interface, **change)
+                             for interface, change in spec.get('trunks', {}).items())
+            commands[switch] = block
+        return {"dry_run": True, "commands": commands}, True
+
+    report = run_vlan_plan(plan, devices, fleet_runner(args))
+    return report_document(report), not report.failed
+
+
+def cmd_dhcp(args, devices) -> tuple:
+    from AddressPlan import build_dhcp_plan, run_dhcp_plan
+
+    with open(args.plan, 'r') as file:
+        plan = json.load(file)
+
+    if args.dry_run:
+        address_plan = build_dhcp_plan(plan, devices)
+        pools = {router: [pool.cidr for pool in pools] for router, pools in address_plan.by_router().items()}
+        commands = {router: address_plan.commands(router) for router in pools}
+        return {"dry_run": True, "pools": pools, "commands": commands}, True
+
+    report = run_dhcp_plan(plan, devices, fleet_runner(args))
+    return report_document(report), not report.failed
+
+
+def cmd_hsrp(args, devices) -> tuple:
+    from dataclasses import asdict
+    from Hsrp import group_results, plan_rollout, rollout
+
+    with open(args.plan, 'r') as file:
+        plan = json.load(file)
+
+    groups, batches = plan_rollout(plan, devices)
+    if args.dry_run:
+        return {"dry_run": True, "groups": [asdict(group) for group in groups],
+                "commands": {name: batch.commands for name, batch in batches.items()}}, True
+
+    report, verification = rollout(plan, devices, fleet_runner(args), args.verify)
+    document = report_document(report)
+    document["groups"] = group_results(groups, report)
+    success = not report.failed
+    if verification is not None:
+        document["verification"] = report_document(verification)
+        document["converged"] = group_results(groups, verification)
+        success = success and not verification.failed
+    return document, success
+
+
+def cmd_verify(args, devices) -> tuple:
+    from Verification import hsrp_converged, rip_routes, stp_root
+
+    conditions = [hsrp_converged(interface, group, state, peer=not args.no_peer)
+                  for interface, group, state in args.hsrp]
+    conditions += [stp_root(vlan) for vlan in args.stp_root]
+    if args.rip_route or args.rip_learned:
+        conditions.append(rip_routes(args.rip_route))
+    if not conditions:
+        raise ValueError("Nothing to verify; use --hsrp, --stp-root, --rip-route or --rip-learned.")
+
+    targets = select(args, devices)
+    report = fleet_runner(args).run(targets, lambda device: device.verify(conditions, args.timeout))
+    return report_document(report), not report.failed
+
+
+def cmd_history(args, devices) -> tuple:
+    from time import time
+    from History import HistoryStore
+
+    if not os.path.exists(args.history):
+        raise ValueError(f"No history recorded in {args.history}.")
+    store = HistoryStore(args.history, retention_days=None)
+    try:
+        since = time() - args.days * 86400 if args.days else None
+        if args.action == "last":
+            if not (args.device and args.operation):
+                raise ValueError("'history last' needs --device and --operation.")
+            record = store.last_success(args.device, args.operation)
+            return {"record": record}, record is not None
+        if args.action == "stats":
+            return {"by": args.by, "quantiles": store.duration_quantiles(since, by=args.by,
+                                                                         kind=args.kind or "operation")}, True
+        if args.action == "compact":
+            if not args.days:
+                raise ValueError("'history compact' needs --days.")
+            return {"deleted": store.compact(args.days)}, True
+        records = store.search(device=args.device, operation=args.operation, kind=args.kind, success=args.success,
+                               since=since, limit=args.limit)
+        return {"count": len(records), "records": records}, True
+    finally:
+        store.close()
+
+
+def main(argv=None) -> int:
+    """
+    Runs one CLI command.
+
+    :param argv: Command line arguments, without the program name; defaults to sys.argv[1:].
+    :return: Exit status: 0 on success, 1 if any device failed, 2 on invalid input.
+    """
+    args = build_parser().parse_args(argv)
+    level = logging.INFO if args.verbose else logging.WARNING
+    if hasattr(args, 'workers'):
+        # Commands working on devices log through the background writer; the others only read local files
+        from Logs import configure_logging
+        configure_logging(level, sys.stderr, args.log_format, args.log_payload, args.log_sample)
+    else:
+        logging.basicConfig(level=level, stream=sys.stderr, format="%(asctime)s %(levelname)s %(message)s")
+
+    try:
+        devices = Inventory.load(args.inventory)
+        document, success = args.handler(args, devices)
+    except (OSError, ValueError) as e:
+        print(json.dumps({"error": str(e)}), file=sys.stdout)
+        return 2
+
+    if getattr(args, 'metrics', None):
+        from Metrics import metrics
+        metrics.export(args.metrics, "json" if args.metrics.endswith(".json") else "prometheus")
+    print(json.dumps(document, indent=2, default=str))
+    return 0 if success else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,145 @@
+"""
+Module responsible for building IOS configuration command blocks from parameters, without prompting.
+Every builder returns the block as a newline-terminated string, ready to be pushed to a device.
+"""
+import ipaddress
+
+from AddressPlan import DEFAULT_DNS_SERVERS, Pool, parse_network, pool_layout
+from Vlans import trunk_vlan_commands, vlan_bulk_commands
+
+
+def hsrp_commands(interface: str, standby_id, vrouter_ip: str, priority: int = 100, preempt: bool = True) -> str:
+    """
+    Builds the HSRP configuration commands for one interface.
+
+    :param interface: The interface to configure (e.g., Gi0/1).
+    :param standby_id: The ID of the standby group.
+    :param vrouter_ip: The IP address of the Virtual Router.
+    :param priority: The priority of the physical interface.
+    :param preempt: Whether the interface takes over as active when it has the highest priority.
+    :return: The command block.
+    """
+    commands = (
+        f"interface {interface}\n"
+        f"standby {standby_id} ip {vrouter_ip}\n"
+        f"standby {standby_id} priority {int(priority)}\n"
+    )
+    if preempt:
+        commands += f"standby {standby_id} preempt\n"
+    return commands
+
+
+def vlan_commands(vlan_id, vlan_name: str = None) -> str:
+    """
+    Builds the commands creating a VLAN.
+
+    :param vlan_id: The numeric VLAN ID.
+    :param vlan_name: Optional name of the VLAN.
+    :return: The command block.
+    :raises: ValueError if the VLAN ID is not numeric.
+    """
+    if not str(vlan_id).isdigit():
+        raise ValueError(f"VLAN ID should be numeric. Received: {vlan_id}")
+    commands = f"vlan {vlan_id}\n"
+    if vlan_name:
+        commands += f"name {vlan_name}\n"
+    return commands
+
+
+def stp_commands(primary_vlan=None, secondary_vlan=None) -> str:
+    """
+    Builds the Rapid PVST+ commands, optionally making the switch root for the given VLANs.
+
+    :param primary_vlan: Optional VLAN ID for which the switch becomes root primary.
+    :param secondary_vlan: Optional VLAN ID for which the switch becomes root secondary.
+    :return: The command block.
+    """
+    commands = "spanning-tree mode rapid-pvst\n"
+    if primary_vlan is not None:
+        commands += f"spanning-tree vlan {primary_vlan} root primary\n"
+    if secondary_vlan is not None:
+        commands += f"spanning-tree vlan {secondary_vlan} root secondary\n"
+    return commands
+
+
+def port_security_commands(interface: str, vlan) -> str:
+    """
+    Builds the port security commands for an access interface.
+
+    :param interface: The interface to configure (e.g., 'GigabitEthernet0/1').
+    :param vlan: The VLAN ID to allow on the interface.
+    :return: The command block.
+    """
+    return (
+        f"interface {interface}\n"
+        f"switchport mode access\n"
+        f"switchport access vlan {vlan}\n"
+        f"switchport port-security\n"
+    )
+
+
+def ripv2_commands(networks: list, redistribute_static: bool = False) -> str:
+    """
+    Builds the RIPv2 commands advertising the given networks.
+
+    :param networks: The networks to advertise.
+    :param redistribute_static: Whether static routes should be redistributed.
+    :return: The command block.
+    """
+    commands = (
+        "router rip\n"
+        "version 2\n"
+        "no auto-summary\n"
+    )
+    commands += "".join(f"network {network}\n" for network in networks)
+    if redistribute_static:
+        commands += "redistribute static\n"
+    return commands
+
+
+def dhcp_commands(ip: str, lan_id, ip_pool: str, subnet_mask: str, switch_nr: int, router_nr: int,
+                  dns_servers=None) -> str:
+    """
+    Builds the DHCP pool commands, excluding the addresses used by the LAN's routers and switches.
+    Routers use the addresses at the bottom of the network, switches those at the top.
+
+    :param ip: The router's IP address, used as the default router.
+    :param lan_id: The ID of the LAN, used to name the pool.
+    :param ip_pool: The network address of the DHCP pool.
+    :param subnet_mask: The subnet mask (or prefix length) of the pool.
+    :param switch_nr: The number of switches in the LAN.
+    :param router_nr: The number of routers in the LAN.
+    :param dns_servers: Optional DNS servers given to clients; defaults to AddressPlan.DEFAULT_DNS_SERVERS.
+    :return: The command block.
+    :raises: ValueError if the network is invalid or too small for the excluded addresses.
+    """
+    network, prefix = parse_network(ip_pool, subnet_mask)
+    _, excluded = pool_layout(network, prefix, router_nr, switch_nr)
+    pool = Pool(f"LAN{lan_id}", network, prefix, int(ipaddress.IPv4Address(ip)), excluded,
+                DEFAULT_DNS_SERVERS if dns_servers is None else tuple(dns_servers))
+    return pool.commands()
+
+
+def raw_commands(commands) -> str:
+    """
+    Normalises free-form commands into a block.
+
+    :param commands: A string with one command per line, or a list of commands.
+    :return: The command block.
+    """
+    lines = commands.splitlines() if isinstance(commands, str) else list(commands)
+    return "".join(f"{line}\n" for line in lines if line.strip())
+
+
+# Builders by the operation name used in job files
+BUILDERS = {
+    "hsrp": hsrp_commands,
+    "vlan": vlan_commands,
+    "vlans": vlan_bulk_commands,
+    "trunk_vlans": trunk_vlan_commands,
+    "stp": stp_commands,
+    "port_security": port_security_commands,
+    "ripv2": ripv2_commands,
+    "dhcp": dhcp_commands,
+    "commands": raw_commands,
+}
@@ -0,0 +1,213 @@
+"""
+Module responsible for caching each device's running configuration and reducing configuration blocks
+to the lines the device does not have yet.
+"""
+import logging
+import re
+import threading
+from time import monotonic
+
+# First words (or word pairs) of commands opening a configuration section
+SECTION_KEYWORDS = ("interface ", "vlan ", "router ", "line ", "ip dhcp pool ", "ip access-list ",
+                    "class-map ", "policy-map ", "key chain ")
+# Commands that always apply to the global configuration, even when they follow a section header in a block
+GLOBAL_KEYWORDS = ("spanning-tree ", "hostname ", "ip route ", "ip dhcp excluded-address ", "username ",
+                   "enable ", "service ", "banner ", "vtp ", "no spanning-tree ", "no ip route ")
+# Long interface names by their usual abbreviations, so 'interface Gi0/1' matches the running configuration
+INTERFACE_NAMES = (
+    ("te", "TenGigabitEthernet"),
+    ("gi", "GigabitEthernet"),
+    ("fa", "FastEthernet"),
+    ("eth", "Ethernet"),
+    ("e", "Ethernet"),
+    ("lo", "Loopback"),
+    ("po", "Port-channel"),
+    ("vl", "Vlan"),
+    ("se", "Serial"),
+)
+INTERFACE_PATTERN = re.compile(r"^interface\s+([A-Za-z\-]+)\s*(\d.*)$", re.IGNORECASE)
+# Lines of 'show running-config' output that are not configuration
+NOISE_PATTERN = re.compile(r"^(Building configuration|Current configuration|!|end$|\S*[>#]\s*$|(\S*[>#])?(do )?show )")
+
+
+def normalize(line: str) -> str:
+    """
+    Normalises a configuration line for comparison: collapses whitespace and expands interface names.
+
+    :param line: A configuration line.
+    :return: The normalised line.
+    """
+    line = " ".join(line.split())
+    match = INTERFACE_PATTERN.match(line)
+    if match:
+        name, number = match.groups()
+        for abbreviation, full_name in INTERFACE_NAMES:
+            if full_name.lower().startswith(name.lower()) and name.lower().startswith(abbreviation):
+                return f"interface {full_name}{number}"
+    return line
+
+
+def is_section(line: str) -> bool:
+    return line.startswith(SECTION_KEYWORDS)
+
+
+def parse_running_config(text: str) -> dict:
+    """
+    Parses 'show running-config' output into its sections.
+
+    :param text: The command output.
+    :return: Mapping of each top-level line to the set of lines configured under it.
+    """
+    config = {}
+    parent = None
+    for raw in text.splitlines():
+        if not raw.strip() or NOISE_PATTERN.match(raw.strip()):
+            if raw.strip().startswith("!"):
+                parent = None
+            continue
+        if raw[0] in " \t":
+            if parent is not None:
+                config[parent].add(normalize(raw))
+            continue
+        parent = normalize(raw)
+        config.setdefault(parent, set())
+    return config
+
+
+def missing_commands(commands: str, running: dict) -> str:
+    """
+    Reduces a configuration block to the lines missing from the running configuration.
+    Section headers are kept in front of missing child lines; sections that are fully present are dropped.
+    Unknown syntax errs on the side of sending the line.
+
+    :param commands: The configuration block.
+    :param running: Parsed running configuration, as returned by parse_running_config.
+    :return: The reduced block; empty if the device already has the whole configuration.
+    """
+    output = []
+    header = None
+    pending = []
+    closing = None
+
+    def flush():
+        if header is not None:
+            present = running.get(normalize(header))
+            missing = [line for line in pending if present is None or not _present(line, present)]
+            if present is None or missing:
+                output.append(header)
+                output.extend(missing)
+                if closing:
+                    output.append(closing)
+
+    for raw in commands.splitlines():
+        line = raw.strip()
+        if not line:
+            continue
+        if line in ("exit", "end"):
+            if header is not None:
+                closing = line
+                flush()
+                header, pending, closing = None, [], None
+            else:
+                output.append(line)
+            continue
+        if is_section(line):
+            flush()
+            header, pending, closing = line, [], None
+            continue
+        if header is not None and not line.startswith(GLOBAL_KEYWORDS):
+            pending.append(line)
+            continue
+        flush()
+        header, pending, closing = None, [], None
+        if not _present(line, running):
+            output.append(line)
+    flush()
+    return "".join(f"{line}\n" for line in output)
+
+
+def _present(line: str, existing) -> bool:
+    """
+    Tells whether a line is already satisfied by a set (or mapping) of configured lines.
+    A 'no' command is satisfied when the negated line is absent.
+    """
+    line = normalize(line)
+    if line.startswith("no "):
+        return line[3:] not in existing
+    return line in existing
+
+
+class RunningConfigCache:
+    """
+    A class caching the parsed running configuration of devices for a limited time.
+    The configuration is fetched once per device and dropped after every push or when it expires.
+    """
+
+    def __init__(self, ttl=300):
+        """
+        Constructor for RunningConfigCache.
+
+        :param ttl: Seconds a fetched running configuration stays valid.
+        """
+        self.ttl = ttl
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(device):
+        return device.ip, device.port
+
+    def get(self, device) -> dict:
+        """
+        Returns the device's parsed running configuration, fetching it if not cached or expired.
+
+        :param device: The Device to read.
+        :return: Parsed running configuration, as returned by parse_running_config.
+        :raises: RuntimeError if the configuration can not be read.
+        """
+        key = self._key(device)
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry and monotonic() - entry[0] < self.ttl:
+            return entry[1]
+
+        logging.info(f"Fetching running configuration of {device.name} ({device.ip})")
+        with device.session() as connection:
+            output, error = connection.send_command("do show running-config", timeout=120)
+        if error:
+            raise RuntimeError(f"Could not read the running configuration of {device.name}: {error}")
+
+        running = parse_running_config(output)
+        with self._lock:
+            self._entries[key] = (monotonic(), running)
+        return running
+
+    def invalidate(self, device) -> None:
+        """
+        Drops the cached configuration of a device, e.g. after a push.
+
+        :param device: The Device whose configuration changed.
+        """
+        with self._lock:
+            self._entries.pop(self._key(device), None)
+
+    def clear(self) -> None:
+        """
+        Drops all cached configurations.
+        """
+        with self._lock:
+            self._entries.clear()
+
+    def minimal_commands(self, device, commands: str) -> str:
+        """
+        Reduces a configuration block to what the device is missing.
+
+        :param device: The target Device.
+        :param commands: The configuration block.
+        :return: The reduced block; empty if nothing needs to be sent.
+        """
+        return missing_commands(commands, self.get(device))
+
+
+# Cache shared by all devices
+running_config_cache = RunningConfigCache()
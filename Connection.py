@@ -3,7 +3,18 @@ Module responsible for managing SSH connectivity to network devices.
 """
 import paramiko
 import logging
-from time import sleep
+import re
+import select
+import socket
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from time import monotonic, time
+
+from History import history
+from Metrics import metrics
+from Output import CommandSplitter, OutputBuffer
+from Prompt import PROMPT_PATTERN, PASSWORD_PROMPT, ENABLE_REPLY, command_complete, config_mode_commands, \
+    needs_privilege
 
 
 class DeviceConnection:
@@ -11,8 +22,12 @@ class DeviceConnection:
     A class that handles SSH connection logic to network devices.
     Provides methods for establishing the connection, sending commands, and closing the session.
     """
+    __slots__ = ("ip", "port", "username", "password", "prompt_pattern", "command_timeout", "max_output",
+                 "max_channels", "_channel_slots", "client", "shell", "last_used", "last_error",
+                 "last_command_error", "metric_labels")
 
-    def __init__(self, ip, username, password):
+    def __init__(self, ip, username, password, prompt_pattern=None, command_timeout=30, port=22, max_output=None,
+                 max_channels=4):
         """
         Constructor for DeviceConnection.
         Initializes connection details like IP address, username, and password.
@@ -20,12 +35,30 @@ class DeviceConnection:
         :param ip: The IP address of the target device.
         :param username: The username for the SSH connection.
         :param password: The password for the SSH connection.
+        :param prompt_pattern: Optional regex (string or compiled) that marks the end of a command's output.
+        :param command_timeout: Default deadline in seconds for a single read from the device.
+        :param port: The SSH port of the device.
+        :param max_output: Optional default maximum number of characters kept from a command's output.
+        :param max_channels: Maximum number of exec channels open at the same time next to the shell.
         """
         self.ip = ip
+        self.port = port
         self.username = username
         self.password = password
+        self.prompt_pattern = re.compile(prompt_pattern) if isinstance(prompt_pattern, str) else prompt_pattern
+        self.command_timeout = command_timeout
+        self.max_output = max_output
+        self.max_channels = max_channels
+        self._channel_slots = threading.BoundedSemaphore(max(1, max_channels))
         self.client = None
         self.shell = None
+        self.last_used = 0.0
+        # Why the last connection attempt failed, or None
+        self.last_error = None
+        # Error of the last command streamed by iter_lines or pipelined by send_pipelined, or None
+        self.last_command_error = None
+        # Labels attached to the timings of this connection's phases; devices add their name and type
+        self.metric_labels = {"device": ip}
 
     def connect(self, priv_exec_pass, timeout=30) -> None:
         """
@@ -35,68 +68,433 @@ class DeviceConnection:
         :param timeout: Optional timeout for establishing the SSH connection.
         :raises: paramiko.SSHException if connection fails.
         """
+        self.last_error = None
         try:
-            logging.info(f"Attempting to connect to {self.ip}...")
+            logging.info("Attempting to connect to %s...", self.ip)
             self.client = paramiko.SSHClient()
             self.client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-            self.client.connect(self.ip, username=self.username, password=self.password, timeout=timeout)
-            logging.info(f"SSH connection to {self.ip} established.")
+            with metrics.span("tcp_connect", **self.metric_labels):
+                sock = socket.create_connection((self.ip, self.port), timeout=timeout)
+            with metrics.span("ssh_auth", **self.metric_labels):
+                self.client.connect(self.ip, port=self.port, username=self.username, password=self.password,
+                                    timeout=timeout, sock=sock)
+            logging.info("SSH connection to %s established.", self.ip)
+
+            with metrics.span("shell_start", **self.metric_labels):
+                self.shell = self.client.invoke_shell()
+                banner = self._expect(PROMPT_PATTERN, timeout, "the login prompt")
+
+            with metrics.span("enable", **self.metric_labels):
+                if banner.rstrip().endswith('>'):
+                    self.shell.send('ena\n')
+                    reply = self._expect(ENABLE_REPLY, timeout, "the enable password prompt")
+                    if PASSWORD_PROMPT.search(reply):
+                        self.shell.send(f'{priv_exec_pass}\n')
+                        reply = self._expect(PROMPT_PATTERN, timeout, "the privileged exec prompt")
+                    if not reply.rstrip().endswith('#'):
+                        raise paramiko.SSHException("Privileged exec mode was refused by the device.")
 
-            self.shell = self.client.invoke_shell()
-            sleep(1)  # Allow time for shell to initialize
-            self.shell.send(f'ena\n{priv_exec_pass}\nconf t\n')
-            sleep(2)  # Allow time for the device to process privileged exec mode commands
+                # Disable paging so long outputs are not held back by '--More--'
+                self.shell.send('terminal length 0\n')
+                self._expect(PROMPT_PATTERN, timeout, "the privileged exec prompt")
+                self.shell.send('conf t\n')
+                self._expect(PROMPT_PATTERN, timeout, "the configuration mode prompt")
+            self.last_used = monotonic()
 
-            logging.info(f"Entered privileged exec mode on {self.ip}.")
+            logging.info("Entered privileged exec mode on %s.", self.ip)
         except paramiko.AuthenticationException:
-            logging.error(f"Authentication failed while connecting to {self.ip}.")
+            self.last_error = f"Authentication failed while connecting to {self.ip}."
+            logging.error(self.last_error)
             self.close()
         except paramiko.SSHException as e:
-            logging.error(f"SSH error occurred while connecting to {self.ip}: {e}")
+            self.last_error = f"SSH error occurred while connecting to {self.ip}: {e}"
+            logging.error(self.last_error)
             self.close()
         except Exception as e:
-            logging.error(f"An unexpected error occurred during connection to {self.ip}: {e}")
+            self.last_error = f"An unexpected error occurred during connection to {self.ip}: {e}"
+            logging.error(self.last_error)
             self.close()
 
-    def send_command(self, command):
+    def is_alive(self, timeout=5) -> bool:
+        """
+        Checks that the session can still be used: the transport is up and the device answers with a prompt.
+        If the shell was left outside global configuration mode, it is brought back there.
+
+        :param timeout: Deadline in seconds for the device to answer.
+        :return: True if the session is healthy and in configuration mode, False otherwise.
+        """
+        if not self.client or not self.shell:
+            return False
+        transport = self.client.get_transport()
+        if transport is None or not transport.is_active() or self.shell.closed:
+            return False
+
+        try:
+            # Discard anything left unread by a previous caller before probing
+            while self.shell.recv_ready():
+                self.shell.recv(65535)
+            self.shell.send('\n')
+            output, error = self.read_until_prompt(timeout=timeout)
+            if error:
+                return False
+            return_to_config = config_mode_commands(output)
+            if return_to_config is None:
+                return False
+            if return_to_config:
+                output, error = self.send_command(return_to_config, timeout=timeout)
+                if error or not output.rstrip().endswith('(config)#'):
+                    return False
+        except (paramiko.SSHException, OSError) as e:
+            logging.warning("Health check failed for %s: %s", self.ip, e)
+            return False
+        return True
+
+    def _receive(self, buffer: OutputBuffer, deadline: float) -> bool:
+        """
+        Waits for the next chunk of data from the shell and adds it to the buffer.
+
+        :return: False if the deadline passed or the channel closed before data arrived.
+        """
+        while True:
+            if self.shell.recv_ready():
+                buffer.feed(self.shell.recv(65535))
+                return True
+            if self.shell.closed or self.shell.exit_status_ready():
+                return False
+            remaining = deadline - monotonic()
+            if remaining <= 0:
+                return False
+            # Block until the channel has data or the deadline passes
+            select.select([self.shell], [], [], remaining)
+
+    def read_until(self, done, timeout=None, buffer: OutputBuffer = None):
+        """
+        Reads from the shell until the received data satisfies a condition or the deadline passes.
+        Returns as soon as the condition holds instead of waiting for a fixed delay.
+
+        :param done: Callable receiving the OutputBuffer and returning True once the output is complete.
+        :param timeout: Deadline in seconds for this read; defaults to the connection's command timeout.
+        :param buffer: Optional OutputBuffer to read into; a new one honouring the connection's size cap is used
+                       by default.
+        :return: A tuple of (buffer, completed). Completed is False if the deadline passed or the channel closed.
+        """
+        buffer = buffer or OutputBuffer(self.max_output)
+        deadline = monotonic() + (self.command_timeout if timeout is None else timeout)
+        while not done(buffer):
+            if not self._receive(buffer, deadline):
+                buffer.finish()
+                return buffer, False
+        buffer.finish()
+        return buffer, True
+
+    def read_until_prompt(self, pattern=None, timeout=None):
+        """
+        Reads from the shell until a prompt (or the given pattern) shows up at the end of the output.
+
+        :param pattern: Optional regex overriding the connection's prompt pattern for this call.
+        :param timeout: Deadline in seconds for this read; defaults to the connection's command timeout.
+        :return: A tuple of (output, error). Error will be None if the prompt was seen in time.
+        """
+        pattern = re.compile(pattern) if isinstance(pattern, str) else pattern
+        pattern = pattern or self.prompt_pattern or PROMPT_PATTERN
+        buffer, completed = self.read_until(lambda received: pattern.search(received.tail) is not None, timeout)
+        if not completed:
+            return buffer.getvalue(), f"Timed out waiting for the prompt on {self.ip}."
+        return buffer.getvalue(), None
+
+    def _expect(self, pattern, timeout, description) -> str:
+        """
+        Reads until the pattern is seen during the login sequence.
+
+        :raises: paramiko.SSHException if the pattern is not seen before the deadline.
+        """
+        output, error = self.read_until_prompt(pattern, timeout)
+        if error:
+            raise paramiko.SSHException(f"Timed out waiting for {description}.")
+        return output
+
+    def _completion(self, command: str, expect=None):
+        """
+        Builds the condition telling when the output of a command block is complete.
+        """
+        if expect is not None:
+            pattern = re.compile(expect) if isinstance(expect, str) else expect
+            return lambda received: pattern.search(received.tail) is not None
+        prompt = self.prompt_pattern or PROMPT_PATTERN
+        expected_prompts = command.count('\n')
+        return lambda received: command_complete(received, expected_prompts, prompt)
+
+    def _no_session_error(self) -> str:
+        """
+        Describes why there is no session, including the reason the last connection attempt failed.
+        """
+        if self.last_error:
+            return f"No active SSH session: {self.last_error}"
+        return "No active SSH session. Please establish a connection first."
+
+    def send_command(self, command, timeout=None, expect=None, max_output=None, sink=None):
         """
         Sends a command to the connected device and returns the output.
+        Every line of the command produces a new prompt, so the read completes once all of them are back.
 
         :param command: The command to send.
+        :param timeout: Deadline in seconds for the whole command; defaults to the connection's command timeout.
+        :param expect: Optional regex marking the end of the output instead of the prompt.
+        :param max_output: Optional maximum number of characters kept; defaults to the connection's cap.
+        :param sink: Optional callable or file-like object receiving the output as it arrives. The output is then
+                     not kept, and an empty string is returned in its place.
         :return: A tuple of (output, error). Error will be None if successful, otherwise contains error message.
         """
         if not self.shell:
-            error_msg = "No active SSH session. Please establish a connection first."
+            error_msg = self._no_session_error()
             logging.error(error_msg)
             return None, error_msg
 
         try:
-            logging.info(f"Sending command to {self.ip}: {command}")
-            self.shell.send(command + '\n')
-            sleep(2)  # Allow time for the command to execute
+            # Lazily formatted; the command block goes along as payload, truncated by Logs when written
+            logging.info("Sending command to %s", self.ip, extra={"payload": command})
+            command = command if command.endswith('\n') else command + '\n'
+            started_at = time()
+            started = monotonic()
+            self.shell.send(command)
 
-            output = ""
-            while self.shell.recv_ready():
-                output += self.shell.recv(65535).decode('utf-8')
+            buffer = OutputBuffer(self.max_output if max_output is None else max_output, sink)
+            buffer, completed = self.read_until(self._completion(command, expect), timeout, buffer)
+            output = buffer.getvalue()
+            metrics.observe("command", monotonic() - started, error=None if completed else "timeout",
+                            **self.metric_labels)
+            if buffer.truncated:
+                logging.warning("Output from %s was truncated to %d of %d characters.", self.ip, len(output),
+                                buffer.size)
 
-            logging.info(f"Command executed successfully on {self.ip}.")
+            self.last_used = monotonic()
+            error = None if completed else f"Timed out waiting for the prompt on {self.ip}."
+            error = error or buffer.error
+            history.record(kind="command", commands=command.rstrip('\n'), output=output, error=error,
+                           started=started_at, duration=self.last_used - started, **self.metric_labels)
+            if error:
+                logging.error("Command failed on %s: %s", self.ip, error, extra={"payload": output})
+                return output, error
+
+            logging.info("Command executed successfully on %s.", self.ip)
             return output, None
         except paramiko.SSHException as e:
-            logging.error(f"Failed to send command to {self.ip}: {e}")
+            logging.error("Failed to send command to %s: %s", self.ip, e)
             return None, str(e)
         except Exception as e:
-            logging.error(f"An unexpected error occurred while sending command to {self.ip}: {e}")
+            logging.error("An unexpected error occurred while sending command to %s: %s", self.ip, e)
             return None, str(e)
 
+    def iter_lines(self, command, timeout=None, expect=None):
+        """
+        Sends a command and yields its output line by line as it arrives, without keeping it in memory.
+        Once the generator is exhausted, last_command_error holds the error (timeout or IOS error marker), or None.
+        last_error keeps the reason of the last failed connection attempt.
+
+        :param command: The command to send.
+        :param timeout: Deadline in seconds for the whole command; defaults to the connection's command timeout.
+        :param expect: Optional regex marking the end of the output instead of the prompt.
+        :return: Generator of output lines, without line terminators.
+        """
+        if not self.shell:
+            self.last_command_error = self._no_session_error()
+            logging.error(self.last_command_error)
+            return
+        self.last_command_error = None
+
+        logging.info("Streaming command output from %s", self.ip, extra={"payload": command})
+        command = command if command.endswith('\n') else command + '\n'
+        lines = []
+        buffer = OutputBuffer(sink=lambda text: None, on_line=lines.append)
+        done = self._completion(command, expect)
+        started_at = time()
+        started = monotonic()
+        deadline = started + (self.command_timeout if timeout is None else timeout)
+        self.shell.send(command)
+
+        while not done(buffer):
+            if not self._receive(buffer, deadline):
+                self.last_command_error = f"Timed out waiting for the prompt on {self.ip}."
+                break
+            yield from lines
+            lines.clear()
+        buffer.finish()
+        yield from lines
+
+        self.last_used = monotonic()
+        metrics.observe("command", self.last_used - started, error=self.last_command_error, **self.metric_labels)
+        self.last_command_error = self.last_command_error or buffer.error
+        history.record(kind="command", commands=command.rstrip('\n'), error=self.last_command_error,
+                       started=started_at, duration=self.last_used - started, **self.metric_labels)
+        if self.last_command_error:
+            logging.error("Command failed on %s: %s", self.ip, self.last_command_error)
+
+    def send_pipelined(self, commands, window=64, timeout=None, stop_on_error=False) -> list:
+        """
+        Sends commands one per line, keeping up to 'window' of them in flight ahead of the device's prompts,
+        and splits the returned stream into one result per command at the prompt following each of them.
+        Long configuration blocks go out at line rate while every line stays attributable.
+
+        :param commands: A string with one command per line, or a list of commands.
+        :param window: Maximum number of commands sent but not answered yet.
+        :param timeout: Seconds to wait for the next prompt; defaults to the connection's command timeout.
+        :param stop_on_error: Stop sending after the first command rejected by the device.
+        :return: A list of CommandResult, one per command. The latency of a command is the time from its own
+                 send to the arrival of the output holding the prompt that ends it, so it includes the time spent
+                 queued behind earlier commands. Commands left unanswered get an error and no latency.
+        """
+        lines = commands.splitlines() if isinstance(commands, str) else list(commands)
+        splitter = CommandSplitter([line.strip() for line in lines if line.strip()])
+        results = splitter.results
+        if not self.shell:
+            error_msg = self._no_session_error()
+            logging.error(error_msg)
+            for result in results:
+                result.error = error_msg
+            return results
+        self.last_command_error = None
+
+        logging.info("Pipelining %d commands to %s with a window of %d.", len(results), self.ip, window,
+                     extra={"payload": lines})
+        buffer = OutputBuffer(sink=lambda text: None, on_line=splitter)
+        timeout = self.command_timeout if timeout is None else timeout
+        limit = len(results)
+        sent_at = []
+        answered = 0
+        try:
+            while answered < limit:
+                if len(sent_at) < limit and len(sent_at) - answered < window:
+                    batch = results[len(sent_at):min(limit, answered + window)]
+                    self.shell.send("".join(f"{result.command}\n" for result in batch))
+                    sent_at.extend([monotonic()] * len(batch))
+                if not self._receive(buffer, monotonic() + timeout):
+                    break
+                # Prompts arriving in the same output are only known to be back by now
+                now = monotonic()
+                for index in range(answered, min(buffer.prompt_count(), len(sent_at))):
+                    results[index].latency = now - sent_at[index]
+                    metrics.observe("command", results[index].latency, **self.metric_labels)
+                answered = max(answered, min(buffer.prompt_count(), len(sent_at)))
+                if stop_on_error and buffer.error:
+                    limit = len(sent_at)
+            buffer.finish()
+            splitter.finish()
+        except (paramiko.SSHException, OSError) as e:
+            logging.error("Failed to send commands to %s: %s", self.ip, e)
+            self.last_command_error = str(e)
+
+        self.last_used = monotonic()
+        for index, result in enumerate(results[answered:], start=answered):
+            if index >= len(sent_at):
+                result.error = "Not sent: an earlier command failed." if stop_on_error and buffer.error \
+                    else f"Not sent to {self.ip}."
+            else:
+                result.error = f"Timed out waiting for the prompt on {self.ip}."
+        finished_at = time()
+        for index, result in enumerate(results):
+            # Every command started when it was sent
+            history.record(kind="command", commands=result.command, output=result.output, error=result.error,
+                           started=finished_at - (self.last_used - sent_at[index]) if index < len(sent_at) else None,
+                           duration=result.latency, **self.metric_labels)
+        failed = sum(1 for result in results if result.error)
+        if failed:
+            logging.error("%d of %d pipelined commands failed on %s.", failed, len(results), self.ip)
+        return results
+
+    def run_exec(self, command, timeout=None, max_output=None):
+        """
+        Runs one read-only command on its own exec channel over the connection's transport, next to the shell.
+        No new key exchange or authentication is needed, and several commands can run at the same time,
+        up to the connection's channel limit. The command runs in exec mode at the account's privilege level,
+        without 'enable': commands needing privilege level 15 (e.g. 'show running-config', see Prompt.needs_privilege)
+        fail unless the account is configured with 'privilege 15'. run_parallel sends those over the shell instead.
+
+        :param command: The command (e.g. 'show ip route'); a leading 'do ' is dropped.
+        :param timeout: Deadline in seconds for the command; defaults to the connection's command timeout.
+        :param max_output: Optional maximum number of characters kept; defaults to the connection's cap.
+        :return: A tuple of (output, error). Error will be None if successful, otherwise contains error message.
+        """
+        transport = self.client.get_transport() if self.client else None
+        if transport is None or not transport.is_active():
+            error_msg = self._no_session_error()
+            logging.error(error_msg)
+            return None, error_msg
+
+        command = command[3:] if command.startswith("do ") else command
+        timeout = self.command_timeout if timeout is None else timeout
+        with self._channel_slots:
+            started_at = time()
+            started = monotonic()
+            deadline = started + timeout
+            buffer = OutputBuffer(self.max_output if max_output is None else max_output)
+            completed = False
+            channel = None
+            try:
+                logging.info("Running '%s' on an exec channel to %s", command, self.ip)
+                channel = transport.open_session(timeout=timeout)
+                channel.exec_command(command)
+                while not completed:
+                    remaining = deadline - monotonic()
+                    if remaining <= 0:
+                        break
+                    if not select.select([channel], [], [], remaining)[0]:
+                        continue
+                    data = channel.recv(65535)
+                    completed = not data
+                    buffer.feed(data)
+                buffer.finish()
+            except (paramiko.SSHException, OSError) as e:
+                logging.error("Exec channel to %s failed: %s", self.ip, e)
+                return None, str(e)
+            finally:
+                if channel is not None:
+                    channel.close()
+            duration = monotonic() - started
+            metrics.observe("exec", duration, error=None if completed else "timeout", **self.metric_labels)
+
+        output = buffer.getvalue()
+        error = None if completed else f"Timed out waiting for '{command}' on {self.ip}."
+        error = error or buffer.error
+        history.record(kind="command", commands=command, output=output, error=error, started=started_at,
+                       duration=duration, **self.metric_labels)
+        if error:
+            logging.error("Command failed on %s: %s", self.ip, error, extra={"payload": output})
+        return output, error
+
+    def run_parallel(self, commands, timeout=None) -> dict:
+        """
+        Runs read-only commands concurrently, each on its own exec channel, up to the connection's channel limit.
+        Commands needing privilege level 15 (see Prompt.needs_privilege) run one after the other over the shell,
+        which is in privileged mode, while the others run on exec channels. The caller must hold the session.
+
+        :param commands: The commands (e.g. ['show vlan brief', 'show standby brief']).
+        :param timeout: Deadline in seconds for each command; defaults to the connection's command timeout.
+        :return: Mapping of each command to its (output, error) tuple, in the order given.
+        """
+        commands = list(dict.fromkeys(commands))
+        if not commands:
+            return {}
+        on_shell = [command for command in commands if needs_privilege(command)]
+        on_channels = [command for command in commands if not needs_privilege(command)]
+        outputs = {}
+        workers = min(max(1, self.max_channels), len(on_channels) or 1)
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f"exec-{self.ip}") as pool:
+            futures = [pool.submit(self.run_exec, command, timeout) for command in on_channels]
+            for command in on_shell:
+                shell_command = command if command.startswith("do ") else f"do {command}"
+                outputs[command] = self.send_command(shell_command, timeout=timeout)
+            outputs.update((command, future.result()) for command, future in zip(on_channels, futures))
+        return {command: outputs[command] for command in commands}
+
     def close(self) -> None:
         """
         Closes the SSH connection and cleans up resources.
         """
         if self.client:
-            logging.info(f"Closing SSH connection to {self.ip}.")
+            logging.info("Closing SSH connection to %s.", self.ip)
             self.client.close()
             self.client = None
             self.shell = None
-            logging.info(f"SSH connection to {self.ip} closed.")
+            logging.info("SSH connection to %s closed.", self.ip)
         else:
-            logging.info(f"No active connection to close for {self.ip}.")
+            logging.info("No active connection to close for %s.", self.ip)
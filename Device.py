@@ -1,12 +1,37 @@
 """
 Module responsible for handling common functionality between different device types, such as HSRP configuration.
 """
+import asyncio
 import logging
+import threading
+from time import monotonic, time
+
+from AsyncConnection import AsyncDeviceConnection
+from Commands import hsrp_commands
+from ConfigCache import running_config_cache
 from Connection import DeviceConnection
+from History import history
+from Metrics import metrics
+from Parsers import stream
+from Session import session_manager
+from Verification import hsrp_converged, wait_for
+
+# Guards the creation of connections, which happens once per device
+_connection_lock = threading.Lock()
 
 
 class Device:
-    def __init__(self, name: str, ip: str, username: str, password: str, priv_exec_pass: str):
+    """
+    A network device. Instances are slotted and create their connection on first use,
+    so a large inventory can be turned into devices before any session is opened.
+    """
+    __slots__ = ("name", "ip", "username", "password", "priv_exec_pass", "port", "max_channels", "sessions",
+                 "async_connection", "_async_lock", "_connection", "__weakref__")
+    # Name of the device type in metrics and history records; overridden by every device class
+    device_type = "device"
+
+    def __init__(self, name: str, ip: str, username: str, password: str, priv_exec_pass: str, sessions=None,
+                 port: int = 22, max_channels: int = 4):
         """
         Constructor for Device class.
 
@@ -15,25 +40,272 @@ class Device:
         :param username: The username for the device.
         :param password: The password for the device.
         :param priv_exec_pass: The password for privileged exec mode.
+        :param sessions: Optional SessionManager; the shared one is used by default.
+        :param port: The SSH port of the device.
+        :param max_channels: Maximum number of read-only commands run on the device at the same time.
         """
         self.name = name
         self.ip = ip
         self.username = username
         self.password = password
         self.priv_exec_pass = priv_exec_pass
-        self.connection = DeviceConnection(ip, username, password)
+        self.port = port
+        self.max_channels = max_channels
+        self.sessions = sessions or session_manager
+        self.async_connection = None
+        self._async_lock = None
+        self._connection = None
+
+    @property
+    def connection(self) -> DeviceConnection:
+        """
+        :return: The device's DeviceConnection, created on first use; it is not connected until a session needs it.
+        """
+        connection = self._connection
+        if connection is None:
+            with _connection_lock:
+                if self._connection is None:
+                    connection = DeviceConnection(self.ip, self.username, self.password, port=self.port,
+                                                  max_channels=self.max_channels)
+                    connection.metric_labels = self.metric_labels()
+                    self._connection = connection
+                connection = self._connection
+        return connection
+
+    @property
+    def connected(self) -> bool:
+        """
+        :return: True if the device's session is open. Does not create the connection.
+        """
+        return self._connection is not None and self._connection.shell is not None
+
+    def metric_labels(self, operation: str = None) -> dict:
+        """
+        :param operation: Optional name of the operation being timed.
+        :return: Labels identifying the device in Metrics spans.
+        """
+        labels = {"device": self.name, "device_type": self.device_type}
+        if operation:
+            labels["operation"] = operation
+        return labels
+
+    def record_history(self, operation: str, commands, output, error, started_at: float, started: float) -> None:
+        """
+        Records the outcome of an operation in the shared history store.
+
+        :param operation: Name of the operation.
+        :param commands: The commands of the operation.
+        :param output: The output of the device.
+        :param error: Error message, or None if the operation succeeded.
+        :param started_at: Wall clock time the operation started.
+        :param started: Monotonic time the operation started.
+        """
+        history.record(commands=commands, output=output, error=error, started=started_at,
+                       duration=monotonic() - started, **self.metric_labels(operation))
+
+    def session(self):
+        """
+        Borrows the device's persistent session, connecting or reconnecting only when needed.
+
+        :return: A context manager yielding the DeviceConnection in global configuration mode.
+        """
+        return self.sessions.session(self)
+
+    def close_session(self) -> None:
+        """
+        Closes the device's persistent session, if one is open.
+
+        :return: None
+        """
+        self.sessions.close(self)
+
+    def show_commands(self, commands, timeout=None) -> dict:
+        """
+        Runs read-only commands concurrently over the device's session, each on its own exec channel,
+        without repeating the key exchange and authentication. Exec channels run at the account's privilege level;
+        commands needing privilege level 15, such as 'show running-config', go over the enabled shell instead.
+
+        :param commands: The commands (e.g. ['show vlan brief', 'show ip route']).
+        :param timeout: Deadline in seconds for each command.
+        :return: Mapping of each command to its (output, error) tuple.
+        """
+        started_at, started = time(), monotonic()
+        with metrics.span("operation", **self.metric_labels("show")):
+            with self.session() as connection:
+                outputs = connection.run_parallel(commands, timeout=timeout)
+        errors = [f"{command}: {error}" for command, (_, error) in outputs.items() if error]
+        self.record_history("show", list(outputs), "\n".join(output or "" for output, _ in outputs.values()),
+                            "; ".join(errors) or None, started_at, started)
+        return outputs
+
+    def show_records(self, command: str, timeout=None) -> tuple:
+        """
+        Runs a show command over the device's session and parses its output while it arrives.
+
+        :param command: A show command with a parser, e.g. 'show standby brief' (see Parsers.PARSERS).
+        :param timeout: Deadline in seconds for the command.
+        :return: A tuple of (list of records, error). Error will be None if successful.
+        :raises: ValueError if there is no parser for the command.
+        """
+        with metrics.span("operation", **self.metric_labels("show")):
+            with self.session() as connection:
+                records = list(stream(connection, command, timeout=timeout))
+                return records, connection.last_command_error
+
+    def verify(self, conditions: list, timeout: float = 60, **polling) -> tuple:
+        """
+        Waits over the device's session until the protocol state described by the conditions is reached.
+
+        :param conditions: List of Verification.Condition (e.g. Verification.hsrp_converged('Gi0/1', 1)).
+        :param timeout: Deadline in seconds.
+        :param polling: Further arguments of Verification.wait_for (interval, max_interval, backoff).
+        :return: A tuple of (outcome, error). Error will be None once every condition is met.
+        """
+        return wait_for(self, conditions, timeout, **polling)
+
+    def report_convergence(self, conditions: list, timeout: float = 60) -> None:
+        """
+        Verifies the conditions after an interactive change and prints the outcome.
+
+        :param conditions: List of Verification.Condition.
+        :param timeout: Deadline in seconds.
+        :return: None
+        """
+        print(f"Waiting up to {timeout:.0f}s for {self.name} to converge...")
+        outcome, error = self.verify(conditions, timeout)
+        if error:
+            print(f"Verification failed: {error}")
+        else:
+            print(f"Verified after {outcome['duration']:.1f}s: {'; '.join(outcome['met'])}")
+
+    def push_config(self, commands: str, minimal: bool = False, operation: str = "push_config"):
+        """
+        Sends a block of configuration commands to the device over its session, without prompting.
+        The cached running configuration of the device is dropped after every push.
+
+        :param commands: The configuration commands, one per line.
+        :param minimal: Only send the lines missing from the device's cached running configuration,
+                        and nothing at all if the device already has all of them.
+        :param operation: Name under which the push is timed in the metrics (e.g. 'vlan').
+        :return: A tuple of (output, error). Error will be None if successful.
+        """
+        started_at, started = time(), monotonic()
+        with metrics.span("operation", **self.metric_labels(operation)):
+            output, error = self._push_config(commands, minimal, operation)
+        self.record_history(operation, commands, output, error, started_at, started)
+        return output, error
+
+    def _push_config(self, commands: str, minimal: bool, operation: str):
+        """
+        Diffs and sends the block for push_config.
+        """
+        if minimal:
+            try:
+                with metrics.span("config_diff", **self.metric_labels(operation)):
+                    commands = running_config_cache.minimal_commands(self, commands)
+            except RuntimeError as e:
+                logging.error("Error while comparing with the running configuration: %s", e)
+                return None, str(e)
+            if not commands:
+                logging.info("%s (%s) already has this configuration, nothing to push.", self.name, self.ip)
+                return "", None
+
+        logging.info("Pushing configuration to %s (%s)", self.name, self.ip)
+        try:
+            with self.session() as connection:
+                return connection.send_command(commands)
+        finally:
+            running_config_cache.invalidate(self)
+
+    def push_pipelined(self, commands, window: int = 64, stop_on_error: bool = False,
+                       operation: str = "push_config") -> list:
+        """
+        Sends a configuration block line by line over the device's session, keeping several lines in flight,
+        and reports the outcome of every line. Suited to blocks of thousands of lines such as ACLs.
+
+        :param commands: A string with one command per line, or a list of commands.
+        :param window: Maximum number of lines sent ahead of the device's prompts.
+        :param stop_on_error: Stop sending after the first line rejected by the device.
+        :param operation: Name under which the push is timed in the metrics.
+        :return: A list of CommandResult (command, output, error, latency), one per line.
+        """
+        logging.info("Pushing pipelined configuration to %s (%s)", self.name, self.ip)
+        started_at, started = time(), monotonic()
+        with metrics.span("operation", **self.metric_labels(operation)):
+            try:
+                with self.session() as connection:
+                    results = connection.send_pipelined(commands, window=window, stop_on_error=stop_on_error)
+            finally:
+                running_config_cache.invalidate(self)
+        errors = [result.error for result in results if result.error]
+        error = f"{len(errors)} of {len(results)} commands failed: {errors[0]}" if errors else None
+        self.record_history(operation, [result.command for result in results],
+                            "\n".join(result.output for result in results), error, started_at, started)
+        return results
+
+    async def async_push_config(self, commands: str, operation: str = "push_config"):
+        """
+        Coroutine counterpart of push_config, using the asyncio connection backend.
+        The async session is kept open between calls and reconnected if it fails its health check.
+
+        :param commands: The configuration commands, one per line.
+        :param operation: Name under which the push is timed in the metrics (e.g. 'vlan').
+        :return: A tuple of (output, error). Error will be None if successful.
+        """
+        if self._async_lock is None:
+            self._async_lock = asyncio.Lock()
+
+        started_at, started = time(), monotonic()
+        with metrics.span("operation", **self.metric_labels(operation)):
+            async with self._async_lock:
+                if self.async_connection is None:
+                    self.async_connection = AsyncDeviceConnection(self.ip, self.username, self.password,
+                                                                  port=self.port)
+                    self.async_connection.metric_labels = self.metric_labels()
+                connection = self.async_connection
+                if connection.shell and not await connection.is_alive():
+                    logging.warning("Async session to %s (%s) failed its health check, reconnecting.",
+                                    self.name, self.ip)
+                    connection.close()
+                if not connection.shell:
+                    await connection.connect(self.priv_exec_pass)
+
+                logging.info("Pushing configuration to %s (%s)", self.name, self.ip, extra={"payload": commands})
+                output, error = await connection.send_command(commands)
+        self.record_history(operation, commands, output, error, started_at, started)
+        return output, error
+
+    def close_async_session(self) -> None:
+        """
+        Closes the device's asyncio session, if one is open.
+
+        :return: None
+        """
+        if self.async_connection and self.async_connection.shell:
+            self.async_connection.close()
+
+    async def async_config_HSRP(self, interface: str, standby_id, vrouter_ip: str, priority: int = 100):
+        """
+        Coroutine configuring HSRP on an interface without prompting.
+
+        :param interface: The interface to configure (e.g., Gi0/1).
+        :param standby_id: The ID of the standby group.
+        :param vrouter_ip: The IP address of the Virtual Router.
+        :param priority: The priority of the physical interface.
+        :return: A tuple of (output, error). Error will be None if successful.
+        """
+        logging.info("Starting HSRP configuration on device %s (%s)", self.name, self.ip)
+        return await self.async_push_config(hsrp_commands(interface, standby_id, vrouter_ip, priority), "hsrp")
 
     def config_HSRP(self) -> None:
         """
         Method for configuring HSRP (Hot Standby Router Protocol), common for both routers and switches.
-        This method establishes a connection, prompts for HSRP settings, sends the configuration commands,
-        and then closes the connection.
+        This method prompts for HSRP settings and sends the configuration commands over the device's session.
 
         :return: None
         """
         try:
             logging.info(f"Starting HSRP configuration on device {self.name} ({self.ip})")
-            self.connection.connect(self.priv_exec_pass)
 
             # Gather required HSRP information from the user
             interface = input("Enter the ID of the interface (e.g., Gi0/1): ").strip()
@@ -50,26 +322,19 @@ class Device:
                 priority = 100
 
             # Construct the HSRP configuration commands
-            hsrp_config_commands = (
-                f"interface {interface}\n"
-                f"standby {standby_id} ip {vrouter_ip}\n"
-                f"standby {standby_id} priority {priority}\n"
-                f"standby {standby_id} preempt\n"
-            )
+            hsrp_config_commands = hsrp_commands(interface, standby_id, vrouter_ip, priority)
 
             # Send the HSRP configuration to the device
-            stdout, stderr = self.connection.send_command(hsrp_config_commands)
+            stdout, stderr = self.push_config(hsrp_config_commands, operation="hsrp")
 
             if stderr:
                 logging.error(f"Error during HSRP configuration: {stderr}")
             else:
                 logging.info(f"HSRP configuration completed successfully on {self.name} ({self.ip})")
                 print(f"HSRP configuration output:\n{stdout}")
+                # Only this side is configured here, so the peer may not be up yet
+                self.report_convergence([hsrp_converged(interface, standby_id, peer=False)])
 
         except Exception as e:
             logging.error(f"An error occurred while configuring HSRP on {self.name} ({self.ip}): {e}")
             raise
-        finally:
-            # Ensure the connection is closed even if an error occurs
-            logging.info(f"Closing connection to device {self.name} ({self.ip})")
-            self.connection.close()
\ No newline at end of file
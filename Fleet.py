@@ -0,0 +1,335 @@
+"""
+Module responsible for running one operation against many devices from the inventory concurrently.
+"""
+import asyncio
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from sys import intern
+from time import monotonic
+
+from Inventory import device_role, select_targets
+
+
+def create_device(record: dict):
+    """
+    Builds a Router or Switch object from an inventory record.
+    Credentials are interned, so devices sharing them hold one copy of each string.
+
+    :param record: Device data dictionary from deviceDetails.json.
+    :return: A Router or Switch instance.
+    :raises: ValueError if the device type is not recognised.
+    """
+    # Imported here so selecting and planning work without loading the SSH stack
+    from Router import Router
+    from Switch import Switch
+
+    role = device_role(record['type'])
+    args = (record['name'], record['ip'], intern(record['username']), intern(record['password']),
+            intern(record['privileged_password']))
+    options = {'port': record.get('port', 22), 'max_channels': record.get('max_channels', 4)}
+    if role == "router":
+        return Router(*args, **options)
+    if role in ("switch", "multilayer_switch"):
+        return Switch(*args, **options)
+    raise ValueError(f"Unknown device type '{record['type']}' for IP: {record['ip']}")
+
+
+class DeviceRegistry:
+    """
+    A class keeping one Device per inventory record, created on first use and returned again afterwards,
+    so an operation reuses the sessions opened by the ones before it. Can be passed as a FleetRunner device_factory.
+    Devices are keyed by the IP and SSH port of their record, as several records may share a name.
+    """
+    __slots__ = ("factory", "_devices", "_lock")
+
+    def __init__(self, factory=create_device):
+        """
+        Constructor for DeviceRegistry.
+
+        :param factory: Callable building a Device object from an inventory record.
+        """
+        self.factory = factory
+        self._devices = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(record: dict) -> tuple:
+        """
+        :param record: Device data dictionary.
+        :return: The (IP, SSH port) the record's device is kept under.
+        """
+        return record['ip'], record.get('port', 22)
+
+    def __call__(self, record: dict):
+        """
+        :param record: Device data dictionary.
+        :return: The Device of the record, built by the factory the first time its IP and port are seen.
+        """
+        key = self.key(record)
+        device = self._devices.get(key)
+        if device is None:
+            with self._lock:
+                device = self._devices.get(key)
+                if device is None:
+                    device = self._devices[key] = self.factory(record)
+        return device
+
+    def __len__(self) -> int:
+        return len(self._devices)
+
+    def __contains__(self, record: dict) -> bool:
+        return self.key(record) in self._devices
+
+    def get(self, record: dict):
+        """
+        :param record: Device data dictionary.
+        :return: The Device, or None if it was not created yet.
+        """
+        return self._devices.get(self.key(record))
+
+    def discard(self, record: dict) -> None:
+        """
+        Forgets a device, closing its session if one is open.
+
+        :param record: Device data dictionary.
+        """
+        with self._lock:
+            device = self._devices.pop(self.key(record), None)
+        if device is not None and device.connected:
+            device.close_session()
+
+    def close(self) -> None:
+        """
+        Forgets every device, closing the sessions that are open.
+        """
+        with self._lock:
+            devices = list(self._devices.values())
+            self._devices.clear()
+        for device in devices:
+            if device.connected:
+                device.close_session()
+
+
+@dataclass
+class DeviceResult:
+    """
+    Outcome of an operation on a single device.
+    """
+    name: str
+    ip: str
+    type: str
+    success: bool
+    duration: float
+    output: object = None
+    error: str = None
+
+
+@dataclass
+class FleetReport:
+    """
+    Aggregated outcome of an operation across a set of devices.
+    """
+    results: list = field(default_factory=list)
+    duration: float = 0.0
+
+    @property
+    def succeeded(self) -> list:
+        return [result for result in self.results if result.success]
+
+    @property
+    def failed(self) -> list:
+        return [result for result in self.results if not result.success]
+
+    def summary(self) -> str:
+        """
+        Renders the report as a human readable table.
+
+        :return: The report text.
+        """
+        lines = [f"{len(self.succeeded)}/{len(self.results)} devices succeeded in {self.duration:.2f}s"]
+        for result in self.results:
+            status = "OK" if result.success else f"FAILED: {result.error}"
+            lines.append(f"  {result.name:<16} {result.ip:<16} {result.duration:>7.2f}s  {status}")
+        return "\n".join(lines)
+
+
+class FleetRunner:
+    """
+    A class that runs an operation on many devices using a bounded pool of worker threads,
+    or as coroutines on one event loop with run_async.
+    Besides the global worker limit, each device type can have its own concurrency limit.
+    """
+
+    def __init__(self, max_workers=10, per_type_limits=None, device_factory=create_device, preflight=None):
+        """
+        Constructor for FleetRunner.
+
+        :param max_workers: Maximum number of devices worked on at the same time.
+        :param per_type_limits: Optional mapping of device type to its maximum concurrency (e.g. {'router': 2}).
+        :param device_factory: Callable building a Device object from an inventory record. The sessions of the
+                               devices it builds are closed after their operation, unless it is a DeviceRegistry,
+                               which keeps them open for the next operation.
+        :param preflight: Optional Preflight; unreachable targets then fail at once instead of being connected to.
+        """
+        self.max_workers = max_workers
+        self.per_type_limits = {t.lower(): limit for t, limit in (per_type_limits or {}).items()}
+        self.device_factory = device_factory
+        self.preflight = preflight
+
+    def run(self, targets: list, operation) -> FleetReport:
+        """
+        Runs the operation on every target and waits for all of them to finish.
+
+        :param targets: List of device data dictionaries.
+        :param operation: Callable receiving a Device. It fails by raising, or by returning an (output, error) tuple
+                          with a non-empty error.
+        :return: A FleetReport with one result per target, in target order.
+        """
+        limits = {
+            device_type: threading.BoundedSemaphore(limit)
+            for device_type, limit in self.per_type_limits.items()
+        }
+        started = monotonic()
+        logging.info("Running %s on %d devices.", getattr(operation, '__name__', 'operation'), len(targets))
+        # Targets are told apart by their index, as several records may share a name
+        _, unreachable = self.preflight.check(targets) if self.preflight else (targets, {})
+
+        with ThreadPoolExecutor(max_workers=max(1, self.max_workers), thread_name_prefix="fleet") as pool:
+            futures = {}
+
+            def submit(index, record, limit=None):
+                future = futures[index] = pool.submit(self._run_one, record, operation)
+                if limit:
+                    future.add_done_callback(lambda _: limit.release())
+
+            # A device waits for a slot of its type before it is handed to the pool, so a saturated type never
+            # holds worker threads that devices of other types could use
+            limited = {}
+            unlimited = []
+            for index, record in enumerate(targets):
+                if index in unreachable:
+                    continue
+                device_type = record['type'].lower()
+                if device_type in limits:
+                    limited.setdefault(device_type, []).append((index, record))
+                else:
+                    unlimited.append((index, record))
+
+            def feed(device_type, entries):
+                for index, record in entries:
+                    limits[device_type].acquire()
+                    submit(index, record, limits[device_type])
+
+            feeders = [threading.Thread(target=feed, args=item, name=f"fleet-{item[0]}", daemon=True)
+                       for item in limited.items()]
+            for feeder in feeders:
+                feeder.start()
+            for index, record in unlimited:
+                submit(index, record)
+            for feeder in feeders:
+                feeder.join()
+            results = [futures[index].result() if index in futures else self._skipped(record, unreachable[index])
+                       for index, record in enumerate(targets)]
+
+        if self.preflight and self.preflight.breaker:
+            self.preflight.breaker.save()
+        report = FleetReport(results=results, duration=monotonic() - started)
+        logging.info("Fleet run finished: %d/%d succeeded in %.2fs.", len(report.succeeded), len(results),
+                     report.duration)
+        return report
+
+    @staticmethod
+    def _skipped(record: dict, error: str) -> DeviceResult:
+        """
+        Result of a target left out by the preflight check.
+        """
+        logging.warning("Skipping %s (%s): %s", record['name'], record['ip'], error)
+        return DeviceResult(record['name'], record['ip'], record['type'], False, 0.0, None, error)
+
+    def _run_one(self, record: dict, operation) -> DeviceResult:
+        """
+        Runs the operation on a single device.
+        """
+        started = monotonic()
+        device = None
+        try:
+            device = self.device_factory(record)
+            outcome = operation(device)
+            error = None
+            if isinstance(outcome, tuple) and len(outcome) == 2:
+                outcome, error = outcome
+            return DeviceResult(record['name'], record['ip'], record['type'], not error,
+                                monotonic() - started, outcome, error)
+        except Exception as e:
+            logging.error("Operation failed on %s (%s): %s", record['name'], record['ip'], e)
+            return DeviceResult(record['name'], record['ip'], record['type'], False,
+                                monotonic() - started, None, str(e))
+        finally:
+            # Nothing else holds a device built for this run, so its session would stay open until collected
+            if device is not None and not isinstance(self.device_factory, DeviceRegistry):
+                device.close_session()
+
+    async def run_async(self, targets: list, operation) -> FleetReport:
+        """
+        Coroutine counterpart of run: drives every target from the current event loop.
+        At most max_workers devices are worked on at the same time; the per-type limits apply as well.
+        Each device's async session is closed once its operation is done.
+
+        :param targets: List of device data dictionaries.
+        :param operation: Coroutine function receiving a Device, failing like the operations given to run.
+        :return: A FleetReport with one result per target, in target order.
+        """
+        global_limit = asyncio.Semaphore(max(1, self.max_workers))
+        limits = {device_type: asyncio.Semaphore(limit) for device_type, limit in self.per_type_limits.items()}
+        started = monotonic()
+        logging.info("Running %s on %d devices.", getattr(operation, '__name__', 'operation'), len(targets))
+        unreachable = {}
+        if self.preflight:
+            _, unreachable = await asyncio.get_running_loop().run_in_executor(None, self.preflight.check, targets)
+
+        async def skipped(record, error):
+            return self._skipped(record, error)
+
+        results = await asyncio.gather(
+            *(skipped(record, unreachable[index]) if index in unreachable
+              else self._run_one_async(record, operation, global_limit, limits)
+              for index, record in enumerate(targets))
+        )
+
+        report = FleetReport(results=list(results), duration=monotonic() - started)
+        logging.info("Fleet run finished: %d/%d succeeded in %.2fs.", len(report.succeeded), len(results),
+                     report.duration)
+        return report
+
+    async def _run_one_async(self, record: dict, operation, global_limit, limits: dict) -> DeviceResult:
+        """
+        Runs the coroutine operation on a single device, respecting the global and per-type limits.
+        """
+        type_limit = limits.get(record['type'].lower())
+        # Waiting on the type limit first keeps blocked devices from holding global slots
+        if type_limit:
+            await type_limit.acquire()
+        try:
+            async with global_limit:
+                started = monotonic()
+                device = None
+                try:
+                    device = self.device_factory(record)
+                    outcome = await operation(device)
+                    error = None
+                    if isinstance(outcome, tuple) and len(outcome) == 2:
+                        outcome, error = outcome
+                    return DeviceResult(record['name'], record['ip'], record['type'], not error,
+                                        monotonic() - started, outcome, error)
+                except Exception as e:
+                    logging.error("Operation failed on %s (%s): %s", record['name'], record['ip'], e)
+                    return DeviceResult(record['name'], record['ip'], record['type'], False,
+                                        monotonic() - started, None, str(e))
+                finally:
+                    if device is not None:
+                        device.close_async_session()
+        finally:
+            if type_limit:
+                type_limit.release()
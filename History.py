@@ -0,0 +1,288 @@
+"""
+Module responsible for recording the results of commands and device operations in a local SQLite database,
+so runs can be audited and compared afterwards.
+Records are queued by the caller and inserted in batches by a background writer thread, in write-ahead-log mode,
+so recording never waits on the disk. The table is indexed by device, time and operation, and the durations of
+each group are indexed in order, so quantiles are read from the index instead of sorting the records.
+"""
+import atexit
+import logging
+import os
+import queue
+import sqlite3
+import threading
+from contextlib import closing, contextmanager
+from time import time
+
+HISTORY_FILE = 'history.db'
+QUANTILES = (0.5, 0.95, 0.99)
+# Columns duration quantiles can be grouped by
+GROUP_COLUMNS = ('device_type', 'device', 'operation')
+# Rows deleted per transaction while compacting, so writers are not locked out for long
+DELETE_CHUNK = 10000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    id INTEGER PRIMARY KEY,
+    started REAL NOT NULL,
+    duration REAL,
+    kind TEXT NOT NULL,
+    device TEXT,
+    device_type TEXT,
+    operation TEXT,
+    commands TEXT,
+    output TEXT,
+    success INTEGER NOT NULL,
+    error TEXT
+);
+CREATE INDEX IF NOT EXISTS results_device ON results (device, operation, success, started);
+CREATE INDEX IF NOT EXISTS results_started ON results (started);
+CREATE INDEX IF NOT EXISTS results_operation ON results (operation, started);
+-- Replaced by the per-group duration indexes below
+DROP INDEX IF EXISTS results_durations;
+CREATE INDEX IF NOT EXISTS results_durations_device_type ON results (kind, device_type, duration, started);
+CREATE INDEX IF NOT EXISTS results_durations_device ON results (kind, device, duration, started);
+CREATE INDEX IF NOT EXISTS results_durations_operation ON results (kind, operation, duration, started);
+"""
+INSERT = "INSERT INTO results (started, duration, kind, device, device_type, operation, commands, output, " \
+         "success, error) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"
+COLUMNS = "id, started, duration, kind, device, device_type, operation, commands, output, success, error"
+
+# Queued by close() to stop the writer thread
+_STOP = object()
+
+
+class HistoryStore:
+    """
+    A class keeping the history of commands ('command' records) and device operations ('operation' records).
+    Nothing is recorded until the store is opened on a file.
+    """
+
+    def __init__(self, filename=None, max_output=65536, max_pending=100000, batch_size=5000, retention_days=90):
+        """
+        Constructor for HistoryStore.
+
+        :param filename: Optional database file, opened right away; see open.
+        :param max_output: Maximum number of characters of output stored per record; None stores all of it.
+        :param max_pending: Maximum number of records waiting for the writer; further records are dropped.
+        :param batch_size: Maximum number of records inserted in one transaction.
+        :param retention_days: Records older than this are deleted when the store is opened; None keeps everything.
+        """
+        self.filename = None
+        self.max_output = max_output
+        self.batch_size = batch_size
+        self.retention_days = retention_days
+        self.dropped = 0
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._writer = None
+        self._lock = threading.Lock()
+        if filename:
+            self.open(filename)
+
+    @property
+    def enabled(self) -> bool:
+        return self.filename is not None
+
+    def open(self, filename=HISTORY_FILE) -> None:
+        """
+        Creates the database if needed, deletes expired records and starts recording.
+
+        :param filename: The database file.
+        :raises: sqlite3.Error if the database can not be opened.
+        """
+        with self._lock:
+            if self.filename == os.path.abspath(filename):
+                return
+            if self.filename:
+                self.close()
+            with closing(sqlite3.connect(filename, timeout=30)) as connection:
+                # Set before the table exists, so compaction can give the freed pages back to the file system
+                connection.execute("PRAGMA auto_vacuum = INCREMENTAL")
+                connection.execute("PRAGMA journal_mode = WAL")
+                connection.executescript(SCHEMA)
+            self.filename = os.path.abspath(filename)
+            self._writer = threading.Thread(target=self._write, name="history-writer", daemon=True)
+            self._writer.start()
+        if self.retention_days:
+            self.compact(self.retention_days)
+
+    def record(self, device=None, operation=None, commands=None, output=None, error=None, started=None,
+               duration=None, kind="operation", device_type=None) -> None:
+        """
+        Queues one record; returns immediately. Does nothing while the store is not open.
+
+        :param device: Name or IP of the device.
+        :param operation: The operation (e.g. 'hsrp'); None for commands sent outside of an operation.
+        :param commands: The command block, or a list of commands.
+        :param output: The output of the device.
+        :param error: Error message; the record counts as successful if there is none.
+        :param started: Wall clock start time; defaults to now minus the duration.
+        :param duration: Duration in seconds.
+        :param kind: 'operation' or 'command'.
+        :param device_type: Type of the device (e.g. 'switch').
+        """
+        if self.filename is None:
+            return
+        if commands is not None and not isinstance(commands, str):
+            commands = "\n".join(commands)
+        if output is not None and self.max_output is not None:
+            output = output[:self.max_output]
+        if started is None:
+            started = time() - (duration or 0.0)
+        try:
+            self._queue.put_nowait((started, duration, kind, device, device_type, operation, commands, output,
+                                    0 if error else 1, error))
+        except queue.Full:
+            self.dropped += 1
+            if self.dropped == 1:
+                logging.warning(f"History writer is falling behind, dropping records for {self.filename}.")
+
+    def flush(self) -> None:
+        """
+        Waits until every queued record is written.
+        """
+        if self._writer and self._writer.is_alive():
+            self._queue.join()
+
+    def close(self) -> None:
+        """
+        Writes the queued records and stops recording.
+        """
+        if self._writer and self._writer.is_alive():
+            self._queue.put(_STOP)
+            self._writer.join()
+        self._writer = None
+        self.filename = None
+
+    def _write(self) -> None:
+        connection = sqlite3.connect(self.filename, timeout=30)
+        connection.execute("PRAGMA synchronous = NORMAL")
+        stopping = False
+        while not stopping:
+            batch = [self._queue.get()]
+            # Under load, records pile up while a batch is written, and the next batch takes all of them
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            stopping = _STOP in batch
+            rows = [row for row in batch if row is not _STOP]
+            try:
+                if rows:
+                    with connection:
+                        connection.executemany(INSERT, rows)
+            except sqlite3.Error as e:
+                logging.error(f"Could not write {len(rows)} history records to {self.filename}: {e}")
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+        connection.close()
+
+    @contextmanager
+    def _reader(self):
+        if self.filename is None:
+            raise RuntimeError("The history store is not open.")
+        self.flush()
+        with closing(sqlite3.connect(self.filename, timeout=30)) as connection:
+            connection.row_factory = sqlite3.Row
+            yield connection
+
+    def last_success(self, device: str, operation: str):
+        """
+        :param device: Name or IP of the device.
+        :param operation: The operation (e.g. 'hsrp').
+        :return: The most recent successful record of the operation on the device as a dictionary, or None.
+        """
+        with self._reader() as connection:
+            row = connection.execute(f"SELECT {COLUMNS} FROM results WHERE device = ? AND operation = ? "
+                                     f"AND success = 1 ORDER BY started DESC LIMIT 1", (device, operation)).fetchone()
+        return dict(row) if row else None
+
+    def search(self, device=None, operation=None, kind=None, success=None, since=None, until=None,
+               limit=100) -> list:
+        """
+        Finds records, newest first.
+
+        :param device: Optional name or IP of the device.
+        :param operation: Optional operation.
+        :param kind: Optional kind, 'operation' or 'command'.
+        :param success: Optional; True for successful records only, False for failed ones.
+        :param since: Optional wall clock time of the oldest record.
+        :param until: Optional wall clock time the records started before.
+        :param limit: Maximum number of records returned.
+        :return: List of records as dictionaries.
+        """
+        filters = {"device = ?": device, "operation = ?": operation, "kind = ?": kind,
+                   "success = ?": None if success is None else int(bool(success)),
+                   "started >= ?": since, "started < ?": until}
+        filters = {condition: value for condition, value in filters.items() if value is not None}
+        where = f"WHERE {' AND '.join(filters)}" if filters else ""
+        with self._reader() as connection:
+            rows = connection.execute(f"SELECT {COLUMNS} FROM results {where} ORDER BY started DESC LIMIT ?",
+                                      (*filters.values(), limit)).fetchall()
+        return [dict(row) for row in rows]
+
+    def duration_quantiles(self, since=None, by="device_type", kind="operation") -> dict:
+        """
+        Computes duration quantiles over the recorded history, e.g. the p95 per device type over the last week.
+        Each group is counted, then every quantile is read at its rank from the group's duration index.
+
+        :param since: Optional wall clock time of the oldest record taken into account.
+        :param by: Column the records are grouped by: 'device_type', 'device' or 'operation'.
+        :param kind: Kind of the records, 'operation' or 'command'.
+        :return: Mapping of each group to its count and p50/p95/p99 in seconds.
+        :raises: ValueError if the grouping column is not supported.
+        """
+        if by not in GROUP_COLUMNS:
+            raise ValueError(f"Durations can be grouped by {', '.join(GROUP_COLUMNS)}. Received: {by}")
+        since = since or 0.0
+        quantiles = {}
+        with self._reader() as connection:
+            # One read transaction, so records written meanwhile do not shift the ranks
+            connection.execute("BEGIN")
+            counts = connection.execute(f"SELECT {by}, COUNT(*) FROM results WHERE kind = ? AND started >= ? "
+                                        f"AND duration IS NOT NULL GROUP BY {by}", (kind, since)).fetchall()
+            for group, count in counts:
+                quantiles[group] = {"count": count}
+                for q in QUANTILES:
+                    rank = min(count - 1, int(q * count))
+                    # Walk the index from the nearer end, so the high quantiles only read the slowest records
+                    order, offset = ("ASC", rank) if rank < count // 2 else ("DESC", count - 1 - rank)
+                    row = connection.execute(f"SELECT duration FROM results WHERE kind = ? AND {by} IS ? "
+                                             f"AND duration IS NOT NULL AND started >= ? "
+                                             f"ORDER BY duration {order} LIMIT 1 OFFSET ?",
+                                             (kind, group, since, offset)).fetchone()
+                    quantiles[group][f"p{int(q * 100)}"] = row[0]
+        return quantiles
+
+    def compact(self, retention_days=None) -> int:
+        """
+        Deletes the records older than the retention period and gives the freed space back.
+
+        :param retention_days: Age in days of the oldest record kept; defaults to the store's retention period.
+        :return: Number of records deleted.
+        """
+        retention_days = retention_days or self.retention_days
+        if self.filename is None or not retention_days:
+            return 0
+        cutoff = time() - retention_days * 86400
+        deleted = 0
+        with closing(sqlite3.connect(self.filename, timeout=30)) as connection:
+            while True:
+                with connection:
+                    count = connection.execute("DELETE FROM results WHERE id IN (SELECT id FROM results "
+                                               "WHERE started < ? LIMIT ?)", (cutoff, DELETE_CHUNK)).rowcount
+                deleted += count
+                if count < DELETE_CHUNK:
+                    break
+            if deleted:
+                connection.execute("PRAGMA incremental_vacuum").fetchall()
+                connection.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+                logging.info(f"Deleted {deleted} history records older than {retention_days} days.")
+        return deleted
+
+
+# History shared by all connections and devices; nothing is recorded until it is opened
+history = HistoryStore()
+atexit.register(history.close)
@@ -0,0 +1,269 @@
+"""
+Module responsible for rolling out HSRP standby groups to both peers of a router pair at once.
+A group definition names its peers, or one device whose inventory record names its peer in 'hsrp_peer'.
+The active peer gets the higher priority. Every device receives all of its groups in a single push, peers are
+scheduled next to each other so both sides come up together, and hundreds of groups are rolled out with bounded
+parallelism. Convergence of every group can be verified afterwards over the same sessions.
+"""
+import ipaddress
+import logging
+from dataclasses import dataclass
+
+from Batch import ConfigBatch
+from Commands import hsrp_commands
+from Inventory import Inventory, device_role
+
+ACTIVE_PRIORITY = 110
+STANDBY_PRIORITY = 100
+# Device roles that can run HSRP
+HSRP_ROLES = ("router", "multilayer_switch")
+
+
+def supports_hsrp(record: dict) -> bool:
+    """
+    :param record: Device data dictionary.
+    :return: True if the device is a router or a multilayer switch.
+    """
+    return device_role(record['type']) in HSRP_ROLES
+
+
+@dataclass
+class StandbyGroup:
+    """
+    An HSRP group on a pair of peers, resolved against the inventory.
+    """
+    group: int
+    virtual_ip: str
+    active: str
+    standby: str
+    active_interface: str
+    standby_interface: str
+    active_priority: int = ACTIVE_PRIORITY
+    standby_priority: int = STANDBY_PRIORITY
+    preempt: bool = True
+
+    def blocks(self) -> dict:
+        """
+        :return: Mapping of each peer's name to its command block.
+        """
+        return {
+            self.active: hsrp_commands(self.active_interface, self.group, self.virtual_ip, self.active_priority,
+                                       self.preempt),
+            self.standby: hsrp_commands(self.standby_interface, self.group, self.virtual_ip, self.standby_priority,
+                                        self.preempt),
+        }
+
+
+def resolve_group(definition: dict, devices, defaults: dict = None) -> StandbyGroup:
+    """
+    Resolves a standby group definition against the inventory.
+
+    Definition layout; the first peer becomes active, and per-peer interfaces override the shared one:
+        {"group": 10, "virtual_ip": "10.0.10.1", "interface": "Vlan10", "peers": ["R1", "R2"],
+         "interfaces": {"R2": "Gi0/2"}, "active_priority": 110, "standby_priority": 100, "preempt": true}
+    Instead of "peers", "device": "R1" takes the peer from the 'hsrp_peer' field of R1's inventory record.
+
+    :param definition: The group definition.
+    :param devices: Inventory or list of device data dictionaries. Pass an Inventory when resolving many groups,
+                    so its indexes are not rebuilt for each of them.
+    :param defaults: Optional values for the keys the definition leaves out (e.g. the priorities).
+    :return: The StandbyGroup.
+    :raises: ValueError if the definition is invalid or a peer is missing from the inventory or can not run HSRP.
+    """
+    definition = {**(defaults or {}), **definition}
+    inventory = devices if isinstance(devices, Inventory) else Inventory(devices)
+
+    def lookup(key):
+        return inventory.get_by_name(key) or inventory.get(key)
+
+    for key in ('group', 'virtual_ip'):
+        if key not in definition:
+            raise ValueError(f"HSRP group definition without '{key}': {definition}")
+    group = int(definition['group'])
+    ipaddress.IPv4Address(definition['virtual_ip'])
+
+    peers = definition.get('peers')
+    if peers is None and 'device' in definition:
+        record = lookup(definition['device'])
+        if record is None:
+            raise ValueError(f"Device not found in the inventory: {definition['device']}")
+        if not record.get('hsrp_peer'):
+            raise ValueError(f"{record['name']} has no 'hsrp_peer' in the inventory.")
+        peers = [record['name'], record['hsrp_peer']]
+    if not peers or len(peers) != 2:
+        raise ValueError(f"HSRP group {group} needs exactly two peers.")
+
+    records = []
+    for key in peers:
+        record = lookup(key)
+        if record is None:
+            raise ValueError(f"HSRP group {group}: device not found in the inventory: {key}")
+        if not supports_hsrp(record):
+            raise ValueError(f"HSRP group {group}: {record['name']} is a {record['type']}, which can not run HSRP.")
+        records.append(record)
+    active, standby = records
+    if active['name'] == standby['name']:
+        raise ValueError(f"HSRP group {group}: both peers are {active['name']}.")
+
+    interfaces = definition.get('interfaces', {})
+
+    def interface_of(record):
+        interface = interfaces.get(record['name'], interfaces.get(record['ip'], definition.get('interface')))
+        if not interface:
+            raise ValueError(f"HSRP group {group}: no interface given for {record['name']}.")
+        return interface
+
+    return StandbyGroup(group, definition['virtual_ip'], active['name'], standby['name'], interface_of(active),
+                        interface_of(standby), int(definition.get('active_priority', ACTIVE_PRIORITY)),
+                        int(definition.get('standby_priority', STANDBY_PRIORITY)),
+                        bool(definition.get('preempt', True)))
+
+
+def plan_rollout(plan: dict, devices) -> tuple:
+    """
+    Resolves every group of a rollout plan and merges the blocks of each device, without connecting to anything.
+
+    Plan layout:
+        {"defaults": {"active_priority": 120},
+         "groups": [{"group": 10, "virtual_ip": "10.0.10.1", "interface": "Vlan10", "peers": ["R1", "R2"]},
+                    {"group": 20, "virtual_ip": "10.0.20.1", "interface": "Vlan20", "device": "R3"}]}
+
+    :param plan: The rollout plan.
+    :param devices: Inventory or list of device data dictionaries.
+    :return: A tuple of (list of StandbyGroup, mapping of device name to its ConfigBatch).
+    :raises: ValueError listing every invalid group, or groups sharing a virtual IP or a group number on
+             the same interface.
+    """
+    inventory = devices if isinstance(devices, Inventory) else Inventory(devices)
+    groups = []
+    errors = []
+    for index, definition in enumerate(plan.get('groups', []), start=1):
+        try:
+            groups.append(resolve_group(definition, inventory, plan.get('defaults')))
+        except (TypeError, ValueError) as e:
+            errors.append(f"Group entry {index}: {e}")
+
+    seen_ips = {}
+    seen_groups = set()
+    batches = {}
+    for group in groups:
+        # A virtual IP belongs to one group of one pair, whatever the group numbers
+        other = seen_ips.setdefault(group.virtual_ip, group)
+        if other is not group:
+            errors.append(f"Group {other.group} on {other.active}/{other.standby} and group {group.group} on "
+                          f"{group.active}/{group.standby} share the virtual IP {group.virtual_ip}.")
+        for name, interface in ((group.active, group.active_interface), (group.standby, group.standby_interface)):
+            key = (name, interface.lower(), group.group)
+            if key in seen_groups:
+                errors.append(f"Group {group.group} is defined twice on {name} {interface}.")
+            seen_groups.add(key)
+        for name, block in group.blocks().items():
+            batches.setdefault(name, ConfigBatch()).add_block(f"hsrp {group.group}", block)
+    if errors:
+        raise ValueError("Invalid HSRP rollout:\n" + "\n".join(errors))
+    return groups, batches
+
+
+def pair_order(groups: list) -> list:
+    """
+    Orders the devices of a rollout so the peers of every group are next to each other where possible,
+    so a worker pool starts both sides of a group at about the same time.
+
+    :param groups: List of StandbyGroup.
+    :return: Device names, each once.
+    """
+    order = {}
+    for group in groups:
+        order.setdefault(group.active, None)
+        order.setdefault(group.standby, None)
+    return list(order)
+
+
+def rollout(plan: dict, devices, runner=None, verify_timeout: float = None) -> tuple:
+    """
+    Rolls out the HSRP groups of a plan. Each device gets all of its groups in one push, peers are pushed
+    concurrently, and the runner's worker limit bounds how many devices are configured at the same time.
+
+    :param plan: The rollout plan, see plan_rollout.
+    :param devices: Inventory or list of device data dictionaries.
+    :param runner: Optional FleetRunner; a default one is created if omitted. Sessions are closed when the rollout
+                   returns, unless the runner's device factory is a DeviceRegistry.
+    :param verify_timeout: Optional deadline in seconds to wait for every group to elect its active and standby
+                           peer, checked over the sessions used for the push. Nothing is verified if omitted.
+    :return: A tuple of (push FleetReport, verification FleetReport or None).
+    :raises: ValueError if the plan is invalid; nothing is pushed then.
+    """
+    from Fleet import DeviceRegistry, FleetRunner, create_device
+    from Verification import hsrp_converged, verify_all
+
+    inventory = devices if isinstance(devices, Inventory) else Inventory(devices)
+    groups, batches = plan_rollout(plan, inventory)
+    targets = [inventory.get_by_name(name) for name in pair_order(groups)]
+    logging.info(f"Rolling out {len(groups)} HSRP groups to {len(targets)} devices.")
+
+    runner = runner or FleetRunner()
+    # Keep the Device objects, so verification reuses the sessions opened for the push
+    registry = runner.device_factory
+    owned = not isinstance(registry, DeviceRegistry)
+    if owned:
+        registry = DeviceRegistry(registry or create_device)
+        runner = FleetRunner(runner.max_workers, runner.per_type_limits, registry, runner.preflight)
+    try:
+        report = runner.run(targets,
+                            lambda device: device.push_config(batches[device.name].commands, operation="hsrp"))
+        if verify_timeout is None:
+            return report, None
+
+        pushed = {result.name for result in report.succeeded}
+        conditions = {}
+        for group in groups:
+            if group.active in pushed and group.standby in pushed:
+                conditions.setdefault(group.active, []).append(
+                    hsrp_converged(group.active_interface, group.group, "Active"))
+                conditions.setdefault(group.standby, []).append(
+                    hsrp_converged(group.standby_interface, group.group, "Standby"))
+        checks = [(registry.get(inventory.get_by_name(name)), conditions[name]) for name in pair_order(groups)
+                  if name in conditions]
+        return report, verify_all(checks, verify_timeout, max_workers=runner.max_workers)
+    finally:
+        # The sessions of a registry passed in with the runner stay open for the caller's next operations
+        if owned:
+            registry.close()
+
+
+def group_results(groups: list, report) -> dict:
+    """
+    :param groups: List of StandbyGroup.
+    :param report: FleetReport of a push or of a verification.
+    :return: Mapping of each group to its outcome; a group succeeded if it succeeded on both peers.
+    """
+    by_name = {result.name: result for result in report.results}
+    outcome = {}
+    for group in groups:
+        errors = {name: by_name[name].error if name in by_name else "Not run"
+                  for name in (group.active, group.standby)
+                  if name not in by_name or not by_name[name].success}
+        outcome[f"{group.group} {group.virtual_ip}"] = {
+            "active": group.active, "standby": group.standby, "success": not errors, "errors": errors,
+        }
+    return outcome
+
+
+def configure_group(definition: dict, devices, verify_timeout: float = 60) -> tuple:
+    """
+    Configures one standby group on both of its peers concurrently, see resolve_group and rollout.
+
+    :param definition: The group definition.
+    :param devices: Inventory or list of device data dictionaries.
+    :param verify_timeout: Deadline in seconds to wait for the election; None skips the verification.
+    :return: A tuple of (StandbyGroup, outcome of the group, see group_results).
+    :raises: ValueError if the definition is invalid.
+    """
+    inventory = devices if isinstance(devices, Inventory) else Inventory(devices)
+    group = resolve_group(definition, inventory)
+    report, verification = rollout({"groups": [definition]}, inventory, verify_timeout=verify_timeout)
+    key = f"{group.group} {group.virtual_ip}"
+    outcome = group_results([group], report)[key]
+    if verification is not None and outcome["success"]:
+        outcome = group_results([group], verification)[key]
+    return group, outcome
@@ -0,0 +1,228 @@
+"""
+Module responsible for loading the device inventory and looking devices up by IP, name, type or role.
+"""
+import fnmatch
+import json
+import logging
+import os
+import pickle
+from sys import intern
+
+# Bumped whenever the layout of the cached snapshot changes
+SNAPSHOT_VERSION = 1
+CHUNK_SIZE = 1 << 16
+# Fields repeated across many records; their values are interned so all records share one copy
+SHARED_FIELDS = ('type', 'username', 'password', 'privileged_password')
+
+
+def device_role(device_type: str) -> str:
+    """
+    Classifies a device type string into a role.
+
+    :param device_type: The 'type' field of an inventory record (e.g. 'multilayer_sw').
+    :return: 'router', 'multilayer_switch', 'switch' or 'unknown'.
+    """
+    device_type = device_type.lower()
+    if "router" in device_type:
+        return "router"
+    if "sw" in device_type:
+        return "multilayer_switch" if "multilayer" in device_type else "switch"
+    return "unknown"
+
+
+def iter_json_array(filename: str, chunk_size: int = CHUNK_SIZE):
+    """
+    Yields the elements of a top-level JSON array one at a time, reading the file in chunks.
+    Only the element being decoded is held in memory, so very large inventories can be processed incrementally.
+
+    :param filename: Name of the JSON file.
+    :param chunk_size: Number of characters read from the file at a time.
+    :return: Generator of decoded elements.
+    :raises: json.JSONDecodeError if the file is not a JSON array.
+    """
+    decoder = json.JSONDecoder()
+    with open(filename, 'r') as file:
+        buffer = file.read(chunk_size).lstrip()
+        if not buffer.startswith('['):
+            raise json.JSONDecodeError("Expected a JSON array", buffer, 0)
+        pos = 1
+        eof = False
+
+        while True:
+            # Skip whitespace and separators between elements
+            while True:
+                while pos < len(buffer) and buffer[pos] in ' \t\r\n,':
+                    pos += 1
+                if pos < len(buffer) or eof:
+                    break
+                buffer, pos = file.read(chunk_size), 0
+                eof = not buffer
+
+            if pos >= len(buffer):
+                raise json.JSONDecodeError("Unterminated JSON array", buffer, pos)
+            if buffer[pos] == ']':
+                return
+
+            try:
+                element, end = decoder.raw_decode(buffer, pos)
+                # A scalar ending exactly at the chunk boundary may continue in the next chunk
+                complete = end < len(buffer) or eof
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                complete = False
+
+            if not complete:
+                # The element is cut by the chunk boundary; read more and try again
+                more = file.read(chunk_size)
+                eof = not more
+                buffer, pos = buffer[pos:] + more, 0
+                continue
+
+            yield element
+            pos = end
+
+
+class Inventory:
+    """
+    A class holding the device records with hash indexes for O(1) lookups.
+    Records are indexed by IP and name, and grouped by type and role.
+    """
+
+    def __init__(self, devices=()):
+        """
+        Constructor for Inventory.
+
+        :param devices: Iterable of device data dictionaries.
+        """
+        self.devices = []
+        self.by_ip = {}
+        self.by_name = {}
+        self.by_type = {}
+        self.by_role = {}
+        for device in devices:
+            self.add(device)
+
+    def add(self, device: dict) -> None:
+        """
+        Adds a record and indexes it. A later record with the same IP or name replaces the earlier one in the index.
+        The values of SHARED_FIELDS are interned in place.
+
+        :param device: Device data dictionary.
+        """
+        for field in SHARED_FIELDS:
+            if isinstance(device.get(field), str):
+                device[field] = intern(device[field])
+        self.devices.append(device)
+        self.by_ip[device['ip']] = device
+        self.by_name[device['name']] = device
+        self.by_type.setdefault(device['type'].lower(), []).append(device)
+        self.by_role.setdefault(device_role(device['type']), []).append(device)
+
+    def get(self, ip: str):
+        """
+        Looks a device up by IP.
+
+        :param ip: The IP address of the device.
+        :return: The device data dictionary, or None if it is not in the inventory.
+        """
+        return self.by_ip.get(ip)
+
+    def get_by_name(self, name: str):
+        """
+        Looks a device up by name.
+
+        :param name: The name of the device.
+        :return: The device data dictionary, or None if it is not in the inventory.
+        """
+        return self.by_name.get(name)
+
+    def of_type(self, device_type: str) -> list:
+        """
+        :param device_type: A device type such as 'normal_sw'.
+        :return: The devices of that type, in inventory order.
+        """
+        return self.by_type.get(device_type.lower(), [])
+
+    def of_role(self, role: str) -> list:
+        """
+        :param role: 'router', 'switch', 'multilayer_switch' or 'unknown'.
+        :return: The devices with that role, in inventory order.
+        """
+        return self.by_role.get(role, [])
+
+    def __iter__(self):
+        return iter(self.devices)
+
+    def __len__(self):
+        return len(self.devices)
+
+    @classmethod
+    def load(cls, filename: str, snapshot: str = None) -> "Inventory":
+        """
+        Loads the inventory from a JSON file, parsing it incrementally.
+        A binary snapshot next to the file is reused while the file's mtime and size are unchanged.
+
+        :param filename: Name of the JSON inventory file.
+        :param snapshot: Name of the snapshot file; defaults to a hidden file next to the inventory.
+                         Pass an empty string to disable the snapshot.
+        :return: The loaded Inventory.
+        :raises: FileNotFoundError or json.JSONDecodeError if the inventory can not be read.
+        """
+        if snapshot is None:
+            directory, base = os.path.split(filename)
+            snapshot = os.path.join(directory, f".{base}.cache")
+
+        stat = os.stat(filename)
+        signature = (SNAPSHOT_VERSION, stat.st_mtime_ns, stat.st_size)
+
+        if snapshot:
+            try:
+                with open(snapshot, 'rb') as file:
+                    cached_signature, inventory = pickle.load(file)
+                if cached_signature == signature:
+                    logging.info(f"Loaded {len(inventory)} devices from snapshot {snapshot}.")
+                    return inventory
+            except FileNotFoundError:
+                pass
+            except Exception as e:
+                logging.warning(f"Ignoring unreadable inventory snapshot {snapshot}: {e}")
+
+        inventory = cls(iter_json_array(filename))
+        logging.info(f"Loaded {len(inventory)} devices from {filename}.")
+
+        if snapshot:
+            try:
+                temporary = f"{snapshot}.tmp"
+                with open(temporary, 'wb') as file:
+                    pickle.dump((signature, inventory), file, protocol=pickle.HIGHEST_PROTOCOL)
+                os.replace(temporary, snapshot)
+            except OSError as e:
+                logging.warning(f"Could not write inventory snapshot {snapshot}: {e}")
+        return inventory
+
+
+def select_targets(devices, types=None, name_pattern=None, ips=None) -> list:
+    """
+    Selects the inventory records matching all of the given filters.
+    With an Inventory, IP and type filters are answered from its indexes instead of scanning every record.
+
+    :param devices: Inventory or list of device data dictionaries.
+    :param types: Optional collection of device types (e.g. 'normal_sw', 'router').
+    :param name_pattern: Optional shell-style pattern matched against device names (e.g. 'Switch*').
+    :param ips: Optional collection of IP addresses.
+    :return: List of matching device data dictionaries.
+    """
+    types = {t.lower() for t in types} if types else None
+    ips = set(ips) if ips else None
+    if isinstance(devices, Inventory):
+        if ips is not None:
+            devices = [devices.by_ip[ip] for ip in sorted(ips) if ip in devices.by_ip]
+        elif types is not None:
+            devices = [dev for device_type in sorted(types) for dev in devices.of_type(device_type)]
+    return [
+        dev for dev in devices
+        if (types is None or dev['type'].lower() in types)
+        and (name_pattern is None or fnmatch.fnmatch(dev['name'], name_pattern))
+        and (ips is None or dev['ip'] in ips)
+    ]
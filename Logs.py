@@ -0,0 +1,204 @@
+"""
+Module responsible for logging without slowing down the workers.
+Records are handed to a background writer thread through a bounded queue, unformatted: the message is only built,
+and the output only written, by the writer. Records carry the device and operation of the Metrics span they were
+logged in, and can be written as JSON lines. Command blocks and outputs attached as 'payload' are truncated.
+
+Usage:
+    configure_logging(logging.INFO, log_format="json")
+    logging.info("Sending command to %s", ip, extra={"payload": commands})
+"""
+import atexit
+import json
+import logging
+import queue
+import random
+import sys
+from contextlib import contextmanager
+from contextvars import ContextVar
+from logging.handlers import QueueHandler, QueueListener
+
+from Metrics import metrics
+
+LOG_FORMATS = ("text", "json")
+# Characters of a payload written per record
+MAX_PAYLOAD = 2048
+TEXT_FORMAT = "%(asctime)s %(levelname)s %(context)s%(message)s"
+
+# Device and operation the current thread or task is working on
+_context = ContextVar("log_context", default={})
+_listener = None
+_traced = False
+
+
+@contextmanager
+def log_context(**fields):
+    """
+    Adds fields (e.g. device='Switch1', operation='vlan') to the records logged inside the 'with' block.
+    Fields set to None are left out.
+    """
+    token = _context.set({**_context.get(), **{key: value for key, value in fields.items() if value is not None}})
+    try:
+        yield
+    finally:
+        _context.reset(token)
+
+
+def truncate(text: str, limit: int) -> str:
+    """
+    :param text: The text.
+    :param limit: Maximum number of characters kept; None keeps everything.
+    :return: The text, cut after the limit with the number of characters left out.
+    """
+    if limit is None or len(text) <= limit:
+        return text
+    return f"{text[:limit]}... ({len(text) - limit} more characters)"
+
+
+class ContextQueueHandler(QueueHandler):
+    """
+    A handler queueing records for the writer thread. Unlike QueueHandler, it does not format the message
+    in the logging thread; it only attaches the current log context. Records are dropped while the queue is full.
+    """
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # The arguments are formatted later by the writer, so they must not be changed after logging
+        record.context = _context.get()
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class PayloadFormatter(logging.Formatter):
+    """
+    Base formatter rendering the context and the truncated, optionally sampled, payload of a record.
+    """
+
+    def __init__(self, fmt=None, max_payload=MAX_PAYLOAD, payload_sample=1.0):
+        """
+        :param fmt: Format string of the logging module.
+        :param max_payload: Characters of a payload written per record; None writes all of it.
+        :param payload_sample: Fraction of the records whose payload is written; the others only give its size.
+        """
+        super().__init__(fmt)
+        self.max_payload = max_payload
+        self.payload_sample = payload_sample
+
+    def payload(self, record: logging.LogRecord):
+        """
+        :return: A tuple of (payload text or None if left out, payload size), or None if the record has no payload.
+        """
+        payload = getattr(record, "payload", None)
+        if payload is None:
+            return None
+        if not isinstance(payload, str):
+            payload = "\n".join(map(str, payload))
+        if self.payload_sample < 1.0 and random.random() >= self.payload_sample:
+            return None, len(payload)
+        return truncate(payload, self.max_payload), len(payload)
+
+
+class TextFormatter(PayloadFormatter):
+    """
+    Formats records as text lines, with the context in brackets and the payload on the following lines.
+    """
+
+    def __init__(self, max_payload=MAX_PAYLOAD, payload_sample=1.0):
+        super().__init__(TEXT_FORMAT, max_payload, payload_sample)
+
+    def format(self, record: logging.LogRecord) -> str:
+        context = getattr(record, "context", None)
+        record.context = f"[{' '.join(map(str, context.values()))}] " if context else ""
+        text = super().format(record)
+        record.context = context
+        payload = self.payload(record)
+        if payload and payload[0] is not None:
+            text += "\n" + payload[0]
+        return text
+
+
+class JsonFormatter(PayloadFormatter):
+    """
+    Formats records as single-line JSON documents with the time, level, message, context fields and payload.
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        document = {
+            "time": record.created,
+            "level": record.levelname,
+            "logger": record.name,
+            "thread": record.threadName,
+            "message": record.getMessage(),
+        }
+        document.update(getattr(record, "context", None) or {})
+        payload = self.payload(record)
+        if payload:
+            document["payload"], document["payload_size"] = payload
+        if record.exc_info:
+            document["exception"] = self.formatException(record.exc_info)
+        return json.dumps(document, default=str)
+
+
+def configure_logging(level=logging.INFO, stream=None, log_format="text", max_payload=MAX_PAYLOAD,
+                      payload_sample=1.0, max_pending=100000) -> ContextQueueHandler:
+    """
+    Routes the records of the root logger through a queue to a writer thread, replacing its handlers.
+    Records logged inside Metrics spans get the device, device type and operation of the span as context.
+    Can be called again to change the settings.
+
+    :param level: Level of the root logger.
+    :param stream: Stream written to; defaults to stderr.
+    :param log_format: 'text' or 'json'.
+    :param max_payload: Characters of a payload written per record; None writes all of it.
+    :param payload_sample: Fraction of the records whose payload is written.
+    :param max_pending: Maximum number of records waiting for the writer; further records are dropped.
+    :return: The handler installed on the root logger.
+    :raises: ValueError if the format is not supported.
+    """
+    global _listener, _traced
+    if log_format not in LOG_FORMATS:
+        raise ValueError(f"Log formats: {', '.join(LOG_FORMATS)}. Received: {log_format}")
+    stop_logging()
+
+    output = logging.StreamHandler(stream or sys.stderr)
+    formatter = JsonFormatter if log_format == "json" else TextFormatter
+    output.setFormatter(formatter(max_payload=max_payload, payload_sample=payload_sample))
+    handler = ContextQueueHandler(queue.Queue(maxsize=max_pending))
+
+    root = logging.getLogger()
+    for existing in list(root.handlers):
+        root.removeHandler(existing)
+    root.addHandler(handler)
+    root.setLevel(level)
+
+    _listener = QueueListener(handler.queue, output)
+    _listener.start()
+    if not _traced:
+        metrics.add_tracer(lambda phase, labels: log_context(**labels))
+        _traced = True
+    return handler
+
+
+def stop_logging() -> None:
+    """
+    Writes the queued records and stops the writer thread.
+    """
+    global _listener
+    if _listener is None:
+        return
+    _listener.stop()
+    _listener = None
+    handler = next((h for h in logging.getLogger().handlers if isinstance(h, ContextQueueHandler)), None)
+    if handler and handler.dropped:
+        sys.stderr.write(f"Logging fell behind, {handler.dropped} records were dropped.\n")
+
+
+atexit.register(stop_logging)
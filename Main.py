@@ -1,6 +1,12 @@
-from Menu import main
-import logging
+import sys
 
 if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        # Arguments select the non-interactive CLI, which avoids loading the interactive menu
+        from Cli import main as cli_main
+        sys.exit(cli_main())
+
+    from Menu import main
+    import logging
     main()
     logging.basicConfig(level=logging.INFO)
@@ -3,20 +3,24 @@ Module for displaying menu items and executing functions based on user input.
 """
 from Switch import Switch
 from Router import Router
+from Fleet import FleetRunner, select_targets
+from Batch import load_job_file, run_jobs
+from Inventory import Inventory, device_role
+from History import history, HISTORY_FILE
+from Hsrp import configure_group
+from Logs import configure_logging
 import json
 import logging
 
-logging.basicConfig(level=logging.INFO)
 
-def load_device_data(filename: str) -> dict:
+def load_device_data(filename: str) -> Inventory:
     """
     Loads data from JSON file.
     :param filename: Name of the target file.
-    :return: Dictionary containing the device data.
+    :return: Inventory containing the device data, indexed by IP, name, type and role.
     """
     try:
-        with open(filename, 'r') as file:
-            return json.load(file)
+        return Inventory.load(filename)
     except FileNotFoundError:
         logging.error(f"File {filename} not found.")
         raise
@@ -31,11 +35,13 @@ def main() -> None:
     Checks if the device to configure exists in the device list.
     :return: None
     """
+    configure_logging(logging.INFO)
     try:
         devices = load_device_data('deviceDetails.json')
     except Exception as e:
         print(f"Error loading device data: {e}")
         return
+    history.open(HISTORY_FILE)
 
     while True:
         print("""
@@ -43,31 +49,41 @@ def main() -> None:
         
         The following options are available:
         1. Configure a device.
-        2. Exit the application.
+        2. Push commands to multiple devices.
+        3. Run a job file.
+        4. Configure an HSRP group on a router pair.
+        5. Exit the application.
         """)
         choice = input("Enter your choice: ")
         if choice == '1':
             configure_device(devices)
         elif choice == '2':
+            configure_fleet(devices)
+        elif choice == '3':
+            run_job_file(devices)
+        elif choice == '4':
+            configure_hsrp_group(devices)
+        elif choice == '5':
             print("Thank you for using the Network Automation Tool!")
             break
         else:
             print("Invalid choice. Please try again.")
 
 
-def configure_device(devices: dict) -> None:
+def configure_device(devices: Inventory) -> None:
     """
     Function to configure a device based on user input.
-    :param devices: List of available devices.
+    :param devices: Inventory of available devices.
     :return: None
     """
     target_device_ip = input("Enter the IP of the device you want to configure: ").strip()
-    device = next((dev for dev in devices if dev['ip'] == target_device_ip), None)
+    device = devices.get(target_device_ip)
 
     if device:
-        if "router" in device['type'].lower():
+        role = device_role(device['type'])
+        if role == "router":
             ConfigMenuRouter(device)
-        elif "sw" in device['type'].lower():
+        elif role in ("switch", "multilayer_switch"):
             ConfigMenuSwitch(device)
         else:
             print(f"Unknown device type '{device['type']}' for IP: {target_device_ip}")
@@ -75,6 +91,95 @@ def configure_device(devices: dict) -> None:
         print(f"Device with IP {target_device_ip} not found. Please check the IP or add it to the device list.")
 
 
+def configure_fleet(devices: Inventory) -> None:
+    """
+    Function to push the same configuration commands to several devices at once.
+    Targets can be selected by device type, name pattern or a list of IPs.
+    :param devices: Inventory of available devices.
+    :return: None
+    """
+    types = input("Enter the device types to target, comma separated (blank for all): ").strip()
+    name_pattern = input("Enter a name pattern to match (e.g. 'Switch*', blank for all): ").strip()
+    ips = input("Enter the IPs to target, comma separated (blank for all): ").strip()
+
+    targets = select_targets(
+        devices,
+        types=[t.strip() for t in types.split(',') if t.strip()] or None,
+        name_pattern=name_pattern or None,
+        ips=[ip.strip() for ip in ips.split(',') if ip.strip()] or None,
+    )
+    if not targets:
+        print("No devices match the selection.")
+        return
+
+    print(f"Selected {len(targets)} devices: {', '.join(dev['name'] for dev in targets)}")
+    print("Enter the configuration commands, one per line. Finish with an empty line.")
+    commands = []
+    while True:
+        line = input().rstrip()
+        if not line:
+            break
+        commands.append(line)
+    if not commands:
+        print("No commands entered.")
+        return
+
+    report = FleetRunner().run(targets, lambda device: device.push_config("\n".join(commands), operation="commands"))
+    print(report.summary())
+
+
+def run_job_file(devices: Inventory) -> None:
+    """
+    Function to run the configuration jobs described in a JSON job file.
+    :param devices: Inventory of available devices.
+    :return: None
+    """
+    filename = input("Enter the path of the job file: ").strip()
+    try:
+        reports = run_jobs(load_job_file(filename), devices)
+    except (OSError, ValueError) as e:
+        logging.error(f"Could not run job file {filename}: {e}")
+        print(f"Error: {e}")
+        return
+
+    for index, (targets, report) in enumerate(reports, start=1):
+        print(f"Job {index}:\n{report.summary()}")
+
+
+def configure_hsrp_group(devices: Inventory) -> None:
+    """
+    Function to configure an HSRP group on both peers at once and wait for the election.
+    The first peer becomes active; the second peer defaults to the 'hsrp_peer' of the first one in the inventory.
+    :param devices: Inventory of available devices.
+    :return: None
+    """
+    first = input("Enter the name or IP of the active peer: ").strip()
+    second = input("Enter the name or IP of the standby peer (blank for its inventory peer): ").strip()
+    definition = {
+        "group": input("Enter the standby group number: ").strip(),
+        "virtual_ip": input("Enter the virtual IP address: ").strip(),
+        "interface": input("Enter the interface (e.g. Gi0/1 or Vlan10): ").strip(),
+    }
+    if second:
+        definition["peers"] = [first, second]
+    else:
+        definition["device"] = first
+    other_interface = input("Enter the interface on the standby peer (blank for the same): ").strip()
+    if other_interface and second:
+        definition["interfaces"] = {second: other_interface}
+
+    try:
+        group, outcome = configure_group(definition, devices)
+    except ValueError as e:
+        print(f"Error: {e}")
+        return
+    if outcome["success"]:
+        print(f"HSRP group {group.group} is active on {group.active} and standby on {group.standby}.")
+    else:
+        for name, error in outcome["errors"].items():
+            print(f"HSRP group {group.group} failed on {name}: {error}")
+
+
 def ConfigMenuRouter(device: dict) -> None:
     """
     Menu with configuration options for a Router.
@@ -99,6 +204,7 @@ def ConfigMenuRouter(device: dict) -> None:
         elif config_choice == '3':
             router_instance.config_RipV2()
         elif config_choice == '4':
+            router_instance.close_session()
             return  # Exit to main menu
         else:
             print("Invalid choice. Please try again.")
@@ -129,11 +235,12 @@ def ConfigMenuSwitch(device: dict) -> None:
         elif config_choice == '3':
             switch_instance.config_STP()
         elif config_choice == '4':
-            if "multilayer" in device['name'].lower():
+            if device_role(device['type']) == "multilayer_switch":
                 switch_instance.config_HSRP()
             else:
                 print("This is not a multilayer switch, HSRP configuration is not supported.")
         elif config_choice == '5':
+            switch_instance.close_session()
             return  # Exit to main menu
         else:
             print("Invalid choice. Please try again.")
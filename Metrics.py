@@ -0,0 +1,227 @@
+"""
+Module responsible for timing the phases of connections and device operations.
+Durations are aggregated per phase, device type and operation, and can be exported in the Prometheus text format
+or as JSON at the end of a run. Listeners and tracers can be attached to forward every span elsewhere.
+"""
+import json
+import random
+import threading
+from collections import OrderedDict, deque
+from contextlib import contextmanager, ExitStack
+from time import monotonic, time
+
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+class _Series:
+    """
+    Durations of one (phase, device type, operation) combination, kept as a bounded reservoir sample.
+    """
+    __slots__ = ("count", "total", "samples", "max_samples")
+
+    def __init__(self, max_samples: int):
+        self.count = 0
+        self.total = 0.0
+        self.samples = []
+        self.max_samples = max_samples
+
+    def add(self, duration: float) -> None:
+        self.count += 1
+        self.total += duration
+        if len(self.samples) < self.max_samples:
+            self.samples.append(duration)
+        else:
+            index = random.randrange(self.count)
+            if index < self.max_samples:
+                self.samples[index] = duration
+
+    def quantiles(self) -> dict:
+        ordered = sorted(self.samples)
+        if not ordered:
+            return {q: 0.0 for q in QUANTILES}
+        return {q: ordered[min(len(ordered) - 1, int(q * len(ordered)))] for q in QUANTILES}
+
+
+class Metrics:
+    """
+    A class collecting phase timings, e.g. tcp_connect, ssh_auth, shell_start, enable, command and operation.
+    """
+
+    def __init__(self, max_samples=10000, recent_events=1000, max_devices=10000):
+        """
+        Constructor for Metrics.
+
+        :param max_samples: Maximum durations kept per series to compute quantiles.
+        :param recent_events: Number of most recent spans kept per device.
+        :param max_devices: Maximum number of devices whose recent spans are kept; the spans of the device
+                            recorded least recently are dropped first. The series are not affected.
+        """
+        self.max_samples = max_samples
+        self.recent_events = recent_events
+        self.max_devices = max_devices
+        self._series = {}
+        # Recent spans per device, least recently recorded first
+        self._devices = OrderedDict()
+        self._listeners = []
+        self._tracers = []
+        self._lock = threading.Lock()
+
+    def add_listener(self, listener) -> None:
+        """
+        Registers a callable receiving every finished span as a dictionary
+        (phase, device, device_type, operation, start, duration, error).
+
+        :param listener: The callable.
+        """
+        self._listeners.append(listener)
+
+    def add_tracer(self, tracer) -> None:
+        """
+        Registers a tracer wrapping every span. The tracer is called with the phase name and the span's labels and
+        must return a context manager, e.g. lambda phase, labels: otel_tracer.start_as_current_span(phase,
+        attributes=labels).
+
+        :param tracer: The callable returning a context manager.
+        """
+        self._tracers.append(tracer)
+
+    @contextmanager
+    def span(self, phase: str, device: str = None, device_type: str = None, operation: str = None):
+        """
+        Times the enclosed block as one phase.
+
+        :param phase: Name of the phase (e.g. 'ssh_auth').
+        :param device: Name or IP of the device.
+        :param device_type: Type of the device (e.g. 'switch').
+        :param operation: The operation the phase belongs to (e.g. 'vlan').
+        """
+        labels = {"device": device, "device_type": device_type, "operation": operation}
+        error = None
+        started_at = time()
+        started = monotonic()
+        with ExitStack() as stack:
+            for tracer in self._tracers:
+                stack.enter_context(tracer(phase, {k: v for k, v in labels.items() if v is not None}))
+            try:
+                yield
+            except BaseException as e:
+                error = repr(e)
+                raise
+            finally:
+                self.observe(phase, monotonic() - started, start=started_at, error=error, **labels)
+
+    def observe(self, phase: str, duration: float, device: str = None, device_type: str = None,
+                operation: str = None, start: float = None, error: str = None) -> None:
+        """
+        Records the duration of a phase that was timed elsewhere.
+
+        :param phase: Name of the phase.
+        :param duration: Duration in seconds.
+        :param device: Name or IP of the device.
+        :param device_type: Type of the device.
+        :param operation: The operation the phase belongs to.
+        :param start: Wall clock start time; defaults to now minus the duration.
+        :param error: Error description if the phase failed.
+        """
+        event = {
+            "phase": phase,
+            "device": device,
+            "device_type": device_type,
+            "operation": operation,
+            "start": start if start is not None else time() - duration,
+            "duration": duration,
+            "error": error,
+        }
+        key = (phase, device_type or "", operation or "")
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = _Series(self.max_samples)
+            series.add(duration)
+            if device is not None:
+                events = self._devices.get(device)
+                if events is None:
+                    events = self._devices[device] = deque(maxlen=self.recent_events)
+                    if len(self._devices) > self.max_devices:
+                        self._devices.popitem(last=False)
+                else:
+                    self._devices.move_to_end(device)
+                events.append(event)
+        for listener in self._listeners:
+            listener(event)
+
+    def device_events(self, device: str) -> list:
+        """
+        :param device: Name or IP of the device.
+        :return: The most recent spans recorded for the device, oldest first.
+        """
+        with self._lock:
+            return list(self._devices.get(device, ()))
+
+    def summary(self) -> list:
+        """
+        :return: One dictionary per series with count, sum and p50/p95/p99 in seconds.
+        """
+        with self._lock:
+            items = [(key, series.count, series.total, series.quantiles()) for key, series in self._series.items()]
+        return [
+            {
+                "phase": phase,
+                "device_type": device_type,
+                "operation": operation,
+                "count": count,
+                "sum": total,
+                "p50": quantiles[0.5],
+                "p95": quantiles[0.95],
+                "p99": quantiles[0.99],
+            }
+            for (phase, device_type, operation), count, total, quantiles in sorted(items)
+        ]
+
+    def to_json(self) -> str:
+        """
+        :return: The summary and the per-device phase totals as a JSON document.
+        """
+        with self._lock:
+            devices = {}
+            for device, events in self._devices.items():
+                phases = devices.setdefault(device, {})
+                for event in events:
+                    phases[event["phase"]] = phases.get(event["phase"], 0.0) + event["duration"]
+        return json.dumps({"series": self.summary(), "devices": devices}, indent=2)
+
+    def to_prometheus(self, prefix: str = "netauto_phase_duration_seconds") -> str:
+        """
+        :param prefix: Metric name.
+        :return: The summary in the Prometheus text exposition format.
+        """
+        lines = [f"# HELP {prefix} Duration of connection and operation phases.", f"# TYPE {prefix} summary"]
+        for entry in self.summary():
+            labels = f'phase="{entry["phase"]}",device_type="{entry["device_type"]}",operation="{entry["operation"]}"'
+            for quantile in QUANTILES:
+                lines.append(f'{prefix}{{{labels},quantile="{quantile}"}} {entry[f"p{int(quantile * 100)}"]:.6f}')
+            lines.append(f"{prefix}_sum{{{labels}}} {entry['sum']:.6f}")
+            lines.append(f"{prefix}_count{{{labels}}} {entry['count']}")
+        return "\n".join(lines) + "\n"
+
+    def export(self, filename: str, fmt: str = "prometheus") -> None:
+        """
+        Writes the collected metrics to a file.
+
+        :param filename: Name of the output file.
+        :param fmt: 'prometheus' or 'json'.
+        """
+        with open(filename, 'w') as file:
+            file.write(self.to_json() if fmt == "json" else self.to_prometheus())
+
+    def reset(self) -> None:
+        """
+        Drops all collected metrics. Listeners and tracers stay registered.
+        """
+        with self._lock:
+            self._series.clear()
+            self._devices.clear()
+
+
+# Metrics shared by all connections and devices
+metrics = Metrics()
@@ -0,0 +1,165 @@
+"""
+Module responsible for collecting command output from a device incrementally.
+Bytes are decoded with an incremental UTF-8 decoder, so characters split across reads are not corrupted,
+and prompts and error markers are tracked line by line instead of rescanning the whole output on every read.
+"""
+import codecs
+from dataclasses import dataclass
+
+from Prompt import PRIV_PROMPT_LINE, ERROR_MARKERS
+
+# Characters of recent output kept for end-of-output pattern matching
+TAIL_SIZE = 4096
+
+
+class OutputBuffer:
+    """
+    A class accumulating the output of a command, optionally capped in size or streamed to a sink.
+    """
+
+    def __init__(self, max_output=None, sink=None, on_line=None):
+        """
+        Constructor for OutputBuffer.
+
+        :param max_output: Optional maximum number of characters kept; further output is dropped.
+        :param sink: Optional callable or file-like object receiving the output as it arrives instead of keeping it.
+        :param on_line: Optional callable receiving every complete line as it arrives.
+        """
+        self.max_output = max_output
+        self.sink = sink.write if hasattr(sink, 'write') else sink
+        self.on_line = on_line
+        self.size = 0
+        self.truncated = False
+        self.prompts = 0
+        self.error = None
+        self.tail = ""
+        self._chunks = []
+        self._kept = 0
+        self._partial = ""
+        self._decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+
+    def feed(self, data: bytes) -> str:
+        """
+        Adds raw bytes received from the device.
+
+        :param data: The bytes read from the channel.
+        :return: The newly decoded text.
+        """
+        return self.feed_text(self._decoder.decode(data))
+
+    def feed_text(self, text: str) -> str:
+        """
+        Adds already decoded text received from the device.
+
+        :param text: The decoded text.
+        :return: The same text.
+        """
+        if not text:
+            return text
+        self.size += len(text)
+        self.tail = (self.tail + text)[-TAIL_SIZE:]
+
+        if self.sink:
+            self.sink(text)
+        elif self.max_output is None or self._kept < self.max_output:
+            keep = text if self.max_output is None else text[:self.max_output - self._kept]
+            self._chunks.append(keep)
+            self._kept += len(keep)
+            self.truncated = len(keep) < len(text)
+        else:
+            self.truncated = True
+
+        lines = (self._partial + text).split('\n')
+        self._partial = lines.pop()
+        for line in lines:
+            self._scan(line)
+        return text
+
+    def _scan(self, line: str) -> None:
+        """
+        Tracks prompts and error markers on a complete line.
+        """
+        if PRIV_PROMPT_LINE.match(line):
+            self.prompts += 1
+        if self.error is None and any(marker in line for marker in ERROR_MARKERS):
+            self.error = line.strip()
+        if self.on_line:
+            self.on_line(line.rstrip('\r'))
+
+    def prompt_count(self) -> int:
+        """
+        :return: Number of privileged prompts seen at the start of a line, including the unfinished last line.
+        """
+        return self.prompts + (1 if PRIV_PROMPT_LINE.match(self._partial) else 0)
+
+    def finish(self) -> None:
+        """
+        Flushes the decoder and the unfinished last line once the read is over.
+        """
+        self.feed_text(self._decoder.decode(b'', final=True))
+        if self._partial:
+            partial, self._partial = self._partial, ""
+            self._scan(partial)
+
+    def getvalue(self) -> str:
+        """
+        :return: The kept output; empty when the output was streamed to a sink.
+        """
+        if len(self._chunks) > 1:
+            self._chunks = ["".join(self._chunks)]
+        return self._chunks[0] if self._chunks else ""
+
+
+@dataclass
+class CommandResult:
+    """
+    Outcome of one command sent through a pipeline.
+    """
+    command: str
+    output: str = ""
+    error: str = None
+    latency: float = None
+
+
+class CommandSplitter:
+    """
+    A class splitting the output stream of pipelined commands into one CommandResult per command.
+    The prompt following each command is the boundary; it carries the echo of the next command on the same line.
+    Meant to be fed complete lines through an OutputBuffer's on_line callback.
+    """
+
+    def __init__(self, commands: list):
+        """
+        Constructor for CommandSplitter.
+
+        :param commands: The commands in the order they are sent.
+        """
+        self.results = [CommandResult(command) for command in commands]
+        self.index = 0
+        self._lines = []
+        self._echo_pending = True
+
+    def __call__(self, line: str) -> None:
+        if self.index >= len(self.results):
+            return
+        if PRIV_PROMPT_LINE.match(line):
+            self.results[self.index].output = "\n".join(self._lines)
+            self.index += 1
+            self._lines = []
+            return
+        if self._echo_pending:
+            # Only the first command is echoed on a line of its own; later echoes follow the prompt
+            self._echo_pending = False
+            return
+        result = self.results[self.index]
+        if result.error is None and any(marker in line for marker in ERROR_MARKERS):
+            result.error = line.strip()
+        self._lines.append(line)
+
+    def finish(self) -> None:
+        """
+        Keeps the output received so far for the command left unanswered, if any.
+        """
+        if self.index < len(self.results) and self._lines:
+            self.results[self.index].output = "\n".join(self._lines)
+            self._lines = []
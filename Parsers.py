@@ -0,0 +1,272 @@
+"""
+Module responsible for parsing show command output into typed records, so changes can be verified programmatically.
+Parsers consume output line by line and yield records as soon as they are complete, so output can be parsed while
+it streams from a device (see DeviceConnection.iter_lines) and only one record is held at a time.
+Records are named tuples; low-cardinality strings such as states are interned.
+"""
+import io
+import re
+from sys import intern
+from typing import NamedTuple, Optional
+
+
+class VlanEntry(NamedTuple):
+    vlan: int
+    name: str
+    status: str
+    ports: tuple
+
+
+class StandbyEntry(NamedTuple):
+    interface: str
+    group: int
+    priority: int
+    preempt: bool
+    state: str
+    active: str
+    standby: str
+    virtual_ip: str
+
+
+class StpMode(NamedTuple):
+    mode: str
+    root_for: tuple
+
+
+class StpVlanEntry(NamedTuple):
+    vlan: int
+    blocking: int
+    listening: int
+    learning: int
+    forwarding: int
+    active: int
+
+
+class RipRoute(NamedTuple):
+    network: str
+    metric: Optional[int]
+    next_hop: Optional[str]
+    interface: Optional[str]
+    age: Optional[str]
+
+
+class DhcpSubnet(NamedTuple):
+    current: str
+    first: str
+    last: str
+    leased: int
+
+
+class DhcpPoolEntry(NamedTuple):
+    name: str
+    total: int
+    leased: int
+    subnets: tuple
+
+
+VLAN_LINE = re.compile(r"^(\d{1,4})\s+(\S+)\s+(\S+)(?:\s+(\S.*\S|\S))?\s*$")
+PORTS_CONTINUATION = re.compile(r"^\s+([A-Za-z][\w/.:-]*(?:,\s*[A-Za-z][\w/.:-]*)*),?\s*$")
+STANDBY_LINE = re.compile(r"^(\S+)\s+(\d+)\s+(\d+)\s+(?:(P)\s+)?([A-Za-z]\S*)\s+(\S+)\s+(\S+)\s+(\S+)\s*$")
+STP_MODE = re.compile(r"^Switch is in (\S+) mode")
+STP_ROOT = re.compile(r"^Root bridge for:\s*(.*?)\s*$")
+STP_VLAN_LINE = re.compile(r"^VLAN0*(\d+)\s+(\d+)\s+(\d+)\s+(\d+)\s+(\d+)\s+(\d+)\s*$")
+RIP_NETWORK = re.compile(r"^(\d+\.\d+\.\d+\.\d+/\d+)(?:\s+(.*?))?\s*$")
+RIP_VIA = re.compile(r"^\s+\[(\d+)\]\s+via\s+(\S+?),\s*(\S+?)(?:,\s*(\S+))?\s*$")
+RIP_CONNECTED = re.compile(r"directly connected,\s*(\S+)")
+DHCP_POOL = re.compile(r"^Pool\s+(\S+)\s*:")
+DHCP_TOTAL = re.compile(r"^\s*Total addresses\s*:\s*(\d+)")
+DHCP_LEASED = re.compile(r"^\s*Leased addresses\s*:\s*(\d+)")
+DHCP_SUBNET = re.compile(r"^\s*(\d+\.\d+\.\d+\.\d+)\s+(\d+\.\d+\.\d+\.\d+)\s*-\s*(\d+\.\d+\.\d+\.\d+)\s+(\d+)")
+
+
+def lines_of(output):
+    """
+    :param output: Command output as a string, a file-like object or an iterable of lines.
+    :return: Iterator over the lines, without line terminators.
+    """
+    if isinstance(output, str):
+        output = io.StringIO(output)
+    return (line.rstrip("\r\n") for line in output)
+
+
+def parse_vlan_brief(output):
+    """
+    Parses 'show vlan brief' output. Port lists wrapped over several lines are joined.
+
+    :param output: The output, see lines_of.
+    :return: Generator of VlanEntry.
+    """
+    pending = None
+    ports = []
+    for line in lines_of(output):
+        match = VLAN_LINE.match(line)
+        if match:
+            if pending:
+                yield VlanEntry(*pending, tuple(ports))
+            vlan, name, status, port_list = match.groups()
+            pending = (int(vlan), name, intern(status))
+            ports = port_list.replace(" ", "").strip(",").split(",") if port_list else []
+            continue
+        match = PORTS_CONTINUATION.match(line) if pending else None
+        if match:
+            ports += match.group(1).replace(" ", "").strip(",").split(",")
+    if pending:
+        yield VlanEntry(*pending, tuple(ports))
+
+
+def parse_standby_brief(output):
+    """
+    Parses 'show standby brief' output.
+
+    :param output: The output, see lines_of.
+    :return: Generator of StandbyEntry.
+    """
+    for line in lines_of(output):
+        match = STANDBY_LINE.match(line)
+        if match:
+            interface, group, priority, preempt, state, active, standby, virtual_ip = match.groups()
+            yield StandbyEntry(interface, int(group), int(priority), preempt is not None, intern(state),
+                               active, standby, virtual_ip)
+
+
+def parse_spanning_tree_summary(output):
+    """
+    Parses 'show spanning-tree summary' output.
+
+    :param output: The output, see lines_of.
+    :return: Generator yielding one StpMode, then a StpVlanEntry per VLAN.
+    """
+    mode = None
+    root_for = ()
+    announced = False
+    for line in lines_of(output):
+        match = STP_MODE.match(line)
+        if match:
+            mode = intern(match.group(1))
+            continue
+        match = STP_ROOT.match(line)
+        if match:
+            root_for = tuple(int(vlan[4:]) for vlan in re.findall(r"VLAN\d+", match.group(1)))
+            continue
+        match = STP_VLAN_LINE.match(line)
+        if match:
+            if not announced:
+                announced = True
+                yield StpMode(mode, root_for)
+            yield StpVlanEntry(*map(int, match.groups()))
+    if not announced and mode is not None:
+        yield StpMode(mode, root_for)
+
+
+def parse_rip_database(output):
+    """
+    Parses 'show ip rip database' output. A network learnt over several paths yields one route per path;
+    summaries without a path are skipped.
+
+    :param output: The output, see lines_of.
+    :return: Generator of RipRoute; directly connected networks have no metric and no next hop.
+    """
+    network = None
+    for line in lines_of(output):
+        match = RIP_VIA.match(line)
+        if match:
+            if network:
+                metric, next_hop, age, interface = match.groups()
+                # The interface follows the age, unless the age is missing
+                if interface is None:
+                    age, interface = None, age
+                yield RipRoute(network, int(metric), next_hop, intern(interface), age)
+            continue
+        match = RIP_NETWORK.match(line)
+        if match:
+            network, detail = match.groups()
+            connected = RIP_CONNECTED.search(detail) if detail else None
+            if connected:
+                yield RipRoute(network, None, None, intern(connected.group(1)), None)
+
+
+def parse_dhcp_pool(output):
+    """
+    Parses 'show ip dhcp pool' output.
+
+    :param output: The output, see lines_of.
+    :return: Generator of DhcpPoolEntry.
+    """
+    name = None
+    total = leased = 0
+    subnets = []
+    for line in lines_of(output):
+        match = DHCP_POOL.match(line)
+        if match:
+            if name:
+                yield DhcpPoolEntry(name, total, leased, tuple(subnets))
+            name = match.group(1)
+            total = leased = 0
+            subnets = []
+        elif name:
+            match = DHCP_SUBNET.match(line)
+            if match:
+                current, first, last, subnet_leased = match.groups()
+                subnets.append(DhcpSubnet(current, first, last, int(subnet_leased)))
+                continue
+            match = DHCP_TOTAL.match(line)
+            if match:
+                total = int(match.group(1))
+                continue
+            match = DHCP_LEASED.match(line)
+            if match:
+                leased = int(match.group(1))
+    if name:
+        yield DhcpPoolEntry(name, total, leased, tuple(subnets))
+
+
+# Parsers by show command, without the 'do ' prefix
+PARSERS = {
+    "show vlan brief": parse_vlan_brief,
+    "show standby brief": parse_standby_brief,
+    "show spanning-tree summary": parse_spanning_tree_summary,
+    "show ip rip database": parse_rip_database,
+    "show ip dhcp pool": parse_dhcp_pool,
+}
+
+
+def parser_for(command: str):
+    """
+    :param command: The show command, with or without the 'do ' prefix.
+    :return: The parser of the command.
+    :raises: ValueError if there is no parser for the command.
+    """
+    command = " ".join(command.split())
+    command = command[3:] if command.startswith("do ") else command
+    try:
+        return PARSERS[command]
+    except KeyError:
+        raise ValueError(f"No parser for '{command}'. Available: {', '.join(PARSERS)}")
+
+
+def parse(command: str, output):
+    """
+    Parses the output of a show command.
+
+    :param command: The show command, see parser_for.
+    :param output: The output, see lines_of.
+    :return: Generator of records.
+    :raises: ValueError if there is no parser for the command.
+    """
+    return parser_for(command)(output)
+
+
+def stream(connection, command: str, timeout=None):
+    """
+    Runs a show command over a session and parses its output while it arrives, without keeping the output.
+    Once the generator is exhausted, connection.last_command_error holds the error of the command, or None.
+
+    :param connection: An open DeviceConnection, in configuration mode.
+    :param command: The show command, see parser_for.
+    :param timeout: Deadline in seconds for the whole command.
+    :return: Generator of records.
+    :raises: ValueError if there is no parser for the command.
+    """
+    parser = parser_for(command)
+    command = command if command.startswith("do ") else f"do {command}"
+    return parser(connection.iter_lines(command, timeout=timeout))
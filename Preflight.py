@@ -0,0 +1,231 @@
+"""
+Module responsible for checking that devices are reachable before a run, so dead devices fail fast.
+All targets are probed on their SSH port in parallel with a short deadline, transient failures are retried with
+exponential backoff and jitter, and a per-device circuit breaker remembers failures across runs.
+"""
+import errno
+import json
+import logging
+import os
+import random
+import selectors
+import socket
+import threading
+from time import monotonic, sleep, time
+
+# Sockets opened at the same time by one probe round, to stay well below the open file limit
+PROBE_BATCH = 512
+BREAKER_FILE = '.circuit_breaker.json'
+
+
+def backoff_delays(attempts: int, base: float = 0.5, cap: float = 10.0):
+    """
+    Yields the waits between attempts: exponential backoff with full jitter.
+
+    :param attempts: Total number of attempts; one delay less is yielded.
+    :param base: Upper bound of the first delay, in seconds.
+    :param cap: Maximum delay, in seconds.
+    :return: Generator of delays in seconds.
+    """
+    for attempt in range(attempts - 1):
+        yield random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+def probe_all(addresses, timeout: float = 1.0) -> dict:
+    """
+    Opens a TCP connection to every address at once and closes it again.
+
+    :param addresses: Iterable of (host, port) pairs.
+    :param timeout: Deadline in seconds for each batch of connections.
+    :return: Mapping of each address to None if it accepted the connection, or to an error message.
+    """
+    addresses = list(dict.fromkeys(addresses))
+    results = {}
+    for start in range(0, len(addresses), PROBE_BATCH):
+        results.update(_probe_batch(addresses[start:start + PROBE_BATCH], timeout))
+    return results
+
+
+def _probe_batch(addresses: list, timeout: float) -> dict:
+    results = {}
+    selector = selectors.DefaultSelector()
+    try:
+        for address in addresses:
+            try:
+                sock = socket.socket(socket.AF_INET6 if ':' in address[0] else socket.AF_INET, socket.SOCK_STREAM)
+            except OSError as e:
+                results[address] = str(e)
+                continue
+            sock.setblocking(False)
+            code = sock.connect_ex(address)
+            if code in (0, errno.EINPROGRESS, errno.EWOULDBLOCK, errno.EALREADY):
+                selector.register(sock, selectors.EVENT_WRITE, address)
+            else:
+                results[address] = os.strerror(code)
+                sock.close()
+
+        deadline = monotonic() + timeout
+        while selector.get_map():
+            remaining = deadline - monotonic()
+            if remaining <= 0:
+                break
+            for key, _ in selector.select(remaining):
+                code = key.fileobj.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+                results[key.data] = None if code == 0 else os.strerror(code)
+                selector.unregister(key.fileobj)
+                key.fileobj.close()
+    finally:
+        for key in list(selector.get_map().values()):
+            results[key.data] = f"No answer within {timeout}s."
+            key.fileobj.close()
+        selector.close()
+    return results
+
+
+class CircuitBreaker:
+    """
+    A class remembering devices that recently failed, so runs skip them until a cooldown has passed.
+    After the cooldown, one attempt is let through: success closes the circuit, failure opens it again.
+    The state is kept in a JSON file, so it carries over between runs.
+    """
+
+    def __init__(self, filename=BREAKER_FILE, failure_threshold=3, cooldown=300):
+        """
+        Constructor for CircuitBreaker.
+
+        :param filename: File the state is loaded from and saved to; None keeps it in memory only.
+        :param failure_threshold: Consecutive failures after which a device is skipped.
+        :param cooldown: Seconds a device is skipped before it is tried again.
+        """
+        self.filename = filename
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self._state = {}
+        self._lock = threading.Lock()
+        if filename and os.path.exists(filename):
+            try:
+                with open(filename, 'r') as file:
+                    self._state = json.load(file)
+            except (OSError, ValueError) as e:
+                logging.warning("Ignoring unreadable circuit breaker state %s: %s", filename, e)
+
+    @staticmethod
+    def key(ip: str, port: int = 22) -> str:
+        return f"{ip}:{port}"
+
+    def allow(self, key: str) -> bool:
+        """
+        :param key: The device key, see CircuitBreaker.key.
+        :return: False while the device's circuit is open and its cooldown has not passed.
+        """
+        with self._lock:
+            entry = self._state.get(key)
+        if not entry or entry['failures'] < self.failure_threshold:
+            return True
+        return time() - entry['last_failure'] >= self.cooldown
+
+    def retry_at(self, key: str) -> float:
+        """
+        :return: Epoch time after which an open circuit lets an attempt through again.
+        """
+        with self._lock:
+            entry = self._state.get(key, {'last_failure': 0.0})
+        return entry['last_failure'] + self.cooldown
+
+    def record_success(self, key: str) -> None:
+        with self._lock:
+            self._state.pop(key, None)
+
+    def record_failure(self, key: str, error: str = None) -> None:
+        with self._lock:
+            entry = self._state.setdefault(key, {'failures': 0})
+            entry['failures'] += 1
+            entry['last_failure'] = time()
+            entry['error'] = error
+
+    def save(self) -> None:
+        """
+        Writes the state to the breaker's file, replacing it atomically.
+        """
+        if not self.filename:
+            return
+        with self._lock:
+            state = json.dumps(self._state, indent=2)
+        try:
+            temporary = f"{self.filename}.tmp"
+            with open(temporary, 'w') as file:
+                file.write(state)
+            os.replace(temporary, self.filename)
+        except OSError as e:
+            logging.warning("Could not write circuit breaker state %s: %s", self.filename, e)
+
+
+class Preflight:
+    """
+    A class deciding which targets of a run are worth connecting to.
+    """
+
+    def __init__(self, breaker: CircuitBreaker = None, timeout=1.0, attempts=3, base_delay=0.5, max_delay=5.0):
+        """
+        Constructor for Preflight.
+
+        :param breaker: Optional CircuitBreaker consulted and updated by every check. Give the same breaker to the
+                        SessionManager, so failed connections open circuits and working sessions close them.
+        :param timeout: Deadline in seconds for each probe round.
+        :param attempts: Probe rounds for devices that do not answer.
+        :param base_delay: Upper bound in seconds of the wait before the first retry; it doubles with every retry.
+        :param max_delay: Maximum wait in seconds between two rounds.
+        """
+        self.breaker = breaker
+        self.timeout = timeout
+        self.attempts = attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def check(self, targets: list) -> tuple:
+        """
+        Probes the SSH port of every target in parallel, retrying the ones that do not answer.
+
+        :param targets: List of device data dictionaries.
+        :return: A tuple of (reachable targets, mapping of the index of each unreachable target to its error message).
+                 Targets are keyed by index, so records sharing a name are reported separately.
+        """
+        failed = {}
+        pending = {}
+        for index, record in enumerate(targets):
+            address = (record['ip'], record.get('port', 22))
+            if self.breaker and not self.breaker.allow(CircuitBreaker.key(*address)):
+                retry_at = self.breaker.retry_at(CircuitBreaker.key(*address))
+                failed[index] = (f"Skipped: circuit open after repeated failures, retry after "
+                                 f"{max(0, int(retry_at - time()))}s.")
+                continue
+            pending.setdefault(address, []).append(index)
+
+        errors = {}
+        delays = backoff_delays(self.attempts, self.base_delay, self.max_delay)
+        addresses = list(pending)
+        started = monotonic()
+        for attempt in range(self.attempts):
+            if attempt:
+                sleep(next(delays))
+            errors.update(probe_all(addresses, self.timeout))
+            addresses = [address for address in addresses if errors[address]]
+            if not addresses:
+                break
+
+        # An open port does not close a circuit: SSH may still fail, so only a working session does that
+        for address, indexes in pending.items():
+            error = errors.get(address)
+            key = CircuitBreaker.key(*address)
+            if error:
+                for index in indexes:
+                    failed[index] = f"Unreachable on {address[0]}:{address[1]}: {error}"
+                if self.breaker:
+                    self.breaker.record_failure(key, error)
+        if self.breaker:
+            self.breaker.save()
+
+        reachable = [record for index, record in enumerate(targets) if index not in failed]
+        logging.info("Preflight: %d/%d devices reachable (%.2fs).", len(reachable), len(targets),
+                     monotonic() - started)
+        return reachable, failed
@@ -0,0 +1,83 @@
+"""
+Module responsible for recognising IOS prompts and error markers in device output.
+Shared by the blocking and asyncio connection backends so both judge output the same way.
+"""
+import re
+
+# Matches an IOS prompt at the end of the received data, e.g. "SW1>", "SW1#", "SW1(config)#", "R1(config-if)#".
+PROMPT_PATTERN = re.compile(r"[\w.\-]+(?:\([\w.\-]+\))?[>#]\s*$")
+# Matches a privileged exec or configuration mode prompt at the start of a line.
+PRIV_PROMPT_LINE = re.compile(r"^[\w.\-]+(?:\([\w.\-]+\))?#", re.MULTILINE)
+# Matches the password prompt shown by the 'enable' command.
+PASSWORD_PROMPT = re.compile(r"[Pp]assword:\s*$")
+# Matches either the enable password prompt or a regular prompt.
+ENABLE_REPLY = re.compile(f"{PASSWORD_PROMPT.pattern}|{PROMPT_PATTERN.pattern}")
+# Markers printed by IOS when a command is rejected.
+ERROR_MARKERS = (
+    "% Invalid input",
+    "% Incomplete command",
+    "% Ambiguous command",
+    "% Unknown command",
+    "% Bad secrets",
+    "% Access denied",
+)
+
+
+def find_error_marker(output: str):
+    """
+    Looks for an IOS error marker in the output of a command.
+
+    :param output: The output received from the device.
+    :return: The line containing the first error marker, or None if the output is clean.
+    """
+    for line in output.splitlines():
+        if any(marker in line for marker in ERROR_MARKERS):
+            return line.strip()
+    return None
+
+
+def command_complete(buffer, expected_prompts: int, prompt=PROMPT_PATTERN) -> bool:
+    """
+    Tells whether the output of a command block is complete.
+    Every line sent produces a new prompt, so the block is done once all of them are back.
+
+    :param buffer: The OutputBuffer receiving the output.
+    :param expected_prompts: Number of lines in the command block.
+    :param prompt: Regex matching the prompt at the end of the output.
+    :return: True if all prompts were received and the output ends with a prompt.
+    """
+    return buffer.prompt_count() >= expected_prompts and prompt.search(buffer.tail) is not None
+
+
+def config_mode_commands(output: str):
+    """
+    Works out how to get back to global configuration mode from the prompt at the end of the output.
+
+    :param output: Output ending with a prompt.
+    :return: '' if already in global configuration mode, the commands to send otherwise,
+             or None if the prompt is not a privileged one.
+    """
+    prompt = output.rstrip()
+    if prompt.endswith('(config)#'):
+        return ''
+    if prompt.endswith(')#'):
+        return 'end\nconf t'
+    if prompt.endswith('#'):
+        return 'conf t'
+    return None
+
+
+# Keywords of show commands IOS only runs at privilege level 15
+PRIVILEGED_SHOW = ("running-config", "startup-config", "archive", "tech-support")
+
+
+def needs_privilege(command: str) -> bool:
+    """
+    :param command: An exec command, with or without the 'do ' prefix; abbreviations such as 'sh run' are recognised.
+    :return: True if the command needs privilege level 15, which exec channels do not reach without 'enable'.
+    """
+    words = command.split()
+    if words[:1] == ["do"]:
+        words = words[1:]
+    return len(words) >= 2 and len(words[0]) >= 2 and "show".startswith(words[0]) and len(words[1]) >= 3 \
+        and any(keyword.startswith(words[1]) for keyword in PRIVILEGED_SHOW)
@@ -2,9 +2,42 @@
 Module responsible for router configurations.
 """
 from Device import Device
+from AddressPlan import DEFAULT_DNS_SERVERS
+from Commands import dhcp_commands, ripv2_commands
+from Verification import rip_routes
 import logging
 
 class Router(Device):
+    __slots__ = ()
+    device_type = "router"
+
+    async def async_config_RipV2(self, networks: list, redistribute_static: bool = False):
+        """
+        Coroutine configuring RIPv2 without prompting.
+        :param networks: The networks to advertise.
+        :param redistribute_static: Whether static routes should be redistributed.
+        :return: A tuple of (output, error). Error will be None if successful.
+        """
+        logging.info("Starting RIPv2 configuration on %s (%s)", self.name, self.ip)
+        return await self.async_push_config(ripv2_commands(networks, redistribute_static), "ripv2")
+
+    async def async_setup_DHCP(self, ip: str, lan_id, ip_pool: str, subnet_mask: str, switch_nr: int, router_nr: int,
+                               dns_servers=None):
+        """
+        Coroutine configuring a DHCP pool without prompting.
+        :param ip: The router's IP address, used as the default router.
+        :param lan_id: The ID of the LAN, used to name the pool.
+        :param ip_pool: The network address of the DHCP pool.
+        :param subnet_mask: The subnet mask of the pool.
+        :param switch_nr: The number of switches in the LAN.
+        :param router_nr: The number of routers in the LAN.
+        :param dns_servers: Optional DNS servers given to clients.
+        :return: A tuple of (output, error). Error will be None if successful.
+        """
+        logging.info("Starting DHCP setup on %s (%s)", self.name, self.ip)
+        return await self.async_push_config(
+            dhcp_commands(ip, lan_id, ip_pool, subnet_mask, switch_nr, router_nr, dns_servers), "dhcp"
+        )
 
     def config_RipV2(self) -> None:
         """
@@ -14,7 +47,6 @@ class Router(Device):
         """
         try:
             logging.info(f"Starting RIPv2 configuration on {self.name} ({self.ip})")
-            self.connection.connect(self.priv_exec_pass)
 
             # Prompting user for network details
             network_1 = input("Enter the IP address of the first network: ").strip()
@@ -22,38 +54,25 @@ class Router(Device):
             redistrib = input("Do you want to redistribute the static routes from this device? (y/n): ").strip().lower()
 
             # Handling redistribution choice
-            if redistrib == "y":
-                redistribute_cmd = "redistribute static"
-            elif redistrib == "n":
-                redistribute_cmd = ""
-            else:
+            if redistrib not in ("y", "n"):
                 print("Invalid option. Static routes will not be redistributed.")
-                redistribute_cmd = ""
 
             # Building the RIPv2 configuration command
-            ripv2_command = (
-                f"router rip\n"
-                f"version 2\n"
-                f"no auto-summary\n"
-                f"network {network_1}\n"
-                f"network {network_2}\n"
-                f"{redistribute_cmd}\n"
-            )
+            ripv2_command = ripv2_commands([network_1, network_2], redistrib == "y")
 
             # Sending the command to the router
-            stdout, stderr = self.connection.send_command(ripv2_command)
+            stdout, stderr = self.push_config(ripv2_command, operation="ripv2")
 
             # Error handling for command execution
             if stderr:
                 logging.error(f"Error during RIPv2 configuration: {stderr}")
             else:
                 print(f"RIPv2 configuration successful:\n{stdout}")
+                self.report_convergence([rip_routes()])
 
         except Exception as e:
             logging.error(f"An error occurred during RIPv2 configuration: {e}")
             raise
-        finally:
-            self.connection.close()
 
     def setup_DHCP(self, ip: str) -> None:
         """
@@ -63,10 +82,6 @@ class Router(Device):
         """
         try:
             logging.info(f"Starting DHCP setup on {self.name} ({self.ip})")
-            self.connection.connect(self.priv_exec_pass)
-
-            # Deriving the base IP for the network
-            ip_base = '.'.join(ip.split('.')[:3])
 
             # Prompting user for DHCP configuration details
             lan_id = input("Enter the ID of the LAN: ").strip()
@@ -80,24 +95,19 @@ class Router(Device):
                 logging.error("Invalid input. Number of switches and routers must be integers.")
                 print("Please enter valid numbers for the switches and routers.")
                 return
-
-            # Calculating the IP range for excluded addresses
-            last_addr_b = router_nr + 1
-            first_addr_e = 255 - switch_nr
+            dns_servers = input(f"Enter the DNS servers, separated by spaces "
+                                f"(default {' '.join(DEFAULT_DNS_SERVERS)}): ").split() or None
 
             # Constructing the DHCP configuration command
-            dhcp_command = (
-                f"ip dhcp pool LAN{lan_id}\n"
-                f"network {ip_pool} {subnet_mask}\n"
-                f"default router {ip}\n"
-                f"dns-server 8.8.8.8\n"
-                f"exit\n"
-                f"ip dhcp excluded-address {ip_base}.1 {ip_base}.{last_addr_b}\n"
-                f"ip dhcp excluded-address {ip_base}.{first_addr_e} {ip_base}.254\n"
-            )
+            try:
+                dhcp_command = dhcp_commands(ip, lan_id, ip_pool, subnet_mask, switch_nr, router_nr, dns_servers)
+            except ValueError as e:
+                logging.error("Invalid DHCP pool: %s", e)
+                print(f"Invalid DHCP pool: {e}")
+                return
 
             # Sending the DHCP configuration command
-            stdout, stderr = self.connection.send_command(dhcp_command)
+            stdout, stderr = self.push_config(dhcp_command, operation="dhcp")
 
             # Error handling for command execution
             if stderr:
@@ -108,5 +118,3 @@ class Router(Device):
         except Exception as e:
             logging.error(f"An error occurred during DHCP setup: {e}")
             raise
-        finally:
-            self.connection.close()
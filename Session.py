@@ -0,0 +1,168 @@
+"""
+Module responsible for keeping authenticated device sessions open between configuration calls.
+"""
+import atexit
+import logging
+import threading
+import weakref
+from contextlib import contextmanager
+from time import monotonic, sleep
+
+from Preflight import CircuitBreaker, backoff_delays
+
+
+class SessionManager:
+    """
+    A class that hands out open, configuration-mode sessions to devices and reuses them across operations.
+    Sessions idle for longer than the idle timeout are closed, and every session is health-checked before reuse.
+    """
+
+    def __init__(self, idle_timeout=300, reap_interval=30, connect_attempts=1, retry_delay=1.0, connect_timeout=30):
+        """
+        Constructor for SessionManager.
+
+        :param idle_timeout: Seconds a session may stay unused before it is closed.
+        :param reap_interval: Seconds between background sweeps for idle sessions.
+        :param connect_attempts: Connection attempts per session; failed attempts are retried with exponential
+                                 backoff and jitter.
+        :param retry_delay: Upper bound in seconds of the wait before the first retry; it doubles with every retry.
+        :param connect_timeout: Deadline in seconds for each connection attempt.
+        """
+        # Optional CircuitBreaker told about every device that could or could not be connected
+        self.breaker = None
+        self.idle_timeout = idle_timeout
+        self.reap_interval = reap_interval
+        self.connect_attempts = connect_attempts
+        self.retry_delay = retry_delay
+        self.connect_timeout = connect_timeout
+        # Lock of every device with a session; devices no longer used elsewhere drop out with their entry,
+        # and their session is closed then, as neither the reaper nor close_all can reach it anymore
+        self._locks = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+        self._reaper = None
+        self._stop = threading.Event()
+
+    def _device_lock(self, device) -> threading.RLock:
+        """
+        Returns the lock guarding a device's session, registering the device on first use.
+        """
+        with self._lock:
+            lock = self._locks.get(device)
+            if lock is None:
+                lock = self._locks[device] = threading.RLock()
+                # The finalizer holds the connection only, so it does not keep the device alive
+                weakref.finalize(device, device.connection.close)
+            return lock
+
+    @contextmanager
+    def session(self, device):
+        """
+        Borrows an open session to the device for the duration of a 'with' block.
+        The session is reconnected transparently if it went idle for too long or fails its health check.
+
+        :param device: The Device whose connection should be used.
+        :return: The device's DeviceConnection, ready in global configuration mode.
+        """
+        lock = self._device_lock(device)
+        with lock:
+            connection = device.connection
+            if connection.shell and monotonic() - connection.last_used > self.idle_timeout:
+                logging.info("Session to %s (%s) was idle too long, reconnecting.", device.name, device.ip)
+                connection.close()
+            elif connection.shell and not connection.is_alive():
+                logging.warning("Session to %s (%s) failed its health check, reconnecting.", device.name, device.ip)
+                connection.close()
+
+            if not connection.shell:
+                self._connect(device)
+                self._start_reaper()
+            else:
+                logging.info("Reusing open session to %s (%s).", device.name, device.ip)
+
+            try:
+                yield connection
+            finally:
+                connection.last_used = monotonic()
+
+    def _connect(self, device) -> None:
+        """
+        Connects the device's session, retrying failed attempts after a growing, randomised wait.
+        """
+        connection = device.connection
+        connection.connect(device.priv_exec_pass, timeout=self.connect_timeout)
+        for delay in backoff_delays(self.connect_attempts, self.retry_delay):
+            if connection.shell:
+                break
+            logging.warning("Connecting to %s (%s) failed, retrying in %.1fs.", device.name, device.ip, delay)
+            sleep(delay)
+            connection.connect(device.priv_exec_pass, timeout=self.connect_timeout)
+        if self.breaker:
+            key = CircuitBreaker.key(device.ip, connection.port)
+            if connection.shell:
+                self.breaker.record_success(key)
+            else:
+                self.breaker.record_failure(key, connection.last_error)
+
+    def evict_idle(self) -> None:
+        """
+        Closes every session that has not been used within the idle timeout.
+        Sessions currently borrowed by an operation are left alone.
+        """
+        with self._lock:
+            entries = list(self._locks.items())
+
+        now = monotonic()
+        for device, lock in entries:
+            if not lock.acquire(blocking=False):
+                continue
+            try:
+                if device.connected and now - device.connection.last_used > self.idle_timeout:
+                    logging.info("Evicting idle session to %s (%s).", device.name, device.ip)
+                    device.connection.close()
+            finally:
+                lock.release()
+
+    def close(self, device) -> None:
+        """
+        Closes the session to a single device, waiting for any operation using it to finish.
+
+        :param device: The Device whose session should be closed.
+        """
+        with self._lock:
+            lock = self._locks.get(device)
+        # A device that never borrowed a session has nothing to close
+        if lock is None:
+            return
+        with lock:
+            if device.connected:
+                device.connection.close()
+
+    def close_all(self) -> None:
+        """
+        Closes all open sessions and stops the background sweeper.
+        """
+        self._stop.set()
+        with self._lock:
+            devices = list(self._locks)
+        for device in devices:
+            self.close(device)
+
+    def _start_reaper(self) -> None:
+        """
+        Starts the background thread evicting idle sessions, if it is not running yet.
+        """
+        with self._lock:
+            if self._reaper and self._reaper.is_alive():
+                return
+            self._stop.clear()
+            self._reaper = threading.Thread(target=self._reap, name="session-reaper", daemon=True)
+            self._reaper.start()
+
+    def _reap(self) -> None:
+        while not self._stop.wait(self.reap_interval):
+            self.evict_idle()
+
+
+# Session manager shared by all devices unless one is passed explicitly
+session_manager = SessionManager()
+atexit.register(session_manager.close_all)
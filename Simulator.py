@@ -0,0 +1,570 @@
+"""
+Module providing a local SSH stand-in for Cisco IOS devices, used to test and benchmark the connection code
+without real hardware. Each SimulatedDevice listens on its own local port and emulates login, 'ena' with a password,
+configuration mode transitions, prompts, error markers and a running configuration.
+
+Run directly to serve simulated devices and print their inventory records as JSON:
+    python Simulator.py --count 4 --latency 0.01
+"""
+import argparse
+import json
+import logging
+import random
+import socket
+import threading
+from time import monotonic, sleep
+
+import paramiko
+
+from Vlans import parse_vlan_set
+
+# Configuration commands entering a sub-mode, by first word, and the prompt suffix of that sub-mode
+SUBMODES = {
+    "interface": "config-if",
+    "vlan": "config-vlan",
+    "router": "config-router",
+    "line": "config-line",
+}
+# First words of commands that always act on the global configuration, even when typed in a sub-mode
+GLOBAL_COMMANDS = set(SUBMODES) | {"spanning-tree", "hostname", "username", "enable", "service", "banner"}
+
+INVALID_INPUT = "% Invalid input detected at '^' marker."
+INCOMPLETE_COMMAND = "% Incomplete command."
+# Seconds a channel waits for the shell or exec request after it was opened, and for the client to close an exec
+# channel after the output was sent
+CHANNEL_TIMEOUT = 30
+
+_host_key = None
+_host_key_lock = threading.Lock()
+
+
+def _get_host_key() -> paramiko.PKey:
+    """
+    Returns the host key shared by all simulated devices, generating it on first use.
+    """
+    global _host_key
+    with _host_key_lock:
+        if _host_key is None:
+            _host_key = paramiko.RSAKey.generate(2048)
+        return _host_key
+
+
+def is_show(word: str) -> bool:
+    """
+    :return: True if the word is 'show' or an abbreviation of it, such as 'sh'.
+    """
+    return len(word) >= 2 and "show".startswith(word)
+
+
+class _SshServer(paramiko.ServerInterface):
+    """
+    Authentication and channel policy of a simulated device. The shell and exec requests of the channels are
+    recorded here, and served by the device once it accepted the channel.
+    """
+
+    def __init__(self, device):
+        self.device = device
+        # Mapping of channel ID to the (session method, arguments) requested on it
+        self._requests = {}
+        self._requested = threading.Condition()
+
+    def _request(self, channel, target, args=()) -> bool:
+        with self._requested:
+            self._requests[channel.get_id()] = (target, args)
+            self._requested.notify_all()
+        return True
+
+    def wait_request(self, channel, timeout):
+        """
+        :return: The (session method, arguments) requested on the channel, or None if nothing was requested in time.
+        """
+        with self._requested:
+            self._requested.wait_for(lambda: channel.get_id() in self._requests, timeout)
+            return self._requests.pop(channel.get_id(), None)
+
+    def check_auth_password(self, username, password):
+        if username == self.device.username and password == self.device.password:
+            return paramiko.AUTH_SUCCESSFUL
+        return paramiko.AUTH_FAILED
+
+    def get_allowed_auths(self, username):
+        return "password"
+
+    def check_channel_request(self, kind, chanid):
+        if kind == "session":
+            return paramiko.OPEN_SUCCEEDED
+        return paramiko.OPEN_FAILED_ADMINISTRATIVELY_PROHIBITED
+
+    def check_channel_pty_request(self, channel, term, width, height, pixelwidth, pixelheight, modes):
+        return True
+
+    def check_channel_shell_request(self, channel):
+        return self._request(channel, CliSession(self.device, channel).run)
+
+    def check_channel_exec_request(self, channel, command):
+        command = command.decode('utf-8', errors='replace') if isinstance(command, bytes) else command
+        return self._request(channel, CliSession(self.device, channel).run_exec, (command,))
+
+
+class CliSession:
+    """
+    One interactive CLI session on a simulated device, driven character by character like a terminal line.
+    """
+
+    def __init__(self, device, channel):
+        self.device = device
+        self.channel = channel
+        self.modes = ["user"]
+        self.parent = None
+        self.awaiting_password = False
+
+    @property
+    def prompt(self) -> str:
+        mode = self.modes[-1]
+        if mode == "user":
+            return f"{self.device.hostname}>"
+        if mode == "priv":
+            return f"{self.device.hostname}#"
+        return f"{self.device.hostname}({mode})#"
+
+    def write(self, text: str) -> None:
+        self.channel.sendall(text.encode('utf-8'))
+
+    def run(self) -> None:
+        """
+        Serves the session until the client disconnects or types 'exit' in exec mode.
+        """
+        try:
+            self.write(f"\r\n{self.device.banner}\r\n\r\n{self.prompt}")
+            line = bytearray()
+            previous = b""
+            while True:
+                data = self.channel.recv(4096)
+                if not data:
+                    return
+                for byte in data:
+                    char = bytes((byte,))
+                    if char == b"\n" and previous == b"\r":
+                        previous = char
+                        continue
+                    previous = char
+                    if char in (b"\r", b"\n"):
+                        if not self.handle_line(line.decode('utf-8', errors='replace').strip()):
+                            return
+                        line.clear()
+                    else:
+                        line += char
+                        if not self.awaiting_password:
+                            self.write(char.decode('utf-8', errors='replace'))
+        except (OSError, EOFError, paramiko.SSHException):
+            return
+        finally:
+            self.channel.close()
+
+    def run_exec(self, command: str) -> None:
+        """
+        Runs a single command on an exec channel, in user or privileged exec mode, and closes the channel.
+        """
+        try:
+            self.modes = ["user", "priv"] if self.device.exec_privileged else ["user"]
+            self.device.delay()
+            output = self.execute(command)
+            if output:
+                self.write(output + "\r\n")
+            self.channel.send_exit_status(1 if output.startswith("%") else 0)
+            # The reply to the exec request is sent by the transport thread after the check, so closing here
+            # could overtake it. Send EOF instead, and close once the client has read everything and closed.
+            self.channel.shutdown_write()
+            self.channel.settimeout(CHANNEL_TIMEOUT)
+            while self.channel.recv(4096):
+                pass
+        except (OSError, EOFError, paramiko.SSHException):
+            pass
+        finally:
+            self.channel.close()
+
+    def handle_line(self, line: str) -> bool:
+        """
+        Processes one line typed by the client and writes the reply followed by the next prompt.
+
+        :return: False if the session should end.
+        """
+        self.device.delay()
+        if self.awaiting_password:
+            self.awaiting_password = False
+            if line == self.device.enable_password:
+                self.modes.append("priv")
+                self.write(f"\r\n{self.prompt}")
+            else:
+                self.write(f"\r\n% Bad secrets\r\n\r\n{self.prompt}")
+            return True
+
+        self.write("\r\n")
+        mode = self.modes[-1]
+        if line in ("ena", "enable") and mode == "user":
+            self.awaiting_password = True
+            self.write("Password: ")
+            return True
+        if line == "exit" and mode in ("user", "priv"):
+            return False
+
+        output = self.execute(line) if line else ""
+        if output:
+            self.write(output.replace("\n", "\r\n") + "\r\n")
+        self.write(self.prompt)
+        return True
+
+    def execute(self, line: str) -> str:
+        """
+        Executes a command in the current mode.
+
+        :return: The command's output, possibly an IOS error marker.
+        """
+        mode = self.modes[-1]
+        words = line.split()
+        if not words:
+            return ""
+
+        if mode in ("user", "priv"):
+            # The configuration is only shown at privilege level 15
+            if mode == "user" and is_show(words[0]) and words[1:2] and \
+                    any(keyword.startswith(words[1]) for keyword in ("running-config", "startup-config")):
+                return INVALID_INPUT
+            if is_show(words[0]):
+                return self.device.show(" ".join(words[1:]))
+            if mode == "priv" and line in ("conf t", "configure terminal"):
+                self.modes.append("config")
+                return "Enter configuration commands, one per line.  End with CNTL/Z."
+            if mode == "priv" and words[:2] == ["terminal", "length"]:
+                return ""
+            if mode == "priv" and line == "disable":
+                self.modes.pop()
+                return ""
+            return INVALID_INPUT
+
+        # Configuration modes
+        if line == "end":
+            self.modes = ["user", "priv"]
+            return ""
+        if line == "exit":
+            self.modes.pop()
+            self.parent = None
+            return ""
+        if words[0] == "do":
+            return self.device.show(" ".join(words[2:])) if words[1:2] and is_show(words[1]) else INVALID_INPUT
+        if words[0] in self.device.reject:
+            return INVALID_INPUT
+        if words[0] in SUBMODES and len(words) == 1:
+            return INCOMPLETE_COMMAND
+
+        if mode == "config" or words[0] in GLOBAL_COMMANDS or words[:2] == ["ip", "dhcp"]:
+            self.modes = ["user", "priv", "config"]
+            self.parent = None
+            submode = SUBMODES.get(words[0])
+            if words[:3] == ["ip", "dhcp", "pool"]:
+                submode = "dhcp-config"
+            if submode:
+                self.modes.append(submode)
+                self.parent = line
+            self.device.configure(line)
+        else:
+            self.device.configure(line, parent=self.parent)
+        return ""
+
+
+class SimulatedDevice:
+    """
+    A class emulating one IOS device over SSH on a local port.
+    Latency, jitter and output size are injectable so connection performance can be measured reproducibly.
+    """
+
+    def __init__(self, hostname="SimSW", username="admin", password="cisco", enable_password="class",
+                 latency=0.0, jitter=0.0, output_lines=0, host="127.0.0.1", port=0, reject=("invalid",),
+                 device_type="normal_sw", converge_delay=0.0, exec_privileged=False):
+        """
+        Constructor for SimulatedDevice.
+
+        :param hostname: Hostname shown in the prompt.
+        :param username: The username accepted for SSH login.
+        :param password: The password accepted for SSH login.
+        :param enable_password: The password accepted by 'ena'.
+        :param latency: Seconds the device waits before answering each line.
+        :param jitter: Maximum extra random delay in seconds added to the latency.
+        :param output_lines: Number of filler lines appended to every 'show' output.
+        :param host: Address to listen on.
+        :param port: Port to listen on; 0 picks a free one.
+        :param reject: First words of configuration commands answered with '% Invalid input'.
+        :param device_type: The 'type' reported in the device's inventory record.
+        :param converge_delay: Seconds after the last configuration change before HSRP becomes active,
+                               the switch becomes STP root and RIP networks show up.
+        :param exec_privileged: Run exec channel commands at privilege level 15, as for an account configured with
+                                'privilege 15'; by default they run in user exec mode, like any command before 'ena'.
+        """
+        self.hostname = hostname
+        self.username = username
+        self.password = password
+        self.enable_password = enable_password
+        self.latency = latency
+        self.jitter = jitter
+        self.output_lines = output_lines
+        self.host = host
+        self.port = port
+        self.reject = set(reject)
+        self.device_type = device_type
+        self.converge_delay = converge_delay
+        self.exec_privileged = exec_privileged
+        self.changed_at = monotonic()
+        self.banner = f"{hostname} - simulated IOS device"
+        self.running_config = {}
+        self.config_lock = threading.Lock()
+        self._socket = None
+        # Transports of the connected clients, removed once they disconnect
+        self._transports = set()
+        self._stopped = threading.Event()
+
+    def delay(self) -> None:
+        """
+        Waits for the configured latency plus a random jitter.
+        """
+        wait = self.latency + (random.uniform(0, self.jitter) if self.jitter else 0)
+        if wait > 0:
+            sleep(wait)
+
+    def configure(self, line: str, parent: str = None) -> None:
+        """
+        Applies a configuration line to the running configuration.
+
+        :param line: The configuration command.
+        :param parent: The sub-mode line the command was typed under (e.g. 'interface Gi0/1'), if any.
+        """
+        with self.config_lock:
+            self.changed_at = monotonic()
+            if parent is None:
+                if line.startswith("no "):
+                    self.running_config.pop(line[3:], None)
+                else:
+                    self.running_config.setdefault(line, [])
+                return
+            children = self.running_config.setdefault(parent, [])
+            if line.startswith("no "):
+                if line[3:] in children:
+                    children.remove(line[3:])
+            elif line not in children:
+                children.append(line)
+
+    def show(self, what: str) -> str:
+        """
+        Produces the output of a 'show' command.
+
+        :param what: The arguments of the 'show' command (e.g. 'running-config').
+        :return: The output text.
+        """
+        if what in ("running-config", "run"):
+            with self.config_lock:
+                sections = [f"hostname {self.hostname}"]
+                for line, children in self.running_config.items():
+                    sections.append("\n".join([line] + [f" {child}" for child in children]))
+            body = "\n!\n".join(sections)
+            output = f"Building configuration...\n\nCurrent configuration : {len(body)} bytes\n!\n{body}\n!\nend"
+        elif what in ("vlan brief", "vlan"):
+            output = self.vlan_brief()
+        elif what in ("standby brief", "standby", "spanning-tree summary", "ip rip database"):
+            output = self.protocol_state(what)
+        elif what:
+            output = f"{what} output of {self.hostname}"
+        else:
+            return INCOMPLETE_COMMAND
+        if self.output_lines:
+            output += "".join(f"\nline {index:06d} of simulated output for {what}" for index in range(self.output_lines))
+        return output
+
+    def vlan_brief(self) -> str:
+        """
+        :return: 'show vlan brief' output listing the default VLAN and every VLAN in the running configuration.
+        """
+        vlans = {1: "default"}
+        with self.config_lock:
+            for line, children in self.running_config.items():
+                if line.startswith("vlan "):
+                    # The last 'name' wins, as a later name replaces the earlier one on IOS
+                    name = next((child[5:] for child in reversed(children) if child.startswith("name ")), None)
+                    try:
+                        ids = parse_vlan_set(line[5:])
+                    except ValueError:
+                        continue
+                    for vlan in ids:
+                        vlans[vlan] = name or vlans.get(vlan) or f"VLAN{vlan:04d}"
+        lines = ["VLAN Name                             Status    Ports",
+                 "---- -------------------------------- --------- -------------------------------"]
+        lines += [f"{vlan:<4} {name:<32} active" for vlan, name in sorted(vlans.items())]
+        return "\n".join(lines)
+
+    def protocol_state(self, what: str) -> str:
+        """
+        :param what: 'standby brief', 'spanning-tree summary' or 'ip rip database'.
+        :return: The output of the command, derived from the running configuration. Until the convergence delay
+                 has passed since the last change, HSRP groups are in Speak state, the switch is not root and
+                 RIP has no networks.
+        """
+        converged = monotonic() - self.changed_at >= self.converge_delay
+        with self.config_lock:
+            config = {line: list(children) for line, children in self.running_config.items()}
+
+        if what.startswith("standby"):
+            lines = ["                     P indicates configured to preempt.", "                     |",
+                     "Interface   Grp  Pri P State   Active          Standby         Virtual IP"]
+            for line, children in config.items():
+                if not line.startswith("interface "):
+                    continue
+                groups = {}
+                for child in children:
+                    words = child.split()
+                    if len(words) >= 3 and words[0] == "standby" and words[1].isdigit():
+                        groups.setdefault(words[1], {})[words[2]] = words[3] if len(words) > 3 else True
+                for group, settings in groups.items():
+                    if "ip" in settings:
+                        lines.append(f"{line[10:]:<11} {group:<4} {settings.get('priority', 100):<3} "
+                                     f"{'P' if 'preempt' in settings else ' '} "
+                                     f"{'Active' if converged else 'Speak':<7} "
+                                     f"{'local' if converged else 'unknown':<15} "
+                                     f"{'unknown':<15} {settings['ip']}")
+            return "\n".join(lines)
+
+        if what.startswith("spanning-tree"):
+            mode = next((line.split()[2] for line in config if line.startswith("spanning-tree mode ")), "pvst")
+            roots = sorted(int(line.split()[2]) for line in config
+                           if line.startswith("spanning-tree vlan ") and line.endswith(" root primary")
+                           and line.split()[2].isdigit())
+            lines = [f"Switch is in {mode} mode"]
+            if converged and roots:
+                lines.append(f"Root bridge for: {', '.join(f'VLAN{vlan:04d}' for vlan in roots)}")
+            lines += ["Name                   Blocking Listening Learning Forwarding STP Active",
+                      "---------------------- -------- --------- -------- ---------- ----------"]
+            lines += [f"VLAN{vlan:04d}                     0         0        0          1          1"
+                      for vlan in sorted(set(roots) | {1})]
+            return "\n".join(lines)
+
+        networks = [child.split()[1] for child in config.get("router rip", []) if child.startswith("network ")]
+        if not converged:
+            return ""
+        # Network statements are classful
+        prefixes = [8 if int(network.split(".")[0]) < 128 else 16 if int(network.split(".")[0]) < 192 else 24
+                    for network in networks]
+        return "\n".join(f"{network}/{prefix}    directly connected, GigabitEthernet0/{index}"
+                         for index, (network, prefix) in enumerate(zip(networks, prefixes)))
+
+    def record(self) -> dict:
+        """
+        :return: An inventory record pointing at this simulated device.
+        """
+        return {
+            "type": self.device_type,
+            "name": self.hostname,
+            "ip": self.host,
+            "port": self.port,
+            "username": self.username,
+            "password": self.password,
+            "privileged_password": self.enable_password,
+        }
+
+    def start(self) -> "SimulatedDevice":
+        """
+        Starts listening for SSH connections in a background thread.
+
+        :return: The device itself.
+        """
+        _get_host_key()
+        self._socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._socket.bind((self.host, self.port))
+        self._socket.listen(128)
+        self.port = self._socket.getsockname()[1]
+        threading.Thread(target=self._accept, name=f"sim-{self.hostname}", daemon=True).start()
+        logging.info(f"Simulated device {self.hostname} listening on {self.host}:{self.port}.")
+        return self
+
+    def stop(self) -> None:
+        """
+        Stops listening and drops all client connections.
+        """
+        self._stopped.set()
+        if self._socket:
+            self._socket.close()
+        for transport in list(self._transports):
+            transport.close()
+
+    def _accept(self) -> None:
+        while not self._stopped.is_set():
+            try:
+                client, _ = self._socket.accept()
+            except OSError:
+                return
+            threading.Thread(target=self._serve, args=(client,), daemon=True).start()
+
+    def _serve(self, client) -> None:
+        """
+        Serves one client connection: accepts its channels and starts the session requested on each of them.
+        """
+        transport = None
+        try:
+            transport = paramiko.Transport(client)
+            self._transports.add(transport)
+            transport.add_server_key(_get_host_key())
+            server = _SshServer(self)
+            transport.start_server(server=server)
+            while transport.is_active() and not self._stopped.is_set():
+                channel = transport.accept(timeout=1)
+                if channel is not None:
+                    threading.Thread(target=self._session, args=(server, channel), daemon=True).start()
+        except (OSError, EOFError, paramiko.SSHException) as e:
+            logging.debug(f"Simulated device {self.hostname} dropped a client: {e}")
+        finally:
+            if transport is not None:
+                transport.close()
+                self._transports.discard(transport)
+
+    @staticmethod
+    def _session(server, channel) -> None:
+        request = server.wait_request(channel, CHANNEL_TIMEOUT)
+        if request is None:
+            channel.close()
+            return
+        target, args = request
+        target(*args)
+
+
+def start_fleet(count: int, **options) -> list:
+    """
+    Starts several simulated devices on free local ports.
+
+    :param count: Number of devices.
+    :param options: SimulatedDevice options shared by all devices.
+    :return: The started SimulatedDevice objects.
+    """
+    return [SimulatedDevice(hostname=f"SimSW{index}", **options).start() for index in range(1, count + 1)]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Serve simulated IOS devices over SSH on local ports.")
+    parser.add_argument("--count", type=int, default=1, help="number of simulated devices")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds before each reply")
+    parser.add_argument("--jitter", type=float, default=0.0, help="maximum random extra delay in seconds")
+    parser.add_argument("--output-lines", type=int, default=0, help="filler lines added to 'show' outputs")
+    parser.add_argument("--base-port", type=int, default=0, help="first port to listen on (default: any free port)")
+    args = parser.parse_args()
+
+    devices = [
+        SimulatedDevice(hostname=f"SimSW{index + 1}", latency=args.latency, jitter=args.jitter,
+                        output_lines=args.output_lines, port=args.base_port + index if args.base_port else 0).start()
+        for index in range(args.count)
+    ]
+    print(json.dumps([device.record() for device in devices]), flush=True)
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        for device in devices:
+            device.stop()
+
+
+if __name__ == "__main__":
+    main()
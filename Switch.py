@@ -2,12 +2,87 @@
 Module responsible for switch configurations.
 """
 from Device import Device
+from Commands import port_security_commands, stp_commands, vlan_commands
+from ConfigCache import running_config_cache
+from Metrics import metrics
+from Verification import stp_root
+from Vlans import parse_trunk_allowed, parse_vlan_brief, trunk_vlan_commands, vlan_bulk_commands
 import logging
 
 class Switch(Device):
     """
     Class responsible for switch-specific configurations, including security, STP, and VLAN settings.
     """
+    __slots__ = ()
+    device_type = "switch"
+
+    async def async_config_Security(self, interface: str, vlan):
+        """
+        Coroutine configuring port security on an interface without prompting.
+        :param interface: The interface to configure (e.g., 'GigabitEthernet0/1').
+        :param vlan: The VLAN ID to allow on the interface.
+        :return: A tuple of (output, error). Error will be None if successful.
+        """
+        logging.info("Starting security configuration on %s (%s)", self.name, self.ip)
+        return await self.async_push_config(port_security_commands(interface, vlan), "port_security")
+
+    async def async_config_STP(self, primary_vlan=None, secondary_vlan=None):
+        """
+        Coroutine configuring STP without prompting.
+        :param primary_vlan: Optional VLAN ID for which this switch becomes root primary.
+        :param secondary_vlan: Optional VLAN ID for which this switch becomes root secondary.
+        :return: A tuple of (output, error). Error will be None if successful.
+        """
+        logging.info("Starting STP configuration on %s (%s)", self.name, self.ip)
+        return await self.async_push_config(stp_commands(primary_vlan, secondary_vlan), "stp")
+
+    async def async_config_Vlan(self, vlan_id, vlan_name: str):
+        """
+        Coroutine creating a named VLAN without prompting.
+        :param vlan_id: The numeric VLAN ID.
+        :param vlan_name: The name of the VLAN.
+        :return: A tuple of (output, error). Error will be None if successful.
+        """
+        try:
+            vlan_command = vlan_commands(vlan_id, vlan_name)
+        except ValueError as ve:
+            logging.error("Invalid input: %s", ve)
+            return None, str(ve)
+        logging.info("Starting VLAN configuration on %s (%s)", self.name, self.ip)
+        return await self.async_push_config(vlan_command, "vlan")
+
+    def provision_vlans(self, vlans=None, names=None, trunks=None):
+        """
+        Creates a set of VLANs and updates trunk allowed lists in one session, without prompting.
+        VLANs the switch already has and VLANs already allowed on a trunk are skipped.
+        :param vlans: VLAN set, e.g. '10-20,30' or [10, 11, 12].
+        :param names: Optional mapping of VLAN ID to name.
+        :param trunks: Optional mapping of trunk interface to its change: {"add": ..., "remove": ...}
+                       or {"replace": ...}, each a VLAN set.
+        :return: A tuple of (output, error). Output is empty if the switch already had everything.
+        """
+        logging.info("Starting bulk VLAN provisioning on %s (%s)", self.name, self.ip)
+        with self.session() as connection:
+            with metrics.span("config_diff", **self.metric_labels("vlan_bulk")):
+                output, error = connection.send_command("do show vlan brief", timeout=120)
+                if error:
+                    logging.error("Could not read the VLANs of %s: %s", self.name, error)
+                    return output, error
+                try:
+                    commands = vlan_bulk_commands(vlans, names, parse_vlan_brief(output))
+                    if trunks:
+                        running = running_config_cache.get(self)
+                        for interface, change in trunks.items():
+                            commands += trunk_vlan_commands(interface, allowed=parse_trunk_allowed(running, interface),
+                                                            **change)
+                except (ValueError, RuntimeError) as e:
+                    logging.error("Invalid VLAN provisioning request: %s", e)
+                    return None, str(e)
+
+            if not commands:
+                logging.info("%s (%s) already has these VLANs, nothing to push.", self.name, self.ip)
+                return "", None
+            return self.push_config(commands, operation="vlan_bulk")
 
     def config_Security(self) -> None:
         """
@@ -16,20 +91,14 @@ class Switch(Device):
         """
         try:
             logging.info(f"Starting security configuration on {self.name} ({self.ip})")
-            self.connection.connect(self.priv_exec_pass)
 
             # User inputs
             interface = input("Enter the name of the interface for security configuration (e.g., 'GigabitEthernet0/1'): ").strip()
             vlan = input("Enter the VLAN ID to allow on the interface: ").strip()
 
             # Constructing and sending the command
-            command = (
-                f"interface {interface}\n"
-                f"switchport mode access\n"
-                f"switchport access vlan {vlan}\n"
-                f"switchport port-security\n"
-            )
-            stdout, stderr = self.connection.send_command(command)
+            command = port_security_commands(interface, vlan)
+            stdout, stderr = self.push_config(command, operation="port_security")
 
             if stderr:
                 logging.error(f"Error in security configuration: {stderr}")
@@ -39,8 +108,6 @@ class Switch(Device):
         except Exception as e:
             logging.error(f"An error occurred during security configuration: {e}")
             raise
-        finally:
-            self.connection.close()
 
     def config_STP(self) -> None:
         """
@@ -49,35 +116,33 @@ class Switch(Device):
         """
         try:
             logging.info(f"Starting STP configuration on {self.name} ({self.ip})")
-            self.connection.connect(self.priv_exec_pass)
 
             # Prompting user for VLAN inputs
             primary_vlan = input("Enter the VLAN ID to set as primary (or 'q' to skip): ").strip()
             secondary_vlan = input("Enter the VLAN ID to set as secondary (or 'q' to skip): ").strip()
 
             # Building the STP configuration command
-            stp_command = "spanning-tree mode rapid-pvst\n"
-            if primary_vlan != 'q':
-                stp_command += f"spanning-tree vlan {primary_vlan} root primary\n"
-            if secondary_vlan != 'q':
-                stp_command += f"spanning-tree vlan {secondary_vlan} root secondary\n"
+            stp_command = stp_commands(
+                None if primary_vlan == 'q' else primary_vlan,
+                None if secondary_vlan == 'q' else secondary_vlan
+            )
 
             if 'q' in [primary_vlan, secondary_vlan]:
                 logging.warning("Skipping some VLAN root settings based on user input.")
 
             # Sending the command
-            stdout, stderr = self.connection.send_command(stp_command)
+            stdout, stderr = self.push_config(stp_command, operation="stp")
 
             if stderr:
                 logging.error(f"Error in STP configuration: {stderr}")
             else:
                 print(f"STP configuration successful:\n{stdout}")
+                if primary_vlan.isdigit():
+                    self.report_convergence([stp_root(primary_vlan)])
 
         except Exception as e:
             logging.error(f"An error occurred during STP configuration: {e}")
             raise
-        finally:
-            self.connection.close()
 
     def config_Vlan(self) -> None:
         """
@@ -86,18 +151,14 @@ class Switch(Device):
         """
         try:
             logging.info(f"Starting VLAN configuration on {self.name} ({self.ip})")
-            self.connection.connect(self.priv_exec_pass)
 
             # Prompting user for VLAN ID and name
             vlan_id = input("Enter the VLAN ID to create (e.g., '10'): ").strip()
             vlan_name = input("Enter the name of the VLAN (e.g., 'Management_VLAN'): ").strip()
 
-            if not vlan_id.isdigit():
-                raise ValueError(f"VLAN ID should be numeric. Received: {vlan_id}")
-
-            # Constructing and sending the VLAN configuration command
-            vlan_command = f"vlan {vlan_id}\nname {vlan_name}\n"
-            stdout, stderr = self.connection.send_command(vlan_command)
+            # Constructing and sending the VLAN configuration command (raises ValueError for a non-numeric ID)
+            vlan_command = vlan_commands(vlan_id, vlan_name)
+            stdout, stderr = self.push_config(vlan_command, operation="vlan")
 
             if stderr:
                 logging.error(f"Error in VLAN configuration: {stderr}")
@@ -110,5 +171,3 @@ class Switch(Device):
         except Exception as e:
             logging.error(f"An error occurred during VLAN configuration: {e}")
             raise
-        finally:
-            self.connection.close()
@@ -0,0 +1,206 @@
+"""
+Module responsible for verifying that protocols converged after a change, instead of operators polling by hand.
+The expected state of a device is described by conditions on parsed show output. Devices are polled over their open
+sessions, quickly while their state keeps changing and less and less often while it does not, until every condition
+is met or a deadline passes. Many devices are verified concurrently.
+"""
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from time import monotonic, sleep
+
+from ConfigCache import normalize
+from Fleet import DeviceResult, FleetReport
+from Metrics import metrics
+from Parsers import RipRoute, StandbyEntry, StpMode
+
+# HSRP states in which a router took part in the election
+HSRP_ELECTED = ("Active", "Standby")
+# Pending conditions named in logs and errors; the rest are counted
+MAX_LISTED = 5
+
+
+@dataclass(frozen=True)
+class Condition:
+    """
+    A state a device should reach, read from the parsed output of one show command.
+    """
+    description: str
+    command: str
+    # Callable reducing the parsed records to the state the condition looks at; it must be comparable
+    observe: object
+    # Callable telling whether the observed state is the expected one
+    expect: object
+
+    def evaluate(self, records: list) -> tuple:
+        """
+        :param records: The parsed output of the condition's command.
+        :return: A tuple of (observed state, whether the condition is met).
+        """
+        observed = self.observe(records)
+        return observed, bool(self.expect(observed))
+
+
+def hsrp_converged(interface: str, group, state: str = None, peer: bool = True) -> Condition:
+    """
+    :param interface: The HSRP interface (e.g. 'Gi0/1').
+    :param group: The standby group.
+    :param state: Optional state the device should be in, 'Active' or 'Standby'; either will do if omitted.
+    :param peer: Also require the other role of the group to be filled by a peer.
+    :return: Condition met once the device took part in the election of the group.
+    """
+    key = normalize(f"interface {interface}")
+    group = int(group)
+
+    def observe(records):
+        for entry in records:
+            if isinstance(entry, StandbyEntry) and entry.group == group \
+                    and normalize(f"interface {entry.interface}") == key:
+                return entry.state, entry.active, entry.standby
+        return None
+
+    def expect(observed):
+        if observed is None:
+            return False
+        local, active, standby = observed
+        if local not in HSRP_ELECTED or (state and local != state):
+            return False
+        return not peer or (standby if local == "Active" else active) != "unknown"
+
+    description = f"HSRP group {group} on {interface} {state or 'Active or Standby'}"
+    return Condition(description + (" with a peer" if peer else ""), "show standby brief", observe, expect)
+
+
+def stp_root(vlan) -> Condition:
+    """
+    :param vlan: The VLAN ID.
+    :return: Condition met once the device is the root bridge of the VLAN.
+    """
+    vlan = int(vlan)
+
+    def observe(records):
+        return next((entry.root_for for entry in records if isinstance(entry, StpMode)), ())
+
+    return Condition(f"STP root for VLAN {vlan}", "show spanning-tree summary", observe,
+                     lambda root_for: vlan in root_for)
+
+
+def rip_routes(networks=None, learned: bool = True) -> Condition:
+    """
+    :param networks: Optional networks in CIDR notation (e.g. ['192.168.2.0/24']) that must all be in the RIP
+                     database; any route will do if omitted.
+    :param learned: Only count routes learnt from a neighbor, not directly connected networks.
+    :return: Condition met once the RIP database holds the routes.
+    """
+    networks = frozenset(networks or ())
+
+    def observe(records):
+        return frozenset(entry.network for entry in records
+                         if isinstance(entry, RipRoute) and (entry.next_hop is not None or not learned))
+
+    def expect(found):
+        return networks <= found if networks else bool(found)
+
+    kind = "learnt " if learned else ""
+    description = f"RIP {kind}routes to {', '.join(sorted(networks))}" if networks else f"RIP {kind}routes"
+    return Condition(description, "show ip rip database", observe, expect)
+
+
+def describe(pending: list) -> str:
+    """
+    :param pending: Descriptions of the pending conditions.
+    :return: The descriptions joined, with those beyond MAX_LISTED counted instead of listed.
+    """
+    listed = "; ".join(pending[:MAX_LISTED])
+    return f"{listed} and {len(pending) - MAX_LISTED} more" if len(pending) > MAX_LISTED else listed
+
+
+def wait_for(device, conditions: list, timeout: float = 60, interval: float = 0.5, max_interval: float = 8.0,
+             backoff: float = 2.0) -> tuple:
+    """
+    Polls a device over its session until every condition is met or the deadline passes.
+    The wait between polls starts at 'interval' and grows by 'backoff' while the observed state stays the same,
+    and drops back to 'interval' as soon as it changes, since the device is then converging.
+
+    :param device: The Device.
+    :param conditions: List of Condition.
+    :param timeout: Deadline in seconds.
+    :param interval: Shortest wait between polls, in seconds.
+    :param max_interval: Longest wait between polls, in seconds.
+    :param backoff: Factor the wait grows by while nothing changes.
+    :return: A tuple of (outcome, error). The outcome holds 'converged', 'polls', 'duration', and the descriptions
+             of the 'met' and 'pending' conditions. Error is None once every condition is met.
+    """
+    commands = list(dict.fromkeys(condition.command for condition in conditions))
+    started = monotonic()
+    deadline = started + timeout
+    delay = interval
+    previous = None
+    polls = 0
+    with metrics.span("verify", **device.metric_labels("verify")):
+        while True:
+            polls += 1
+            records = {}
+            errors = []
+            for command in commands:
+                result, error = device.show_records(command, timeout=max(1.0, deadline - monotonic()))
+                records[command] = result
+                if error:
+                    errors.append(f"{command}: {error}")
+            evaluated = [condition.evaluate(records[condition.command]) for condition in conditions]
+            pending = [condition.description for condition, (_, met) in zip(conditions, evaluated) if not met]
+            remaining = deadline - monotonic()
+            if not pending or remaining <= 0:
+                break
+            state = tuple(observed for observed, _ in evaluated)
+            delay = interval if state != previous else min(max_interval, delay * backoff)
+            previous = state
+            logging.info("%s: waiting %.1fs for %s", device.name, delay, describe(pending))
+            sleep(min(delay, remaining))
+
+    outcome = {
+        "converged": not pending,
+        "polls": polls,
+        "duration": monotonic() - started,
+        "met": [condition.description for condition, (_, met) in zip(conditions, evaluated) if met],
+        "pending": pending,
+    }
+    if not pending:
+        logging.info("%s (%s) converged after %d polls in %.1fs.", device.name, device.ip, polls, outcome['duration'])
+        return outcome, None
+    error = f"Not converged after {outcome['duration']:.1f}s: {describe(pending)}"
+    if errors:
+        error += f" (last errors: {'; '.join(errors)})"
+    logging.error("%s (%s): %s", device.name, device.ip, error)
+    return outcome, error
+
+
+def verify_all(checks, timeout: float = 60, max_workers: int = 10, **polling) -> FleetReport:
+    """
+    Verifies many devices concurrently, see wait_for. Every device is polled over its own session,
+    and the call returns once every device converged or the deadline passed.
+
+    :param checks: Iterable of (Device, list of Condition) pairs.
+    :param timeout: Deadline in seconds, shared by all devices.
+    :param max_workers: Maximum number of devices polled at the same time.
+    :param polling: Further arguments of wait_for (interval, max_interval, backoff).
+    :return: A FleetReport with one result per device; the output of each result is the wait_for outcome.
+    """
+    checks = list(checks)
+    started = monotonic()
+
+    def verify_one(device, conditions) -> DeviceResult:
+        device_started = monotonic()
+        try:
+            outcome, error = wait_for(device, conditions, max(0.0, started + timeout - monotonic()), **polling)
+        except Exception as e:
+            logging.error("Verification failed on %s (%s): %s", device.name, device.ip, e)
+            outcome, error = None, str(e)
+        return DeviceResult(device.name, device.ip, device.device_type, not error, monotonic() - device_started,
+                            outcome, error)
+
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(checks) or 1)),
+                            thread_name_prefix="verify") as pool:
+        futures = [pool.submit(verify_one, device, conditions) for device, conditions in checks]
+        results = [future.result() for future in futures]
+    return FleetReport(results=results, duration=monotonic() - started)
@@ -0,0 +1,201 @@
+"""
+Module responsible for bulk VLAN provisioning: parsing VLAN sets, compressing them into IOS ranges
+(e.g. 'vlan 10-20,30') and reducing them to what a switch does not have yet, including trunk allowed lists.
+"""
+import logging
+
+from ConfigCache import normalize
+from Inventory import Inventory, device_role
+from Parsers import parse_vlan_brief as parse_vlan_brief_records
+
+MIN_VLAN = 1
+MAX_VLAN = 4094
+# VLANs every switch has and that can be neither created nor renamed
+DEFAULT_VLANS = frozenset({1, 1002, 1003, 1004, 1005})
+# Longest VLAN list written on one command line; longer lists are split over several commands
+MAX_RANGE_LENGTH = 200
+TRUNK_ALLOWED = "switchport trunk allowed vlan"
+
+
+def parse_vlan_set(spec) -> set:
+    """
+    Parses a VLAN set given as an ID, a range string such as '10-20,30', or an iterable of either.
+
+    :param spec: The VLAN set.
+    :return: The set of VLAN IDs.
+    :raises: ValueError if an ID is not numeric or outside 1-4094.
+    """
+    if spec is None:
+        return set()
+    if isinstance(spec, int):
+        parts = [str(spec)]
+    elif isinstance(spec, str):
+        parts = spec.replace(" ", "").split(",")
+    else:
+        vlans = set()
+        for item in spec:
+            vlans |= parse_vlan_set(item)
+        return vlans
+
+    vlans = set()
+    for part in filter(None, parts):
+        first, _, last = part.partition("-")
+        if not first.isdigit() or (last and not last.isdigit()):
+            raise ValueError(f"VLAN ID should be numeric. Received: {part}")
+        first, last = int(first), int(last or first)
+        if first > last or first < MIN_VLAN or last > MAX_VLAN:
+            raise ValueError(f"VLAN range {part} is outside {MIN_VLAN}-{MAX_VLAN}.")
+        vlans.update(range(first, last + 1))
+    return vlans
+
+
+def compress_vlans(vlans) -> list:
+    """
+    Compresses VLAN IDs into IOS range lists, e.g. {10, 11, 12, 30} -> ['10-12,30'].
+
+    :param vlans: The VLAN IDs.
+    :return: Range lists, each short enough for one command line; empty if there are no VLANs.
+    """
+    ranges = []
+    for vlan in sorted(vlans):
+        if ranges and vlan == ranges[-1][1] + 1:
+            ranges[-1][1] = vlan
+        else:
+            ranges.append([vlan, vlan])
+
+    lines = []
+    current = ""
+    for first, last in ranges:
+        part = str(first) if first == last else f"{first}-{last}"
+        if current and len(current) + len(part) + 1 > MAX_RANGE_LENGTH:
+            lines.append(current)
+            current = ""
+        current = f"{current},{part}" if current else part
+    if current:
+        lines.append(current)
+    return lines
+
+
+def parse_vlan_brief(output: str) -> dict:
+    """
+    Parses 'show vlan brief' output.
+
+    :param output: The command output, see Parsers.lines_of.
+    :return: Mapping of VLAN ID to VLAN name.
+    """
+    return {entry.vlan: entry.name for entry in parse_vlan_brief_records(output)}
+
+
+def parse_trunk_allowed(running: dict, interface: str) -> set:
+    """
+    Reads the VLANs allowed on a trunk from a parsed running configuration.
+
+    :param running: Parsed running configuration, as returned by ConfigCache.parse_running_config.
+    :param interface: The trunk interface (e.g. 'Gi0/1').
+    :return: The allowed VLAN IDs; all VLANs if the interface has no allowed list.
+    """
+    children = running.get(normalize(f"interface {interface}"), set())
+    lines = [line[len(TRUNK_ALLOWED):].split() for line in children if line.startswith(TRUNK_ALLOWED + " ")]
+    if not lines:
+        return set(range(MIN_VLAN, MAX_VLAN + 1))
+
+    allowed = set()
+    for words in lines:
+        if words[0] == "all":
+            return set(range(MIN_VLAN, MAX_VLAN + 1))
+        if words[0] == "add":
+            words = words[1:]
+        if words and words[0] not in ("none", "except", "remove"):
+            allowed |= parse_vlan_set(words[0])
+    return allowed
+
+
+def vlan_bulk_commands(vlans=None, names=None, existing=None) -> str:
+    """
+    Builds the fewest commands creating a set of VLANs. Unnamed VLANs are created with range commands;
+    named VLANs get their own section, since a name applies to a single VLAN.
+
+    :param vlans: VLAN set (see parse_vlan_set), e.g. '10-20,30'.
+    :param names: Optional mapping of VLAN ID to name; these VLANs are created too.
+    :param existing: Optional mapping of VLAN ID to name already on the switch (see parse_vlan_brief).
+                     Existing VLANs are skipped, unless they need to be renamed.
+    :return: The command block; empty if nothing needs to be created.
+    :raises: ValueError if a VLAN ID is invalid.
+    """
+    names = {int(vlan): name for vlan, name in (names or {}).items()}
+    wanted = (parse_vlan_set(vlans) | parse_vlan_set(list(names))) - DEFAULT_VLANS
+    existing = existing or {}
+
+    named = sorted(vlan for vlan in wanted if vlan in names and existing.get(vlan) != names[vlan])
+    unnamed = wanted - set(names) - set(existing)
+
+    commands = "".join(f"vlan {line}\n" for line in compress_vlans(unnamed))
+    commands += "".join(f"vlan {vlan}\nname {names[vlan]}\n" for vlan in named)
+    return commands + "exit\n" if commands else ""
+
+
+def trunk_vlan_commands(interface: str, add=None, remove=None, allowed=None, replace=None) -> str:
+    """
+    Builds the commands updating the VLANs allowed on a trunk.
+
+    :param interface: The trunk interface (e.g. 'Gi0/1').
+    :param add: VLAN set to allow in addition to the current ones.
+    :param remove: VLAN set to stop allowing.
+    :param allowed: Optional VLANs currently allowed (see parse_trunk_allowed); VLANs already allowed are not
+                    added again and VLANs not allowed are not removed.
+    :param replace: VLAN set replacing the allowed list entirely; 'add' and 'remove' are then ignored.
+    :return: The command block; empty if the trunk needs no change.
+    :raises: ValueError if a VLAN ID is invalid.
+    """
+    if replace is not None:
+        wanted = parse_vlan_set(replace)
+        if allowed is not None and wanted == allowed:
+            return ""
+        lines = compress_vlans(wanted)
+        if not lines:
+            commands = f"{TRUNK_ALLOWED} none\n"
+        else:
+            commands = f"{TRUNK_ALLOWED} {lines[0]}\n"
+            commands += "".join(f"{TRUNK_ALLOWED} add {line}\n" for line in lines[1:])
+        return f"interface {interface}\n{commands}exit\n"
+
+    to_add = parse_vlan_set(add)
+    to_remove = parse_vlan_set(remove)
+    if allowed is not None:
+        to_add -= allowed
+        to_remove &= allowed
+    commands = "".join(f"{TRUNK_ALLOWED} add {line}\n" for line in compress_vlans(to_add))
+    commands += "".join(f"{TRUNK_ALLOWED} remove {line}\n" for line in compress_vlans(to_remove))
+    return f"interface {interface}\n{commands}exit\n" if commands else ""
+
+
+def run_vlan_plan(plan: dict, devices, runner=None):
+    """
+    Provisions VLANs on many switches concurrently, each in a single session.
+
+    Plan layout, keyed by switch name or IP:
+        {"Switch1": {"vlans": "10-20,30", "names": {"10": "Users"},
+                     "trunks": {"Gi0/1": {"add": "10-20,30"}}}}
+
+    :param plan: The per-switch VLAN specifications.
+    :param devices: Inventory or list of device data dictionaries.
+    :param runner: Optional FleetRunner; a default one is created if omitted.
+    :return: The FleetReport.
+    :raises: ValueError if a planned switch is not in the inventory or is not a switch; nothing is pushed then.
+    """
+    from Fleet import FleetRunner
+
+    inventory = devices if isinstance(devices, Inventory) else Inventory(devices)
+    records = {key: inventory.get_by_name(key) or inventory.get(key) for key in plan}
+    unknown = [key for key, record in records.items() if record is None]
+    if unknown:
+        raise ValueError(f"Switches not found in the inventory: {', '.join(unknown)}")
+    not_switches = [f"{record['name']} ({record['type']})" for record in records.values()
+                    if device_role(record['type']) not in ("switch", "multilayer_switch")]
+    if not_switches:
+        raise ValueError(f"VLANs can only be provisioned on switches: {', '.join(not_switches)}")
+
+    specs = {records[key]['name']: spec for key, spec in plan.items()}
+    targets = list(records.values())
+    logging.info("Provisioning VLANs on %d switches.", len(targets))
+    return (runner or FleetRunner()).run(targets, lambda device: device.provision_vlans(**specs[device.name]))